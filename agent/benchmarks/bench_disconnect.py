@@ -0,0 +1,149 @@
+"""
+Upstream work avoided when clients disconnect mid-stream.
+
+Runs the app in-process against the local Spoonacular stand-in, with the
+vision call and formatter replaced by sleeps of the same shape. Each client
+starts a fridge analysis and hangs up after --hangup seconds; the report shows
+how many upstream calls were made, and abandoned mid-flight, versus what
+full pipelines would have cost.
+
+With --check it also verifies the behaviour and exits non-zero if it is
+wrong: every pipeline that started was cancelled, every admission ticket
+was released, and no upstream call the pipeline only reaches after the
+hangup was made.
+
+    python -m benchmarks.bench_disconnect --clients 20 --hangup 0.7
+    python -m benchmarks.bench_disconnect --check
+"""
+import argparse
+import asyncio
+import os
+import sys
+import threading
+import time
+from types import SimpleNamespace
+
+STUB_PORT = 8901
+APP_PORT = 8902
+os.environ.setdefault("LOGFIRE_SEND_TO_LOGFIRE", "false")
+os.environ.setdefault("LOGFIRE_CONSOLE", "false")
+os.environ["SPOONACULAR_BASE_URL"] = f"http://127.0.0.1:{STUB_PORT}"
+# fridge jobs (opt-in) deliberately outlive their connection; this measures the connection-bound mode
+os.environ["FRIDGE_JOBS"] = "false"
+# the "photo" sent is a placeholder for the stubbed vision call, not an image
+os.environ["IMAGE_PRECHECK"] = "false"
+# every client's pipeline starts at once; queued requests that hang up never reach an upstream
+os.environ.setdefault("ADMISSION_VISION_CONCURRENCY", "1000")
+
+import uvicorn
+from httpx import AsyncClient
+
+from main import app
+from src.workflows import image_workflow
+from src.models.ingredients import ExtractedIngredients, IngredientSearchParams
+from src.services.registry import services
+from benchmarks.stub_server import running_stub
+
+UPSTREAM_LATENCY = 0.5
+# when each pipeline starts the detail lookup: after vision, the formatter and findByIngredients
+BULK_STARTS_AFTER = UPSTREAM_LATENCY * 2.2
+
+class StubGemini:
+    """ Stands in for GeminiService, blocking a worker thread like the real SDK """
+    def __init__(self):
+        self.calls = 0
+
+    def _vision(self, cancel_token):
+        if cancel_token:
+            cancel_token.raise_if_cancelled()
+        self.calls += 1
+        time.sleep(UPSTREAM_LATENCY)
+        return ExtractedIngredients(ingredients=["eggs", "whole milk", "spinach"])
+
+    async def extract_ingredients_from_image(self, image_base64, cancel_token=None, deadline=None):
+        return await asyncio.to_thread(self._vision, cancel_token)
+
+class StubFormatter:
+    async def run(self, prompt):
+        await asyncio.sleep(UPSTREAM_LATENCY / 5)
+        return SimpleNamespace(data=IngredientSearchParams(ingredients="eggs, whole milk, spinach"))
+
+async def client_session(number: int, hangup: float):
+    headers = {"X-Client-Id": f"bench-{number}"}
+    async with AsyncClient(base_url=f"http://127.0.0.1:{APP_PORT}", headers=headers, timeout=30) as client:
+        async def read():
+            async with client.stream("POST", "/api/chat", json={"image_base64": "stub"}) as response:
+                async for _ in response.aiter_lines():
+                    pass
+        try:
+            await asyncio.wait_for(read(), hangup)
+        except asyncio.TimeoutError:
+            pass
+
+async def run(clients: int, hangup: float):
+    await asyncio.gather(*(client_session(number, hangup) for number in range(clients)))
+    # let cancelled work settle before reading counters
+    await asyncio.sleep(UPSTREAM_LATENCY * 3)
+    async with AsyncClient() as client:
+        stub_stats = (await client.get(f"http://127.0.0.1:{STUB_PORT}/_stats")).json()
+        app_metrics = (await client.get(f"http://127.0.0.1:{APP_PORT}/api/metrics")).json()
+    return stub_stats, app_metrics
+
+def check(hangup: float, vision_calls: int, stub_stats: dict, app_metrics: dict) -> list:
+    """ What went wrong, if anything """
+    failures = []
+    # requests still being decoded when their client left never start a pipeline, so count the ones that did
+    cancelled = app_metrics["cancellation"].get("pipelines_cancelled", 0)
+    if not cancelled or cancelled < vision_calls:
+        failures.append(f"{cancelled} pipelines were cancelled but {vision_calls} reached the vision call")
+    for pool, stats in app_metrics["admission"].items():
+        if stats["active"] or stats["queued"]:
+            failures.append(f"admission pool {pool} still holds {stats['active']} active and {stats['queued']} queued tickets")
+    if hangup < BULK_STARTS_AFTER and stub_stats["calls"].get("informationBulk", 0):
+        failures.append(f"{stub_stats['calls']['informationBulk']} informationBulk calls were made after every client hung up")
+    return failures
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--clients", type=int, default=20)
+    parser.add_argument("--hangup", type=float, default=0.7, help="seconds before each client disconnects")
+    parser.add_argument("--check", action="store_true", help="fail unless pipelines were cancelled and tickets released")
+    args = parser.parse_args()
+
+    gemini = StubGemini()
+    services._gemini = gemini
+    image_workflow.get_formatter_agent = lambda: StubFormatter()
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=APP_PORT, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    with running_stub(STUB_PORT, latency=UPSTREAM_LATENCY):
+        thread.start()
+        while not server.started:
+            time.sleep(0.01)
+        try:
+            stub_stats, app_metrics = asyncio.run(run(args.clients, args.hangup))
+        finally:
+            server.should_exit = True
+            thread.join()
+
+    print(f"{args.clients} clients hung up after {args.hangup}s")
+    print(f"{'call':<20} {'full pipelines':>15} {'made':>6} {'abandoned':>10}")
+    print(f"{'vision':<20} {args.clients:>15} {gemini.calls:>6} {'-':>10}")
+    for name in ["findByIngredients", "informationBulk"]:
+        print(
+            f"{name:<20} {args.clients:>15} {stub_stats['calls'].get(name, 0):>6} "
+            f"{stub_stats['abandoned'].get(name, 0):>10}"
+        )
+    print("cancellation metrics:", app_metrics["cancellation"])
+    print("admission:", app_metrics["admission"])
+
+    if args.check:
+        failures = check(args.hangup, gemini.calls, stub_stats, app_metrics)
+        for failure in failures:
+            print(f"FAIL: {failure}")
+        if failures:
+            sys.exit(1)
+        print("OK: every started pipeline was cancelled and every ticket released")
+
+if __name__ == "__main__":
+    main()
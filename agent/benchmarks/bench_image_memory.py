@@ -0,0 +1,151 @@
+"""
+Peak server memory for concurrent fridge photo uploads.
+
+For each client count, starts the app in a fresh process (against the local
+Spoonacular stand-in, with the Gemini model and formatter replaced by sleeps)
+and posts that many large photos at once from this process. The server
+reports its resident memory before the uploads and its peak (VmHWM) after; a small warm-up upload runs first so
+lazily imported modules are not counted.
+Run from the agent directory:
+
+    python -m benchmarks.bench_image_memory --clients 1 4 16 --size 4000x3000
+"""
+import argparse
+import asyncio
+import base64
+import io
+import os
+import subprocess
+import sys
+import threading
+import time
+
+STUB_PORT = 8906
+APP_PORT = 8907
+UPSTREAM_LATENCY = 0.5
+
+def _memory_mb(field: str) -> float:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+def serve():
+    """ Child process: run the app until stdin closes, then report memory """
+    os.environ.setdefault("LOGFIRE_SEND_TO_LOGFIRE", "false")
+    os.environ.setdefault("LOGFIRE_CONSOLE", "false")
+    os.environ["SPOONACULAR_BASE_URL"] = f"http://127.0.0.1:{STUB_PORT}"
+    from types import SimpleNamespace
+
+    import uvicorn
+
+    from main import app
+    from src.workflows import image_workflow
+    from src.models.ingredients import IngredientSearchParams
+    from src.services.gemini import GeminiService
+    from src.services.registry import services
+    from benchmarks.stub_server import running_stub
+
+    class StubModel:
+        def generate_content(self, contents, request_options=None):
+            time.sleep(UPSTREAM_LATENCY)
+            return SimpleNamespace(text="whole milk\neggs\nspinach")
+
+    class StubFormatter:
+        async def run(self, prompt):
+            return SimpleNamespace(data=IngredientSearchParams(ingredients="eggs, whole milk, spinach"))
+
+    gemini = GeminiService.__new__(GeminiService)
+    gemini.model = StubModel()
+    services._gemini = gemini
+    image_workflow.get_formatter_agent = lambda: StubFormatter()
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=APP_PORT, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    with running_stub(STUB_PORT, latency=0.01):
+        thread.start()
+        while not server.started:
+            time.sleep(0.01)
+        print("ready", flush=True)
+        # after a warm-up upload, so lazily imported modules are not counted
+        sys.stdin.readline()
+        print(f"baseline {_memory_mb('VmRSS'):.1f}", flush=True)
+        sys.stdin.readline()
+        print(f"peak {_memory_mb('VmHWM'):.1f}", flush=True)
+        server.should_exit = True
+        thread.join()
+
+def make_photo(width: int, height: int) -> str:
+    """ A noisy JPEG, which compresses about as badly as a real phone photo """
+    import numpy as np
+    from PIL import Image
+
+    pixels = np.random.default_rng(0).integers(0, 255, (height, width, 3), dtype=np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format="JPEG", quality=90)
+    return "data:image/jpeg;base64," + base64.b64encode(buffer.getvalue()).decode()
+
+async def upload(clients: int, photo: str):
+    from httpx import AsyncClient
+
+    async with AsyncClient(base_url=f"http://127.0.0.1:{APP_PORT}", timeout=120) as client:
+        async def one():
+            async with client.stream("POST", "/api/chat", json={"image_base64": photo}) as response:
+                last = None
+                async for line in response.aiter_lines():
+                    last = line
+                return response.status_code, last
+
+        return await asyncio.gather(*(one() for _ in range(clients)))
+
+def run(clients: int, photo: str):
+    server = subprocess.Popen(
+        [sys.executable, "-W", "ignore", "-m", "benchmarks.bench_image_memory", "--serve"],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        text=True,
+        env={**os.environ, "ADMISSION_VISION_CONCURRENCY": str(clients), "ADMISSION_MAX_QUEUE_PER_CLIENT": str(clients)},
+    )
+    def report() -> float:
+        server.stdin.write("\n")
+        server.stdin.flush()
+        return float(server.stdout.readline().split()[1])
+
+    try:
+        server.stdout.readline()
+        asyncio.run(upload(1, make_photo(64, 48)))
+        baseline = report()
+        started = time.perf_counter()
+        results = asyncio.run(upload(clients, photo))
+        elapsed = time.perf_counter() - started
+        peak = report()
+    finally:
+        server.stdin.close()
+        server.wait(timeout=60)
+    completed = sum(1 for status, last in results if status == 200 and last and '"complete"' in last)
+    return baseline, peak, completed, elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--size", default="4000x3000", help="photo resolution, WIDTHxHEIGHT")
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.serve:
+        serve()
+        return
+
+    width, height = (int(side) for side in args.size.split("x"))
+    photo = make_photo(width, height)
+    print(f"photo: {width}x{height}, {len(photo) / 2 ** 20:.1f} MB as base64")
+    print(f"{'clients':>8} {'base MB':>9} {'peak MB':>9} {'MB/upload':>10} {'completed':>10} {'seconds':>8}")
+    for clients in args.clients:
+        baseline, peak, completed, elapsed = run(clients, photo)
+        print(
+            f"{clients:>8} {baseline:>9.0f} {peak:>9.0f} {(peak - baseline) / clients:>10.1f} "
+            f"{completed:>10} {elapsed:>8.1f}"
+        )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+Latency and bytes saved by the recipe image proxy.
+
+Writes --recipes synthetic 636x393 JPEGs laid out like Spoonacular's image CDN
+into a temporary directory, serves them with http.server as the upstream
+(IMAGE_UPSTREAM_BASE_URL), and runs the app in process with an empty image
+cache. It then requests every recipe's card image twice (cold: fetch, resize
+and write; warm: served from disk), revalidates one with If-None-Match, fires
+--concurrent requests at one uncached recipe to check they share a single
+upstream fetch, and compares bytes served against the originals. Run from the
+agent directory:
+
+    python -m benchmarks.bench_image_proxy --recipes 100
+"""
+import argparse
+import asyncio
+import functools
+import io
+import os
+import statistics
+import tempfile
+import threading
+import time
+from collections import Counter
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+os.environ.setdefault("LOGFIRE_SEND_TO_LOGFIRE", "false")
+os.environ.setdefault("LOGFIRE_CONSOLE", "false")
+
+import numpy as np
+import uvicorn
+from httpx import AsyncClient
+from PIL import Image
+
+UPSTREAM_PORT = 8910
+APP_PORT = 8911
+
+upstream_calls = Counter()
+
+class CountingHandler(SimpleHTTPRequestHandler):
+    def do_GET(self):
+        upstream_calls[self.path] += 1
+        super().do_GET()
+
+    def log_message(self, format, *args):
+        pass
+
+def make_photo(seed: int) -> bytes:
+    """ A smooth gradient with grain, which compresses about like a food photo """
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:393, 0:636].astype(np.float32)
+    base = rng.uniform(40, 200, 3)
+    slope = rng.uniform(-0.2, 0.2, (2, 3))
+    pixels = base + x[..., None] * slope[0] + y[..., None] * slope[1] + rng.normal(0, 12, (393, 636, 3))
+    buffer = io.BytesIO()
+    Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8)).save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+def write_upstream(directory: str, ids) -> int:
+    os.makedirs(os.path.join(directory, "recipes"))
+    total = 0
+    for recipe_id in ids:
+        data = make_photo(recipe_id)
+        with open(os.path.join(directory, "recipes", f"{recipe_id}-636x393.jpg"), "wb") as f:
+            f.write(data)
+        total += len(data)
+    return total
+
+async def fetch_all(ids, size: str):
+    timings, served = [], 0
+    async with AsyncClient(base_url=f"http://127.0.0.1:{APP_PORT}") as client:
+        for recipe_id in ids:
+            started = time.perf_counter()
+            response = await client.get(f"/api/images/{recipe_id}", params={"size": size})
+            response.raise_for_status()
+            timings.append(time.perf_counter() - started)
+            served += len(response.content)
+    return timings, served
+
+async def revalidate(recipe_id: int) -> int:
+    async with AsyncClient(base_url=f"http://127.0.0.1:{APP_PORT}") as client:
+        response = await client.get(f"/api/images/{recipe_id}")
+        again = await client.get(f"/api/images/{recipe_id}", headers={"If-None-Match": response.headers["etag"]})
+        print(f"cache-control: {response.headers['cache-control']}")
+        return again.status_code
+
+async def stampede(recipe_id: int, concurrent: int):
+    async with AsyncClient(base_url=f"http://127.0.0.1:{APP_PORT}") as client:
+        started = time.perf_counter()
+        responses = await asyncio.gather(*[
+            client.get(f"/api/images/{recipe_id}", params={"size": "detail"}) for _ in range(concurrent)
+        ])
+        return [response.status_code for response in responses], time.perf_counter() - started
+
+def summarize(name: str, timings, served: int, count: int):
+    timings = sorted(timings)
+    print(
+        f"{name:<12} {statistics.median(timings) * 1000:>8.2f} {timings[int(len(timings) * 0.95)] * 1000:>8.2f} "
+        f"{served / count / 1024:>10.1f}"
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--recipes", type=int, default=100)
+    parser.add_argument("--concurrent", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as upstream_dir, tempfile.TemporaryDirectory() as cache_dir:
+        ids = list(range(1000, 1000 + args.recipes))
+        original = write_upstream(upstream_dir, ids + [999])
+        os.environ["IMAGE_UPSTREAM_BASE_URL"] = f"http://127.0.0.1:{UPSTREAM_PORT}"
+        os.environ["IMAGE_CACHE_DIR"] = cache_dir
+
+        from main import app
+        from src.services.image_proxy import image_cache
+
+        upstream = ThreadingHTTPServer(
+            ("127.0.0.1", UPSTREAM_PORT), functools.partial(CountingHandler, directory=upstream_dir)
+        )
+        threading.Thread(target=upstream.serve_forever, daemon=True).start()
+        server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=APP_PORT, log_level="warning"))
+        thread = threading.Thread(target=server.run, daemon=True)
+        thread.start()
+        while not server.started:
+            time.sleep(0.01)
+        try:
+            print(f"{'pass':<12} {'p50 ms':>8} {'p95 ms':>8} {'KiB/image':>10}")
+            print(f"{'upstream':<12} {'':>8} {'':>8} {original / (len(ids) + 1) / 1024:>10.1f}")
+            summarize("card cold", *asyncio.run(fetch_all(ids, "card")), len(ids))
+            summarize("card warm", *asyncio.run(fetch_all(ids, "card")), len(ids))
+            summarize("detail warm", *asyncio.run(fetch_all(ids, "detail")), len(ids))
+            print(f"upstream fetches for {len(ids)} recipes x 3 passes: {sum(upstream_calls.values())}")
+
+            print(f"revalidation with If-None-Match: {asyncio.run(revalidate(ids[0]))}")
+            statuses, elapsed = asyncio.run(stampede(999, args.concurrent))
+            print(
+                f"{args.concurrent} concurrent requests for one uncached recipe: {Counter(statuses)} in "
+                f"{elapsed * 1000:.0f} ms, {upstream_calls['/recipes/999-636x393.jpg']} upstream fetch(es)"
+            )
+            print(f"cache: {image_cache.stats()}")
+        finally:
+            server.should_exit = True
+            thread.join()
+            upstream.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+Accuracy and cost of the local nutrition estimator against Spoonacular's numbers.
+
+Takes recipes that carry Spoonacular's per-serving nutrition, from a snapshot
+built by warm_cache.py with NUTRITION_SOURCE=spoonacular or fetched live by
+id, estimates the same macros from their ingredient lists, and reports the
+error per macro, ingredient coverage, the most common ingredients the table
+could not weigh, and the time taken by the batched estimate. Run from the
+agent directory:
+
+    python -m benchmarks.bench_nutrition --snapshot recipe_snapshot.json.gz
+    python -m benchmarks.bench_nutrition --ids 715538,716429,642583
+
+Without either, the benchmark fixtures are used: their nutrition is random,
+so only the coverage and timing figures mean anything. Run it on real
+recipes before switching to NUTRITION_SOURCE=local.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+from collections import Counter
+from typing import List
+
+os.environ.setdefault("LOGFIRE_SEND_TO_LOGFIRE", "false")
+os.environ.setdefault("LOGFIRE_CONSOLE", "false")
+
+import logfire
+import numpy as np
+
+from src.config import config
+from src.models.recipe import RecipeDetails
+from src.services.nutrition import MACROS, estimate_nutrition, unmatched_ingredients
+from src.services.snapshot import RecipeSnapshot
+
+def from_snapshot(path: str) -> List[RecipeDetails]:
+    snapshot = RecipeSnapshot()
+    snapshot.load(path)
+    return list(snapshot.recipes.values())
+
+async def from_api(ids: List[int]) -> List[RecipeDetails]:
+    from src.services.spoonacular import SpoonacularService
+
+    config.NUTRITION_SOURCE = "spoonacular"
+    service = SpoonacularService(config.SPOONACULAR_API_KEY)
+    try:
+        recipes = []
+        for i in range(0, len(ids), config.BULK_MAX_IDS):
+            recipes += await service.get_recipe_details_bulk(ids[i:i + config.BULK_MAX_IDS])
+        return recipes
+    finally:
+        await service.aclose()
+
+def from_fixtures(count: int) -> List[RecipeDetails]:
+    from benchmarks import fixtures
+
+    recipes = []
+    for recipe_id in range(1000, 1000 + count):
+        data = fixtures.recipe_information(recipe_id)
+        data["ingredients"] = data.pop("extendedIngredients")
+        data["servings"] = 4
+        recipes.append(RecipeDetails(**data))
+    return recipes
+
+def report(recipes: List[RecipeDetails], min_coverage: float, repeat: int):
+    recipes = [recipe for recipe in recipes if recipe.nutrition.calories is not None and recipe.ingredients]
+    if not recipes:
+        raise SystemExit("No recipes with Spoonacular nutrition and ingredients to compare against")
+
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        estimates = estimate_nutrition(recipes)
+        timings.append(time.perf_counter() - started)
+    coverage = estimates[:, -1]
+    covered = coverage >= min_coverage
+    reference = np.array([[getattr(recipe.nutrition, macro) or 0.0 for macro in MACROS] for recipe in recipes])
+
+    print(f"{len(recipes)} recipes, {sum(len(recipe.ingredients) for recipe in recipes)} ingredients")
+    print(
+        f"coverage: median {np.median(coverage):.0%}, "
+        f"{covered.mean():.0%} of recipes at or above {min_coverage:.0%} (compared below)"
+    )
+    print(
+        f"estimate time: {statistics.median(timings) * 1000:.2f} ms per batch, "
+        f"{statistics.median(timings) / len(recipes) * 1e6:.1f} us per recipe (median of {repeat}, name cache warm)"
+    )
+    if not covered.any():
+        return
+    print(f"\n{'macro':<14} {'MAE':>8} {'median err':>11} {'within 20%':>11} {'bias':>8}")
+    for i, macro in enumerate(MACROS):
+        actual, estimated = reference[covered, i], estimates[covered, i]
+        relative = np.abs(estimated - actual) / np.maximum(actual, 1.0)
+        bias = (estimated.sum() - actual.sum()) / max(actual.sum(), 1.0)
+        print(
+            f"{macro:<14} {np.abs(estimated - actual).mean():>8.1f} {np.median(relative):>11.0%} "
+            f"{(relative <= 0.2).mean():>11.0%} {bias:>+8.0%}"
+        )
+
+    missing = Counter(name.lower() for name, _ in unmatched_ingredients(recipes))
+    if missing:
+        print("\nmost common ingredients the table could not weigh:")
+        for name, count in missing.most_common(15):
+            print(f"{count:>6}  {name}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--snapshot", help="Recipe snapshot built with NUTRITION_SOURCE=spoonacular")
+    parser.add_argument("--ids", help="Comma-separated recipe ids to fetch with includeNutrition")
+    parser.add_argument("--fixtures", type=int, default=500, help="Fixture recipes to use without --snapshot or --ids")
+    parser.add_argument(
+        "--min-coverage", type=float, default=config.NUTRITION_MIN_COVERAGE,
+        help="Share of a recipe's ingredients that must be weighed to compare it"
+    )
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    logfire.configure(send_to_logfire=False, console=False)
+    if args.snapshot:
+        recipes = from_snapshot(args.snapshot)
+    elif args.ids:
+        recipes = asyncio.run(from_api([int(recipe_id) for recipe_id in args.ids.split(",") if recipe_id.strip()]))
+    else:
+        print("using benchmark fixtures: their nutrition is random, so ignore the error figures\n")
+        recipes = from_fixtures(args.fixtures)
+    report(recipes, args.min_coverage, args.repeat)
+
+if __name__ == "__main__":
+    main()
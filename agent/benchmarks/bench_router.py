@@ -0,0 +1,113 @@
+"""
+Latency of a recipe query with the two-call router versus the combined one.
+
+Runs Orchestrator.run for text recipe queries against the local Spoonacular
+stand-in. The Gemini classifier, query extractor and combined router are
+replaced by sleeps of --llm-latency seconds each, so the difference between
+modes is the LLM round trips saved. Run from the agent directory:
+
+    python -m benchmarks.bench_router --queries 50 --llm-latency 0.6
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+from types import SimpleNamespace
+
+STUB_PORT = 8904
+os.environ.setdefault("LOGFIRE_SEND_TO_LOGFIRE", "false")
+os.environ.setdefault("LOGFIRE_CONSOLE", "false")
+os.environ["SPOONACULAR_BASE_URL"] = f"http://127.0.0.1:{STUB_PORT}"
+
+import logfire
+
+from src.config import config
+from src.agents import orchestrator as orchestrator_module
+from src.agents import query_extractor
+from src.agents.orchestrator import Orchestrator
+from src.agents.router_agent import RoutedQuery
+from src.models.recipe import RecipeSearchParams
+from src.services.registry import services
+from benchmarks.stub_server import running_stub
+
+class LLMCalls:
+    """ Sleeps like a Gemini round trip and counts them """
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.calls = 0
+
+    async def round_trip(self):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+
+class StubGemini:
+    def __init__(self, llm: LLMCalls):
+        self.llm = llm
+
+    async def answer_question(self, question, cancel_token=None, deadline=None):
+        await self.llm.round_trip()
+        return "recipe_search"
+
+class StubAgent:
+    def __init__(self, llm: LLMCalls, build):
+        self.llm = llm
+        self.build = build
+
+    async def run(self, prompt):
+        await self.llm.round_trip()
+        return SimpleNamespace(data=self.build(prompt))
+
+def search_params(query: str) -> RecipeSearchParams:
+    return RecipeSearchParams(query=query, maxReadyTime=30)
+
+async def run_mode(queries: int, concurrency: int):
+    orchestrator = Orchestrator()
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(i: int):
+        async with semaphore:
+            started = time.perf_counter()
+            events = await orchestrator.run(user_query=f"pasta number {i} under 30 minutes")
+            result = [event async for event in events][-1]
+            assert result["type"] == "complete", result
+            latencies.append(time.perf_counter() - started)
+
+    await asyncio.gather(*(one(i) for i in range(queries)))
+    await services.aclose()
+    return latencies
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--llm-latency", type=float, default=0.6)
+    parser.add_argument("--latency", type=float, default=0.05, help="Spoonacular stand-in latency")
+    args = parser.parse_args()
+
+    logfire.configure(send_to_logfire=False, console=False)
+    # every query is distinct anyway; keep the cache from skewing either mode
+    config.SEMANTIC_CACHE_ENABLED = False
+
+    llm = LLMCalls(args.llm_latency)
+    orchestrator_module.get_router_agent = lambda: StubAgent(
+        llm, lambda q: RoutedQuery(intent="recipe_search", search_params=search_params(q))
+    )
+    query_extractor.get_query_extractor = lambda: StubAgent(llm, search_params)
+
+    print(f"{'router':<10} {'p50 ms':>8} {'p95 ms':>8} {'LLM calls/query':>16}")
+    with running_stub(STUB_PORT, latency=args.latency):
+        for mode in ("classify", "combined"):
+            config.INTENT_ROUTER = mode
+            llm.calls = 0
+            services._gemini = StubGemini(llm)
+            latencies = sorted(asyncio.run(run_mode(args.queries, args.concurrency)))
+            p95 = latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))]
+            print(
+                f"{mode:<10} {statistics.median(latencies) * 1000:>8.0f} {p95 * 1000:>8.0f} "
+                f"{llm.calls / args.queries:>16.1f}"
+            )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Calibration of the semantic query cache against labelled query pairs.
+
+Each pair is either two phrasings of the same search, which should share a
+cache entry, or two different searches, which must not. For every pair the
+report shows the cosine similarity of the two embeddings and whether their
+numbers and negations agree, then sweeps the threshold and shows how many
+paraphrases hit and how many different searches would wrongly hit. Run from
+the agent directory:
+
+    python -m benchmarks.bench_semantic_cache
+    python -m benchmarks.bench_semantic_cache --check
+
+With --check it exits non-zero if, at SEMANTIC_CACHE_THRESHOLD, any
+different search would hit or fewer than --min-recall of the paraphrases do.
+"""
+import argparse
+import os
+import sys
+
+os.environ.setdefault("LOGFIRE_SEND_TO_LOGFIRE", "false")
+os.environ.setdefault("LOGFIRE_CONSOLE", "false")
+
+import numpy as np
+
+from src.config import config
+from src.services.semantic_cache import HashingEmbedder, prepare
+
+PARAPHRASES = [
+    ("Gluten-free pasta in under 30 min", "quick gluten free pasta, 30 minutes max"),
+    ("apple pie", "apple pies"),
+    ("cheap dinner", "cheap dinners"),
+    ("easy chicken curry", "quick chicken curry"),
+    ("vegan tacos", "Vegan taco recipes"),
+    ("chocolate chip cookies", "chocolate chip cookie recipe"),
+    ("dairy-free smoothie", "smoothie without dairy"),
+    ("pasta with no garlic", "pasta without garlic"),
+    ("beef stew under 2 hours", "beef stew in under 2 hrs"),
+    ("healthy breakfast ideas", "healthy breakfast idea"),
+    ("spicy thai noodles", "Spicy Thai noodle recipes please"),
+    ("quick salmon dinner under 20 minutes", "salmon dinner in 20 min, fast"),
+    ("show me pancake recipes", "pancakes"),
+    ("mushroom risotto", "risotto with mushrooms"),
+    ("low carb lunch", "low-carb lunches"),
+    ("gluten free brownies", "brownies, gluten-free"),
+    ("easy weeknight dinners", "quick weeknight dinner"),
+    ("berry smoothies", "berry smoothie"),
+    ("chicken and rice", "chicken rice recipes"),
+    ("pasta without nuts or dairy", "nut and dairy free pasta"),
+    ("vegetarian lasagna in under an hour", "vegetarian lasagna within 1 hour"),
+]
+
+DIFFERENT_SEARCHES = [
+    ("garlic without chicken", "chicken without garlic"),
+    ("pasta with chicken", "pasta without chicken"),
+    ("pasta under 30 minutes", "pasta under 15 minutes"),
+    ("apple pie", "pumpkin pie"),
+    ("chicken curry", "chicken soup"),
+    ("vegan tacos", "fish tacos"),
+    ("beef stew", "beef tacos"),
+    ("chocolate cake", "carrot cake"),
+    ("no nuts, with chicken", "no nuts and no chicken"),
+    ("pasta without garlic or onions", "pasta without garlic"),
+    ("spicy thai noodles", "thai green curry"),
+    ("cheap dinner", "cheap lunch"),
+    ("salmon dinner", "tuna dinner"),
+    ("gluten free bread", "bread"),
+    ("chicken salad", "chicken sandwich"),
+    ("mushroom risotto", "mushroom soup"),
+    ("chicken thighs", "chicken wings"),
+    ("beef tacos", "beef burritos"),
+    ("vegetarian lasagna", "vegetable lasagna"),
+    ("chicken pasta bake", "chicken pasta salad"),
+    ("lemon chicken", "lemon cake"),
+    ("sweet potato fries", "potato fries"),
+    ("quick breakfast", "quick brunch"),
+]
+
+def score(embedder: HashingEmbedder, first: str, second: str):
+    """ Cosine similarity of two queries and whether their guards agree, as the cache compares them """
+    (first_text, first_guard), (second_text, second_guard) = prepare(first), prepare(second)
+    return float(embedder.embed(first_text) @ embedder.embed(second_text)), first_guard == second_guard
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--threshold", type=float, default=config.SEMANTIC_CACHE_THRESHOLD)
+    parser.add_argument("--min-recall", type=float, default=0.9, help="share of paraphrases that must hit with --check")
+    parser.add_argument("--check", action="store_true", help="fail unless the threshold separates the pairs")
+    args = parser.parse_args()
+
+    embedder = HashingEmbedder(config.SEMANTIC_CACHE_DIM)
+    rows = [
+        (label, *score(embedder, first, second), first, second)
+        for label, pairs in (("same", PARAPHRASES), ("different", DIFFERENT_SEARCHES))
+        for first, second in pairs
+    ]
+    print(f"{'pair':<10} {'cosine':>7} {'guard':>6}  queries")
+    for label, cosine, guarded, first, second in rows:
+        print(f"{label:<10} {cosine:>7.3f} {'ok' if guarded else 'differ':>6}  {first!r} / {second!r}")
+
+    def outcome(threshold: float):
+        hits = [label for label, cosine, guarded, _, _ in rows if guarded and cosine >= threshold]
+        return hits.count("same") / len(PARAPHRASES), hits.count("different")
+
+    print(f"\n{'threshold':>9} {'paraphrases hit':>16} {'wrong hits':>11}")
+    for threshold in sorted({*np.round(np.arange(0.6, 1.0, 0.05), 2), args.threshold}):
+        recall, wrong = outcome(threshold)
+        marker = "  <- configured" if threshold == args.threshold else ""
+        print(f"{threshold:>9.2f} {recall:>16.0%} {wrong:>11}{marker}")
+
+    if args.check:
+        recall, wrong = outcome(args.threshold)
+        failures = []
+        if wrong:
+            failures.append(f"{wrong} different searches hit at threshold {args.threshold}")
+        if recall < args.min_recall:
+            failures.append(f"only {recall:.0%} of paraphrases hit at threshold {args.threshold}")
+        for failure in failures:
+            print(f"FAIL: {failure}")
+        if failures:
+            sys.exit(1)
+        print(f"OK: threshold {args.threshold} separates the labelled pairs")
+
+if __name__ == "__main__":
+    main()
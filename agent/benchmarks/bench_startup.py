@@ -0,0 +1,73 @@
+"""
+Cold-start cost of a worker: import time of `main` and time until the first
+request is answered, with and without WARM_UP. Run from the agent directory:
+
+    python -m benchmarks.bench_startup --runs 5
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from httpx import Client
+
+IMPORT_SNIPPET = (
+    "import time; started = time.perf_counter(); import main; "
+    "print(time.perf_counter() - started)"
+)
+
+def _env(**overrides):
+    return {
+        **os.environ,
+        "LOGFIRE_SEND_TO_LOGFIRE": "false",
+        "PYTHONWARNINGS": "ignore",
+        **overrides,
+    }
+
+def measure_import() -> float:
+    output = subprocess.check_output([sys.executable, "-c", IMPORT_SNIPPET], env=_env())
+    return float(output.decode().strip().splitlines()[-1])
+
+def measure_first_ready(port: int, warm_up: bool) -> float:
+    url = f"http://127.0.0.1:{port}/api/chat"
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port)],
+        env=_env(WARM_UP=str(warm_up).lower()),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        with Client() as client:
+            while True:
+                try:
+                    client.post(url, json={}).raise_for_status()
+                    return time.perf_counter() - started
+                except Exception:
+                    if server.poll() is not None:
+                        raise RuntimeError("Server exited before becoming ready")
+                    time.sleep(0.01)
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--port", type=int, default=8766)
+    args = parser.parse_args()
+
+    rows = [
+        ("import main", lambda: measure_import()),
+        ("first ready", lambda: measure_first_ready(args.port, warm_up=False)),
+        ("first ready (WARM_UP)", lambda: measure_first_ready(args.port, warm_up=True)),
+    ]
+    print(f"{'measurement':<24} {'median s':>10} {'min s':>10}")
+    for name, measure in rows:
+        samples = [measure() for _ in range(args.runs)]
+        print(f"{name:<24} {statistics.median(samples):>10.3f} {min(samples):>10.3f}")
+
+if __name__ == "__main__":
+    main()
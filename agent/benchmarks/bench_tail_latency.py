@@ -0,0 +1,91 @@
+"""
+Tail latency of Spoonacular calls under upstream jitter and failures.
+
+Drives SpoonacularService.search_by_ingredients against the local stand-in,
+where a share of calls is slow and a share fails with 503, comparing the
+plain client (no retries, no hedging) with retries and with retries plus
+hedging. Run from the agent directory:
+
+    python -m benchmarks.bench_tail_latency --calls 400 --slow-rate 0.05 --error-rate 0.02
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+STUB_PORT = 8903
+os.environ.setdefault("LOGFIRE_SEND_TO_LOGFIRE", "false")
+os.environ.setdefault("LOGFIRE_CONSOLE", "false")
+os.environ["SPOONACULAR_BASE_URL"] = f"http://127.0.0.1:{STUB_PORT}"
+
+import logfire
+
+from src.config import config
+from src.services import resilience
+from src.services.resilience import Deadline
+from src.services.spoonacular import SpoonacularService
+from benchmarks.stub_server import running_stub
+
+MODES = {
+    "no retries": {"RETRY_ATTEMPTS": 0, "HEDGE_REQUESTS": False},
+    "retries": {"RETRY_ATTEMPTS": 2, "HEDGE_REQUESTS": False},
+    "retries + hedging": {"RETRY_ATTEMPTS": 2, "HEDGE_REQUESTS": True},
+}
+
+async def run_mode(calls: int, concurrency: int):
+    service = SpoonacularService("bench")
+    # every call uses distinct parameters so the stale-response fallback never hides a failure
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, failures = [], 0
+
+    async def one(i: int):
+        nonlocal failures
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                await service.search_by_ingredients(f"eggs, milk, item{i}", deadline=Deadline(config.REQUEST_DEADLINE))
+                latencies.append(time.perf_counter() - started)
+            except Exception:
+                failures += 1
+
+    await asyncio.gather(*(one(i) for i in range(calls)))
+    return latencies, failures
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--calls", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--slow-rate", type=float, default=0.05)
+    parser.add_argument("--slow-latency", type=float, default=1.0)
+    parser.add_argument("--error-rate", type=float, default=0.02)
+    args = parser.parse_args()
+
+    logfire.configure(send_to_logfire=False, console=False)
+    # keep the breaker out of the way; this measures retries and hedging
+    config.BREAKER_FAILURE_THRESHOLD = 10 ** 6
+
+    print(f"{'mode':<20} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'failed':>7}")
+    with running_stub(
+        STUB_PORT,
+        latency=args.latency,
+        slow_rate=args.slow_rate,
+        slow_latency=args.slow_latency,
+        error_rate=args.error_rate
+    ):
+        for mode, settings in MODES.items():
+            for name, value in settings.items():
+                setattr(config, name, value)
+            resilience._breakers.clear()
+            resilience._latencies.clear()
+            latencies, failures = asyncio.run(run_mode(args.calls, args.concurrency))
+            latencies.sort()
+            pick = lambda q: latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000
+            print(
+                f"{mode:<20} {statistics.median(latencies) * 1000:>8.0f} {pick(0.95):>8.0f} "
+                f"{pick(0.99):>8.0f} {failures:>7}"
+            )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Throughput of the production server across worker counts.
+
+Starts `serve_production` on benchmarks.bench_app for each worker count and
+drives /api/chat with concurrent clients, reading every NDJSON stream to the
+end. Run from the agent directory:
+
+    python -m benchmarks.bench_workers --workers 1 2 4 --concurrency 64 --duration 10
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from httpx import AsyncClient, Limits
+
+async def _wait_ready(url: str, timeout: float = 30.0):
+    deadline = time.perf_counter() + timeout
+    async with AsyncClient() as client:
+        while time.perf_counter() < deadline:
+            try:
+                await client.post(url, json={})
+                return
+            except Exception:
+                await asyncio.sleep(0.2)
+    raise RuntimeError(f"Server at {url} did not become ready")
+
+async def _drive(url: str, concurrency: int, duration: float):
+    latencies = []
+    stop_at = time.perf_counter() + duration
+    limits = Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with AsyncClient(limits=limits, timeout=30) as client:
+        async def worker():
+            while time.perf_counter() < stop_at:
+                started = time.perf_counter()
+                async with client.stream("POST", url, json={"image_base64": "stub"}) as response:
+                    async for _ in response.aiter_lines():
+                        pass
+                latencies.append(time.perf_counter() - started)
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies
+
+def run(workers: int, concurrency: int, duration: float, port: int):
+    env = {
+        **os.environ,
+        "ENV": "production",
+        "WORKERS": str(workers),
+        "PORT": str(port),
+        "HOST": "127.0.0.1",
+        "LOGFIRE_SEND_TO_LOGFIRE": "false",
+        "GEMINI_API_KEY": os.environ.get("GEMINI_API_KEY", "bench"),
+    }
+    server = subprocess.Popen(
+        [sys.executable, "-c", "from main import serve_production; serve_production('benchmarks.bench_app:app')"],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    url = f"http://127.0.0.1:{port}/api/chat"
+    try:
+        asyncio.run(_wait_ready(url))
+        latencies = asyncio.run(_drive(url, concurrency, duration))
+    finally:
+        server.terminate()
+        server.wait(timeout=60)
+
+    latencies.sort()
+    return {
+        "workers": workers,
+        "rps": len(latencies) / duration,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": latencies[int(len(latencies) * 0.99) - 1] * 1000,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    print(f"{'workers':>8} {'req/s':>10} {'p50 ms':>10} {'p99 ms':>10} {'scaling':>8}")
+    baseline = None
+    for workers in args.workers:
+        result = run(workers, args.concurrency, args.duration, args.port)
+        baseline = baseline or result["rps"]
+        print(
+            f"{result['workers']:>8} {result['rps']:>10.1f} {result['p50_ms']:>10.1f} "
+            f"{result['p99_ms']:>10.1f} {result['rps'] / baseline:>7.2f}x"
+        )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Per-message overhead of the chat WebSocket against POST /api/chat.
+
+Serves benchmarks.bench_app (canned pipeline, 20 ms upstream stand-in) in
+process and sends --messages chat messages one after another from a single
+interactive client, measuring time to the first event and to the final one:
+
+  http-cold  new connection and CORS preflight per message
+  http-warm  one keep-alive connection, preflight cached by the browser
+  websocket  one connection, requests tagged with ids
+
+A final pass runs --concurrent requests multiplexed on one socket and cancels
+one of them. Run from the agent directory:
+
+    python -m benchmarks.bench_ws --messages 200
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import threading
+import time
+
+os.environ.setdefault("LOGFIRE_SEND_TO_LOGFIRE", "false")
+os.environ.setdefault("LOGFIRE_CONSOLE", "false")
+
+import uvicorn
+import websockets
+from httpx import AsyncClient
+
+from benchmarks.bench_app import app
+from src.config import config
+
+PORT = 8908
+ORIGIN = "http://localhost:3000"
+MESSAGE = {"image_base64": "stub"}
+
+async def http_message(client: AsyncClient, preflight: bool):
+    started = time.perf_counter()
+    if preflight:
+        await client.options("/api/chat", headers={
+            "Origin": ORIGIN,
+            "Access-Control-Request-Method": "POST",
+            "Access-Control-Request-Headers": "content-type",
+        })
+    first = None
+    async with client.stream("POST", "/api/chat", json=MESSAGE, headers={"Origin": ORIGIN}) as response:
+        async for line in response.aiter_lines():
+            if line and first is None:
+                first = time.perf_counter() - started
+    return first, time.perf_counter() - started
+
+async def run_http(messages: int, cold: bool):
+    base_url = f"http://127.0.0.1:{PORT}"
+    results = []
+    if cold:
+        for _ in range(messages):
+            async with AsyncClient(base_url=base_url) as client:
+                results.append(await http_message(client, preflight=True))
+    else:
+        async with AsyncClient(base_url=base_url) as client:
+            for _ in range(messages):
+                results.append(await http_message(client, preflight=False))
+    return results
+
+async def run_websocket(messages: int):
+    results = []
+    async with websockets.connect(f"ws://127.0.0.1:{PORT}/api/chat/ws", max_size=None) as socket:
+        for i in range(messages):
+            started = time.perf_counter()
+            await socket.send(json.dumps({"type": "chat", "id": str(i), **MESSAGE}))
+            first = None
+            while True:
+                event = json.loads(await socket.recv())
+                if first is None:
+                    first = time.perf_counter() - started
+                if event["type"] in ("complete", "error"):
+                    break
+            results.append((first, time.perf_counter() - started))
+    return results
+
+async def run_multiplexed(concurrent: int):
+    """ Several requests on one socket, the last one cancelled right away """
+    finals = {}
+    async with websockets.connect(f"ws://127.0.0.1:{PORT}/api/chat/ws", max_size=None) as socket:
+        started = time.perf_counter()
+        for i in range(concurrent):
+            await socket.send(json.dumps({"type": "chat", "id": f"r{i}", **MESSAGE}))
+        await socket.send(json.dumps({"type": "cancel", "id": f"r{concurrent - 1}"}))
+        while len(finals) < concurrent:
+            event = json.loads(await socket.recv())
+            if event["type"] in ("complete", "error", "cancelled"):
+                finals[event["id"]] = event["type"]
+        return finals, time.perf_counter() - started
+
+def summarize(name: str, results):
+    firsts = sorted(first for first, _ in results)
+    totals = sorted(total for _, total in results)
+    print(
+        f"{name:<10} {statistics.median(firsts) * 1000:>12.2f} {firsts[int(len(firsts) * 0.95)] * 1000:>12.2f} "
+        f"{statistics.median(totals) * 1000:>12.2f}"
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--concurrent", type=int, default=4)
+    args = parser.parse_args()
+
+    config.WS_MAX_IN_FLIGHT = max(config.WS_MAX_IN_FLIGHT, args.concurrent)
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=PORT, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    try:
+        # warm every path once so first-use imports are not measured
+        asyncio.run(run_http(2, cold=True))
+        asyncio.run(run_websocket(2))
+        print(f"{'transport':<10} {'first p50 ms':>12} {'first p95 ms':>12} {'total p50 ms':>12}")
+        summarize("http-cold", asyncio.run(run_http(args.messages, cold=True)))
+        summarize("http-warm", asyncio.run(run_http(args.messages, cold=False)))
+        summarize("websocket", asyncio.run(run_websocket(args.messages)))
+        finals, elapsed = asyncio.run(run_multiplexed(args.concurrent))
+        print(f"\n{args.concurrent} multiplexed requests in {elapsed * 1000:.0f} ms: {dict(sorted(finals.items()))}")
+    finally:
+        server.should_exit = True
+        thread.join()
+
+if __name__ == "__main__":
+    main()
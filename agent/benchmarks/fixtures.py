@@ -0,0 +1,90 @@
+"""
+Deterministic Spoonacular-shaped payloads shared by the benchmarks.
+"""
+import random
+from typing import Dict, List
+
+INGREDIENTS = [
+    "chicken breast", "eggs", "whole milk", "cheddar cheese", "spinach",
+    "red bell pepper", "onion", "garlic", "tomato", "pasta", "rice",
+    "butter", "olive oil", "carrot", "broccoli", "lemon", "yogurt",
+    "ground beef", "potato", "mushroom", "flour", "basil", "bacon",
+]
+
+def recipe_information(recipe_id: int) -> Dict:
+    """ A recipe as returned by /recipes/informationBulk with includeNutrition """
+    rng = random.Random(recipe_id)
+    ingredients = rng.sample(INGREDIENTS, rng.randint(5, 12))
+    return {
+        "id": recipe_id,
+        "title": f"Recipe {recipe_id} with {ingredients[0]}",
+        "image": f"https://img.spoonacular.com/recipes/{recipe_id}-556x370.jpg",
+        "readyInMinutes": rng.randint(10, 120),
+        "preparationMinutes": rng.randint(5, 30),
+        "cookingMinutes": rng.randint(5, 90),
+        "summary": " ".join(f"<b>{name}</b> is great." for name in ingredients),
+        "nutrition": {
+            "nutrients": [
+                {"name": "Calories", "amount": rng.uniform(150, 900), "unit": "kcal"},
+                {"name": "Fat", "amount": rng.uniform(2, 60), "unit": "g"},
+                {"name": "Carbohydrates", "amount": rng.uniform(5, 120), "unit": "g"},
+                {"name": "Protein", "amount": rng.uniform(2, 70), "unit": "g"},
+            ]
+        },
+        "extendedIngredients": [
+            {
+                "name": name,
+                "amount": round(rng.uniform(0.25, 4), 2),
+                "unit": rng.choice(["cup", "tbsp", "tsp", "g", "oz", ""]),
+            }
+            for name in ingredients
+        ],
+        "analyzedInstructions": [
+            {
+                "steps": [
+                    {
+                        "number": n + 1,
+                        "step": f"Step {n + 1}: prepare the {name} and combine.",
+                        "length": {"number": rng.randint(1, 15), "unit": "minutes"},
+                    }
+                    for n, name in enumerate(ingredients)
+                ]
+            }
+        ],
+    }
+
+def find_by_ingredients(ingredients: str, number: int = 20) -> List[Dict]:
+    """ A result list as returned by /recipes/findByIngredients """
+    names = [name.strip() for name in ingredients.split(",") if name.strip()]
+    rng = random.Random(ingredients)
+    results = []
+    for i in range(number):
+        recipe_id = 1000 + rng.randint(0, 50_000)
+        used = names[: rng.randint(1, max(1, len(names)))]
+        results.append({
+            "id": recipe_id,
+            "title": f"Recipe {recipe_id}",
+            "image": f"https://img.spoonacular.com/recipes/{recipe_id}-312x231.jpg",
+            "usedIngredientCount": len(used),
+            "missedIngredientCount": rng.randint(0, 5),
+            "usedIngredients": [{"name": name} for name in used],
+            "missedIngredients": [],
+        })
+    return results
+
+def complex_search(query: str, number: int = 50) -> Dict:
+    """ A response body as returned by /recipes/complexSearch with addRecipeInformation """
+    rng = random.Random(query)
+    ids = [1000 + rng.randint(0, 50_000) for _ in range(number)]
+    return {
+        "results": [recipe_information(recipe_id) for recipe_id in ids],
+        "totalResults": number,
+    }
+
+def complete_event(number: int = 20) -> Dict:
+    """ The final NDJSON event of a fridge pipeline """
+    return {
+        "type": "complete",
+        "message": f"Found {number} delicious recipes you can make with your ingredients!",
+        "recipes": [recipe_information(1000 + i) for i in range(number)],
+    }
@@ -0,0 +1,81 @@
+"""
+Local stand-in for the Spoonacular API, serving fixtures with configurable
+latency, slow-tail jitter and injected 503s.
+
+Point the agent at it with SPOONACULAR_BASE_URL=http://127.0.0.1:<port>. It can
+be run on its own:
+
+    STUB_LATENCY=0.2 python -m uvicorn benchmarks.stub_server:app --port 8900
+
+or started in-process with `running_stub`.
+"""
+import asyncio
+import os
+import random
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+import uvicorn
+from fastapi import FastAPI, HTTPException, Query, Request
+
+from benchmarks import fixtures
+
+app = FastAPI()
+app.state.latency = float(os.getenv("STUB_LATENCY", "0"))
+app.state.slow_rate = float(os.getenv("STUB_SLOW_RATE", "0")) # share of calls that take slow_latency instead
+app.state.slow_latency = float(os.getenv("STUB_SLOW_LATENCY", "1"))
+app.state.error_rate = float(os.getenv("STUB_ERROR_RATE", "0")) # share of calls answered with a 503
+app.state.calls = Counter()
+app.state.abandoned = Counter()
+
+async def _upstream(name: str, request: Request):
+    app.state.calls[name] += 1
+    slow = random.random() < app.state.slow_rate
+    await asyncio.sleep(app.state.slow_latency if slow else app.state.latency)
+    if random.random() < app.state.error_rate:
+        raise HTTPException(status_code=503, detail="Injected failure")
+    if await request.is_disconnected():
+        # the caller gave up before the response was ready
+        app.state.abandoned[name] += 1
+
+@app.get("/recipes/findByIngredients")
+async def find_by_ingredients(request: Request, ingredients: str, number: int = 20):
+    await _upstream("findByIngredients", request)
+    return fixtures.find_by_ingredients(ingredients, number)
+
+@app.get("/recipes/informationBulk")
+async def information_bulk(request: Request, ids: str):
+    await _upstream("informationBulk", request)
+    return [fixtures.recipe_information(int(recipe_id)) for recipe_id in ids.split(",") if recipe_id]
+
+@app.get("/recipes/complexSearch")
+async def complex_search(request: Request, query: str, number: int = Query(default=10)):
+    await _upstream("complexSearch", request)
+    return fixtures.complex_search(query, number)
+
+@app.get("/_stats")
+async def stats():
+    """ Calls received and calls whose caller hung up before the response, per endpoint """
+    return {"calls": dict(app.state.calls), "abandoned": dict(app.state.abandoned)}
+
+@contextmanager
+def running_stub(port: int, latency: float = 0.0, slow_rate: float = 0.0, slow_latency: float = 1.0, error_rate: float = 0.0):
+    """ Serve the stand-in on 127.0.0.1:<port> from a background thread """
+    app.state.latency = latency
+    app.state.slow_rate = slow_rate
+    app.state.slow_latency = slow_latency
+    app.state.error_rate = error_rate
+    app.state.calls.clear()
+    app.state.abandoned.clear()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    try:
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        server.should_exit = True
+        thread.join()
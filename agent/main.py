@@ -1,15 +1,44 @@
 import logfire
 import uvicorn
 
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 from src.config import config
-from src.api.chat import router as chat_router
+from src.api.admin import router as admin_router
+from src.api.chat import MAX_CHAT_MESSAGE_BYTES, router as chat_router
+from src.api.images import router as images_router
+from src.api.jobs import router as jobs_router
+from src.api.metrics import router as metrics_router
+from src.agents.orchestrator import orchestrator
+from src.services.image_proxy import check_proxy_base_url, image_cache
+from src.services.jobs import job_store
+from src.services.profiling import loop_monitor, worker_sampler
+from src.services.snapshot import load_recipe_snapshot
 
 logfire.configure()
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if config.IMAGE_PROXY:
+        check_proxy_base_url()
+    if config.RECIPE_SNAPSHOT_PATH:
+        load_recipe_snapshot(config.RECIPE_SNAPSHOT_PATH)
+    if config.WARM_UP:
+        orchestrator.warm_up()
+    if config.LOOP_LAG_THRESHOLD_MS > 0:
+        loop_monitor.start()
+    if config.PROFILING_TOKEN:
+        worker_sampler.start()
+    yield
+    await loop_monitor.stop()
+    await worker_sampler.stop()
+    await job_store.shutdown()
+    await orchestrator.shutdown()
+    await image_cache.aclose()
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -20,6 +49,47 @@ app.add_middleware(
 )
 
 app.include_router(chat_router, prefix="/api")
+app.include_router(metrics_router, prefix="/api")
+app.include_router(images_router, prefix="/api")
+app.include_router(jobs_router, prefix="/api")
+app.include_router(admin_router, prefix="/api")
+
+def serve_production(app_path: str = "main:app"):
+    """
+    Run the API with multiple worker processes on uvloop/httptools.
+
+    Each worker imports `app_path` and runs the lifespan itself; uvicorn
+    cannot hand an already imported app to its workers. Configuration checks
+    that need no event loop are run here first, so a bad setting stops the
+    supervisor once instead of failing every worker as it boots. On SIGTERM
+    uvicorn stops accepting connections and waits up to
+    GRACEFUL_SHUTDOWN_TIMEOUT for in-flight NDJSON streams to finish.
+    """
+    if config.IMAGE_PROXY:
+        check_proxy_base_url()
+    logfire.info(
+        f"Starting {config.WORKERS} workers on {config.HOST}:{config.PORT} "
+        f"(loop={config.LOOP}, http={config.HTTP})"
+    )
+    uvicorn.run(
+        app_path,
+        host=config.HOST,
+        port=config.PORT,
+        workers=config.WORKERS,
+        loop=config.LOOP,
+        http=config.HTTP,
+        timeout_keep_alive=config.KEEPALIVE_TIMEOUT,
+        backlog=config.BACKLOG,
+        limit_concurrency=config.LIMIT_CONCURRENCY,
+        limit_max_requests=config.LIMIT_MAX_REQUESTS,
+        timeout_graceful_shutdown=config.GRACEFUL_SHUTDOWN_TIMEOUT,
+        ws_max_size=MAX_CHAT_MESSAGE_BYTES,
+        access_log=config.ACCESS_LOG,
+        proxy_headers=True,
+    )
 
 if __name__ == '__main__':
-    uvicorn.run("main:app", reload=True, host="localhost", port=8000)
\ No newline at end of file
+    if config.ENV == "production":
+        serve_production()
+    else:
+        uvicorn.run("main:app", reload=True, host=config.HOST, port=config.PORT, ws_max_size=MAX_CHAT_MESSAGE_BYTES)
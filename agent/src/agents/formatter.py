@@ -1,12 +1,21 @@
-from pydantic_ai import Agent
-from pydantic_ai.models.gemini import GeminiModel
+from functools import lru_cache
+from typing import TYPE_CHECKING
 from ..models.ingredients import IngredientSearchParams
 
-formatter_agent = Agent(
-    model=GeminiModel(model_name="gemini-2.0-flash"),
-    result_type=IngredientSearchParams,
-    system_prompt="""
-    Convert extracted ingredients into recipe search parameters.
-    Focus on main cooking ingredients, limit to 10-15 most versatile items.
-    """
-)
\ No newline at end of file
+if TYPE_CHECKING:
+    from pydantic_ai import Agent
+
+@lru_cache(maxsize=None)
+def get_formatter_agent() -> "Agent":
+    # pydantic-ai is imported on first use to keep worker startup fast
+    from pydantic_ai import Agent
+    from pydantic_ai.models.gemini import GeminiModel
+
+    return Agent(
+        model=GeminiModel(model_name="gemini-2.0-flash"),
+        result_type=IngredientSearchParams,
+        system_prompt="""
+        Convert extracted ingredients into recipe search parameters.
+        Focus on main cooking ingredients, limit to 10-15 most versatile items.
+        """
+    )
@@ -1,15 +1,19 @@
+import logfire
+
 from .fridge_agent import FridgeAgent
 from .recipe_agent import RecipeAgent
-from .qa_agent import qa_agent
-from ..services.gemini import GeminiService
-from ..services.spoonacular import SpoonacularService
+from .qa_agent import get_qa_agent
+from .formatter import get_formatter_agent
+from .query_extractor import get_query_extractor
+from .router_agent import get_router_agent
+from ..models.deps import Deps
+from ..services.registry import services
+from ..services.resilience import with_deadline
+from ..services.semantic_cache import query_cache
 from ..config import config
 
-# initialize services and agents
-_gemini_service = GeminiService(config.GEMINI_API_KEY)
-_spoonacular_service = SpoonacularService(config.SPOONACULAR_API_KEY)
-_recipe_agent = RecipeAgent(_spoonacular_service)
-# FridgeAgent is initialized per request with deps
+# services and agents are built on first use (or by warm_up)
+# FridgeAgent and RecipeAgent are initialized per request with deps
 
 class Orchestrator:
     async def run(self, *, image_base64=None, user_query=None, deps=None):
@@ -17,9 +21,18 @@ class Orchestrator:
             agent = FridgeAgent(deps)
             return agent.run(image_base64)  # returns an async generator
         elif user_query:
-            # use LLM-based intent classification
+            search_params = None
             try:
-                intent = await self.classify_intent_llm(user_query)
+                if config.INTENT_ROUTER == "combined":
+                    # one structured call returns the intent and, for searches, the parameters
+                    intent, search_params = await self.route_llm(user_query, deadline=deps.deadline if deps else None)
+                else:
+                    # use LLM-based intent classification
+                    intent = await self.classify_intent_llm(
+                        user_query,
+                        cancel_token=deps.cancel_token if deps else None,
+                        deadline=deps.deadline if deps else None
+                    )
             except Exception as e:
                 # fallback to keyword-based
                 intent = await self.classify_intent_keywords(user_query)
@@ -27,9 +40,19 @@ class Orchestrator:
                 agent = FridgeAgent(deps)
                 return agent.run(image_base64)
             elif intent == "recipe_search":
-                return await _recipe_agent.run(user_query)
+                # deps may carry a request-scoped service (e.g. the batch endpoint's)
+                agent = RecipeAgent(deps or Deps(
+                    client=None,
+                    spoonacular_api_key=config.SPOONACULAR_API_KEY,
+                    gemini_api_key=config.GEMINI_API_KEY
+                ))
+                return agent.run(user_query, search_params=search_params)  # returns an async generator
             elif intent == "general_qa":
-                result = await qa_agent.run(user_query)
+                result = await with_deadline(
+                    get_qa_agent().run(user_query),
+                    deps.deadline if deps else None,
+                    config.GEMINI_TIMEOUT
+                )
                 return {
                     "type": "complete",
                     "message": result.data.answer,
@@ -48,7 +71,27 @@ class Orchestrator:
                 "recipes": []
             }
 
-    async def classify_intent_llm(self, query: str) -> str:
+    async def route_llm(self, query: str, deadline=None):
+        """
+        Classify the query and extract recipe search parameters in a single
+        structured LLM call. Returns (intent, search_params or None).
+        """
+        if config.SEMANTIC_CACHE_ENABLED:
+            # only recipe searches are cached, so a hit settles the intent too
+            cached = query_cache.get(query)
+            if cached is not None:
+                logfire.info(f"Semantic cache hit for '{query}'")
+                return "recipe_search", cached.model_copy()
+
+        result = await with_deadline(get_router_agent().run(query), deadline, config.GEMINI_TIMEOUT)
+        routed = result.data
+        if routed.intent != "recipe_search":
+            return routed.intent, None
+        if routed.search_params and config.SEMANTIC_CACHE_ENABLED:
+            query_cache.put(query, routed.search_params)
+        return routed.intent, routed.search_params
+
+    async def classify_intent_llm(self, query: str, cancel_token=None, deadline=None) -> str:
         """
         Use Gemini LLM to classify the user query as 'fridge_image', 'recipe_search', or 'general_qa'.
         """
@@ -60,17 +103,49 @@ class Orchestrator:
             "Only return one of these three labels.\n"
             f"Query: {query}"
         )
-        response = await _gemini_service.answer_question(prompt)
+        response = await services.gemini.answer_question(prompt, cancel_token=cancel_token, deadline=deadline)
         # extract the first valid label from the response
         for label in ["fridge_image", "recipe_search", "general_qa"]:
             if label in response.lower():
                 return label
         return "general_qa"  # fallback
 
+    async def admission_pool(self, *, image_base64=None, user_query=None) -> str:
+        """
+        Pick the admission pool ('vision', 'search' or 'qa') for a request.
+        Uses the free keyword classifier since the LLM one only runs once admitted.
+        """
+        if image_base64:
+            return "vision"
+        if user_query and await self.classify_intent_keywords(user_query) == "recipe_search":
+            return "search"
+        return "qa"
+
     async def classify_intent_keywords(self, query: str) -> str:
         keywords = ["recipe", "how to make", "how do I cook", "make", "prepare", "ingredients for"]
         if any(kw in query.lower() for kw in keywords):
             return "recipe_search"
         return "general_qa"
 
+    def warm_up(self):
+        """
+        Build every service and agent up front so the first request does not pay for it.
+        Failures are logged rather than raised so a missing key does not block startup.
+        """
+        for name, build in [
+            ("gemini", lambda: services.gemini),
+            ("spoonacular", lambda: services.spoonacular),
+            ("formatter", get_formatter_agent),
+            ("query_extractor", get_query_extractor),
+            ("router", get_router_agent),
+            ("qa", get_qa_agent),
+        ]:
+            try:
+                build()
+            except Exception as e:
+                logfire.warning(f"Warm-up of {name} failed: {str(e)}")
+
+    async def shutdown(self):
+        await services.aclose()
+
 orchestrator = Orchestrator()
@@ -1,14 +1,22 @@
-from pydantic_ai import Agent
-from pydantic_ai.models.gemini import GeminiModel
+from functools import lru_cache
+from typing import TYPE_CHECKING
 from pydantic import BaseModel
 
+if TYPE_CHECKING:
+    from pydantic_ai import Agent
+
 class QAAnswer(BaseModel):
     answer: str
 
-qa_agent = Agent(
-    model=GeminiModel(model_name="gemini-2.0-flash"),
-    result_type=QAAnswer,
-    system_prompt="""
-    You are a helpful cooking assistant. Answer the user's question clearly and concisely. If the question is not about cooking, politely say you can only answer cooking-related questions.
-    """
-) 
\ No newline at end of file
+@lru_cache(maxsize=None)
+def get_qa_agent() -> "Agent":
+    from pydantic_ai import Agent
+    from pydantic_ai.models.gemini import GeminiModel
+
+    return Agent(
+        model=GeminiModel(model_name="gemini-2.0-flash"),
+        result_type=QAAnswer,
+        system_prompt="""
+        You are a helpful cooking assistant. Answer the user's question clearly and concisely. If the question is not about cooking, politely say you can only answer cooking-related questions.
+        """
+    )
@@ -1,19 +1,48 @@
-from pydantic_ai import Agent
-from pydantic_ai.models.gemini import GeminiModel
+import logfire
+from functools import lru_cache
+from typing import TYPE_CHECKING, Optional
 from ..models.recipe import RecipeSearchParams
+from ..services.resilience import Deadline, with_deadline
+from ..services.semantic_cache import query_cache
+from ..config import config
 
-query_extractor = Agent(
-    model=GeminiModel(model_name="gemini-2.0-flash"),
-    result_type=RecipeSearchParams,
-    system_prompt="""
-    Extract recipe search parameters from the user's natural language query.     
-    Parse time expressions like 'less than an hour' to minutes (60). 
-    Extract specific ingredients mentioned.
-    Identify the main dish being searched for.
+if TYPE_CHECKING:
+    from pydantic_ai import Agent
 
-    Examples:
-    - "gluten-free pasta under 30 minutes" → intolerances: "gluten", maxReadyTime: 30, query: "pasta"
-    - "healthy vegetarian dinner without nuts" → excludeIngredients: "nuts", query: "vegetarian dinner"
-    - "quick Italian dishes" → cuisine: "italian", query: "quick dishes"
+@lru_cache(maxsize=None)
+def get_query_extractor() -> "Agent":
+    from pydantic_ai import Agent
+    from pydantic_ai.models.gemini import GeminiModel
+
+    return Agent(
+        model=GeminiModel(model_name="gemini-2.0-flash"),
+        result_type=RecipeSearchParams,
+        system_prompt="""
+        Extract recipe search parameters from the user's natural language query.     
+        Parse time expressions like 'less than an hour' to minutes (60). 
+        Extract specific ingredients mentioned.
+        Identify the main dish being searched for.
+
+        Examples:
+        - "gluten-free pasta under 30 minutes" → intolerances: "gluten", maxReadyTime: 30, query: "pasta"
+        - "healthy vegetarian dinner without nuts" → excludeIngredients: "nuts", query: "vegetarian dinner"
+        - "quick Italian dishes" → cuisine: "italian", query: "quick dishes"
+        """
+    )
+
+async def extract_search_params(query: str, deadline: Optional[Deadline] = None) -> RecipeSearchParams:
     """
-)
\ No newline at end of file
+    Extract search parameters for a text query, reusing the parameters of a
+    semantically equivalent earlier query when the cache has one.
+    """
+    if config.SEMANTIC_CACHE_ENABLED:
+        cached = query_cache.get(query)
+        if cached is not None:
+            logfire.info(f"Semantic cache hit for '{query}'")
+            return cached.model_copy()
+
+    extraction_result = await with_deadline(get_query_extractor().run(query), deadline, config.GEMINI_TIMEOUT)
+    search_params = extraction_result.data
+    if config.SEMANTIC_CACHE_ENABLED:
+        query_cache.put(query, search_params)
+    return search_params
@@ -0,0 +1,46 @@
+from functools import lru_cache
+from typing import TYPE_CHECKING, Literal, Optional
+from pydantic import BaseModel, Field
+from ..models.recipe import RecipeSearchParams
+
+if TYPE_CHECKING:
+    from pydantic_ai import Agent
+
+class RoutedQuery(BaseModel):
+    """ Intent of a text query, with search parameters when it is a recipe search """
+    intent: Literal["fridge_image", "recipe_search", "general_qa"] = Field(
+        description="fridge_image: about uploading/analyzing a fridge photo; "
+                    "recipe_search: looking for recipes; general_qa: a general cooking question"
+    )
+    search_params: Optional[RecipeSearchParams] = Field(
+        default=None,
+        description="Recipe search parameters, only when intent is recipe_search"
+    )
+
+@lru_cache(maxsize=None)
+def get_router_agent() -> "Agent":
+    from pydantic_ai import Agent
+    from pydantic_ai.models.gemini import GeminiModel
+
+    return Agent(
+        model=GeminiModel(model_name="gemini-2.0-flash"),
+        result_type=RoutedQuery,
+        system_prompt="""
+        Classify the user's cooking-related query and, for recipe searches, extract search parameters in the same step.
+
+        intent:
+        - 'fridge_image' if the query is about uploading or analyzing a fridge image
+        - 'recipe_search' if the user is looking for a recipe
+        - 'general_qa' for a general cooking question
+
+        When intent is 'recipe_search', fill search_params:
+        Parse time expressions like 'less than an hour' to minutes (60).
+        Extract specific ingredients mentioned.
+        Identify the main dish being searched for.
+
+        Examples:
+        - "gluten-free pasta under 30 minutes" → intent: recipe_search, intolerances: "gluten", maxReadyTime: 30, query: "pasta"
+        - "healthy vegetarian dinner without nuts" → intent: recipe_search, excludeIngredients: "nuts", query: "vegetarian dinner"
+        - "how long do eggs keep in the fridge?" → intent: general_qa, no search_params
+        """
+    )
@@ -0,0 +1,40 @@
+import os
+
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import FileResponse, PlainTextResponse
+
+from ..services.profiling import profile_path, profile_report, profiling_authorized, worker_sampler
+from ..config import config
+
+def require_profiling_token(request: Request):
+    if not config.PROFILING_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not profiling_authorized(request):
+        raise HTTPException(status_code=403, detail="Missing or invalid profiling token")
+
+router = APIRouter(prefix="/admin", dependencies=[Depends(require_profiling_token)])
+
+@router.get("/profile")
+async def sample_workers_endpoint(seconds: float = 10, interval_ms: float = config.PROFILE_SAMPLE_INTERVAL_MS):
+    """
+    Sample the Python stacks of every worker on this host for `seconds`.
+    Returns collapsed stacks, one "worker;thread;frames... count" line each,
+    ready for flamegraph.pl, speedscope or inferno.
+    """
+    if not 0 < seconds <= config.PROFILE_MAX_SECONDS:
+        raise HTTPException(status_code=422, detail=f"seconds must be between 0 and {config.PROFILE_MAX_SECONDS:g}")
+    workers = config.WORKERS if config.ENV == "production" else 1
+    result = await worker_sampler.sample(seconds, max(interval_ms, 1.0) / 1000, workers)
+    return PlainTextResponse(
+        result["collapsed"],
+        headers={"X-Profile-Id": result["id"], "X-Profile-Workers": f"{result['workers']}/{workers}"}
+    )
+
+@router.get("/profiles/{profile_id}")
+async def request_profile_endpoint(profile_id: str, format: str = "text"):
+    """ A per-request profile as pstats text, or the raw .prof file with format=pstats (for snakeviz and the like) """
+    if not profile_id.isalnum() or not os.path.exists(profile_path(profile_id)):
+        raise HTTPException(status_code=404, detail=f"No profile {profile_id}")
+    if format == "pstats":
+        return FileResponse(profile_path(profile_id), media_type="application/octet-stream", filename=f"{profile_id}.prof")
+    return PlainTextResponse(profile_report(profile_id))
@@ -1,36 +1,478 @@
-from typing import AsyncGenerator
-from fastapi import APIRouter
+import asyncio
+import hashlib
+import logfire
+from typing import AsyncGenerator, Dict, List, Optional, Tuple
+from fastapi import APIRouter, HTTPException, Request, WebSocket, WebSocketDisconnect
+from fastapi.exceptions import RequestValidationError
 from fastapi.responses import StreamingResponse
 from httpx import AsyncClient
+from pydantic import TypeAdapter, ValidationError
+from starlette.requests import HTTPConnection
 
-from ..models.chat import ChatMessage, StreamResponse
+from ..models.chat import ChatMessage, StreamResponse, BatchStreamResponse, ChatFrame, ChatFrameResponse, JobStreamResponse
 from ..models.deps import Deps
 from ..agents.orchestrator import orchestrator
+from ..services.batching import BatchSpoonacularService
+from ..services.admission import admission, AdmissionRejected, Ticket
+from ..services.cancellation import CancelToken, cancellation_metrics, stream_until_disconnect
+from ..services.image_precheck import ImageRejected, check_uploads
+from ..services.image_proxy import rewrite_recipe_images
+from ..services.images import MB, ImageTooLarge, ImageUpload, MemoryBudget, decode_uploads, read_limited_body
+from ..services.jobs import Job, job_store
+from ..services.profiling import new_profile_id, profiling_authorized, request_profile
+from ..services.resilience import Deadline
 from ..config import config
 
 router = APIRouter()
 
-@router.post("/chat")
-async def chat_endpoint(body: ChatMessage):
+# largest chat message accepted: the photo budget as base64 plus room for the JSON around it
+MAX_CHAT_MESSAGE_BYTES = config.IMAGE_MEMORY_LIMIT_MB * MB * 4 // 3 + 64 * 1024
+# a batch shares one photo budget, plus the same room for JSON per message
+MAX_BATCH_BYTES = config.IMAGE_MEMORY_LIMIT_MB * MB * 4 // 3 + config.BATCH_MAX_MESSAGES * 64 * 1024
+
+_batch_adapter = TypeAdapter(List[ChatMessage])
+
+def _build_deps(client: AsyncClient, body: ChatMessage, **fields) -> Deps:
+    fields.setdefault("image_base64", body.images or None)
+    return Deps(
+        client=client,
+        spoonacular_api_key=config.SPOONACULAR_API_KEY,
+        gemini_api_key=config.GEMINI_API_KEY,
+        has_image=bool(fields["image_base64"]),
+        user_query=body.message,
+        **fields,
+    )
+
+async def _run_pipeline(body: ChatMessage, deps: Deps) -> AsyncGenerator[dict, None]:
+    result = await orchestrator.run(
+        image_base64=deps.image_base64,
+        user_query=body.message,
+        deps=deps
+    )
+    # if the result is an async generator, relay each message
+    if hasattr(result, "__aiter__"):
+        async for msg in result:
+            yield rewrite_recipe_images(msg) if config.IMAGE_PROXY else msg
+    else:
+        yield rewrite_recipe_images(result) if config.IMAGE_PROXY else result
+
+def _decode_and_check(images: List[str], budget: Optional[MemoryBudget] = None) -> List[ImageUpload]:
+    """ Decode a message's photos and run the local quality check on them; blocks """
+    uploads = decode_uploads(images, budget)
+    if config.IMAGE_PRECHECK:
+        check_uploads(uploads)
+    return uploads
+
+def _client_id(request: HTTPConnection) -> str:
+    return request.headers.get("x-client-id") or (request.client.host if request.client else "anonymous")
+
+async def _read_chat_message(request: Request) -> ChatMessage:
+    # parsed straight from the raw bytes: no cached body or JSON dict copies of a photo outlive this call
+    body = await read_limited_body(request, MAX_CHAT_MESSAGE_BYTES)
+    return _validate_body(ChatMessage.model_validate_json, body)
+
+def _validate_body(validate, body: bytearray):
+    try:
+        return validate(body)
+    except ValidationError as e:
+        raise RequestValidationError([
+            {**error, "loc": ("body", *error["loc"])}
+            for error in e.errors(include_url=False, include_input=False)
+        ])
+
+async def _accept_chat_message(request: Request) -> Tuple[ChatMessage, List[ImageUpload], Ticket]:
+    """ Parse a chat message, decode and check its photos and take an admission ticket, or fail before any work is done """
+    # decode photos once and keep only their compressed bytes; unusable photos never wait for a vision slot
+    try:
+        body = await _read_chat_message(request)
+        uploads = await asyncio.to_thread(_decode_and_check, body.images)
+    except ImageTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ImageRejected as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except RequestValidationError:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    body.image_base64 = body.images_base64 = None
+
+    pool = await orchestrator.admission_pool(image_base64=uploads or None, user_query=body.message)
+    try:
+        ticket = admission.enqueue(pool, _client_id(request))
+    except AdmissionRejected as e:
+        # rejected before any work is done so the client can back off immediately
+        raise HTTPException(status_code=e.status_code, detail=e.message, headers={"Retry-After": "1"})
+    return body, uploads, ticket
+
+async def _admitted_events(
+    ticket: Ticket,
+    body: ChatMessage,
+    uploads: List[ImageUpload],
+    token: CancelToken,
+    profile_id: Optional[str] = None,
+    request: Optional[Request] = None
+) -> AsyncGenerator[dict, None]:
+    """
+    Queue positions until the ticket is admitted, then the pipeline's events.
+    With a request, the pipeline is cancelled if that client disconnects.
+    """
+    try:
+        try:
+            async for position in ticket.wait(config.ADMISSION_QUEUE_TIMEOUT):
+                yield {"type": "queued", "message": f"You're number {position} in line...", "data": {"position": position}}
+        except AdmissionRejected as e:
+            yield {"type": "error", "message": e.message}
+            return
+
+        # profiles the pipeline, event validation and encoding, not the time spent queued
+        with request_profile(profile_id):
+            async with AsyncClient() as client:
+                # the budget starts once admitted so queueing does not eat into it
+                deps = _build_deps(
+                    client,
+                    body,
+                    image_base64=uploads or None,
+                    cancel_token=token,
+                    deadline=Deadline(config.REQUEST_DEADLINE)
+                )
+                # the vision step releases the upload buffers once it is done with them
+                events = _run_pipeline(body, deps)
+                if request is not None:
+                    events = stream_until_disconnect(request, events, token)
+                async for msg in events:
+                    yield msg
+    finally:
+        ticket.release()
+
+class TicketedStreamingResponse(StreamingResponse):
+    """
+    A streaming response that owns an admission ticket. The ticket is released
+    when the response ends however it ends, including when the client hangs up
+    before the body generator ever starts (its own finally would never run).
+    """
+    def __init__(self, content, ticket: Ticket, **kwargs):
+        super().__init__(content, **kwargs)
+        self.ticket = ticket
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.ticket.release()
+
+def _start_fridge_job(body: ChatMessage, uploads: List[ImageUpload], ticket: Ticket, profile_id: Optional[str] = None) -> Job:
+    async def run(token: CancelToken) -> AsyncGenerator[dict, None]:
+        async for msg in _admitted_events(ticket, body, uploads, token, profile_id):
+            # validated once here; replays and other workers read the stored form
+            yield StreamResponse(**msg).model_dump(mode="json", exclude_none=True)
+    try:
+        job = job_store.create("fridge", run)
+    except BaseException:
+        ticket.release()
+        raise
+    # released when the task ends, even if it is cancelled before the generator starts
+    job.task.add_done_callback(lambda _: ticket.release())
+    return job
+
+async def _job_event_lines(job_id: str, after: int) -> AsyncGenerator[str, None]:
+    async for seq, event in job_store.stream(job_id, after):
+        yield JobStreamResponse(**event, job_id=job_id, seq=seq).model_dump_json() + "\n"
+
+@router.post(
+    "/chat",
+    openapi_extra={
+        "requestBody": {
+            "content": {"application/json": {"schema": ChatMessage.model_json_schema()}},
+            "required": True,
+        }
+    }
+)
+async def chat_endpoint(request: Request):
+    body, uploads, ticket = await _accept_chat_message(request)
+    # a request carrying PROFILING_TOKEN is profiled; fetch it from /api/admin/profiles/{id}
+    profile_id = new_profile_id() if profiling_authorized(request) else None
+    headers = {"X-Profile-Id": profile_id} if profile_id else {}
+
+    if uploads and config.FRIDGE_JOBS:
+        # the analysis runs as a job: if this connection drops, the client resumes
+        # from GET /api/jobs/{id}/stream?after=<last seq> instead of starting over
+        job = _start_fridge_job(body, uploads, ticket, profile_id)
+        return StreamingResponse(
+            _job_event_lines(job.id, 0),
+            media_type="application/x-ndjson",
+            headers={**headers, "X-Job-Id": job.id}
+        )
+
     async def stream_updates() -> AsyncGenerator[str, None]:
+        async for msg in _admitted_events(ticket, body, uploads, CancelToken(), profile_id, request):
+            yield StreamResponse(**msg).model_dump_json() + "\n"
+    return TicketedStreamingResponse(stream_updates(), ticket, media_type="application/x-ndjson", headers=headers)
+
+def _decode_batch(messages: List[ChatMessage]) -> List[object]:
+    """
+    Decode and check the photos of each message under one memory budget for
+    the whole batch. A message whose photos cannot be used gets its error in
+    place of uploads; going over the budget fails the batch. Blocks.
+    """
+    budget = MemoryBudget(config.IMAGE_MEMORY_LIMIT_MB * MB)
+    results = []
+    for message in messages:
+        try:
+            results.append(_decode_and_check(message.images, budget))
+        except ImageTooLarge:
+            raise
+        except Exception as e:
+            results.append(e)
+    return results
+
+@router.post(
+    "/chat/batch",
+    openapi_extra={
+        "requestBody": {
+            "content": {"application/json": {"schema": _batch_adapter.json_schema()}},
+            "required": True,
+        }
+    }
+)
+async def chat_batch_endpoint(request: Request):
+    """
+    Run many chat messages through the orchestrator with bounded concurrency.
+    Identical messages run once, searches and detail fetches are shared across
+    the batch, and each message's final event is streamed back tagged with its
+    index as soon as it is ready. Photos are decoded and checked up front
+    within one IMAGE_MEMORY_LIMIT_MB budget for the whole batch, and every
+    message takes a ticket from its admission pool like a single chat
+    request, so a batch shares the worker with interactive traffic instead of
+    bypassing its limits.
+    """
+    try:
+        body = _validate_body(_batch_adapter.validate_json, await read_limited_body(request, MAX_BATCH_BYTES))
+    except ImageTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    if len(body) > config.BATCH_MAX_MESSAGES:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch too large: {len(body)} messages (max {config.BATCH_MAX_MESSAGES})"
+        )
+
+    # group identical messages so each distinct one runs once; photos are compared by digest
+    groups: Dict[Tuple[Optional[str], Tuple[bytes, ...]], List[int]] = {}
+    for index, message in enumerate(body):
+        digests = tuple(hashlib.sha256(image.encode()).digest() for image in message.images)
+        groups.setdefault((message.message, digests), []).append(index)
+    firsts = [body[indices[0]] for indices in groups.values()]
+    try:
+        decoded = await asyncio.to_thread(_decode_batch, firsts)
+    except ImageTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    # keep only the compressed bytes, not the base64 text, for the life of the stream
+    for message in body:
+        message.image_base64 = message.images_base64 = None
+    del firsts
+
+    client_id = _client_id(request)
+
+    async def stream_results() -> AsyncGenerator[str, None]:
+        semaphore = asyncio.Semaphore(config.BATCH_CONCURRENCY)
+        # a batch never holds more tickets in a pool than one client may queue there,
+        # so it cannot be turned away with a 429 caused by its own messages
+        pool_slots = {name: asyncio.Semaphore(config.ADMISSION_MAX_QUEUE_PER_CLIENT) for name in admission.pools}
+        spoonacular = BatchSpoonacularService(config.SPOONACULAR_API_KEY)
+
         async with AsyncClient() as client:
-            deps = Deps(
-                client=client,
-                spoonacular_api_key=config.SPOONACULAR_API_KEY,
-                gemini_api_key=config.GEMINI_API_KEY,
-                has_image=bool(body.image_base64),
-                image_base64=body.image_base64,
-                user_query=body.message,
-            )
-            result = await orchestrator.run(
-                image_base64=body.image_base64,
-                user_query=body.message,
-                deps=deps
-            )
-            # if the result is an async generator, stream each message
-            if hasattr(result, "__aiter__"):
-                async for msg in result:
-                    yield StreamResponse(**msg).model_dump_json() + "\n"
-            else:
-                yield StreamResponse(**result).model_dump_json() + "\n"
-    return StreamingResponse(stream_updates(), media_type="application/x-ndjson")
\ No newline at end of file
+            async def run_one(indices: List[int], uploads) -> Tuple[List[int], dict]:
+                if isinstance(uploads, Exception):
+                    # rejected photos never wait for an admission slot
+                    return indices, {"type": "error", "message": str(uploads)}
+                message = body[indices[0]]
+                final = None
+                pool = await orchestrator.admission_pool(image_base64=uploads or None, user_query=message.message)
+                async with semaphore, pool_slots[pool]:
+                    try:
+                        ticket = admission.enqueue(pool, client_id)
+                    except AdmissionRejected as e:
+                        return indices, {"type": "error", "message": e.message}
+                    try:
+                        async for _ in ticket.wait(config.ADMISSION_QUEUE_TIMEOUT):
+                            pass
+                        deps = _build_deps(
+                            client,
+                            message,
+                            image_base64=uploads or None,
+                            deadline=Deadline(config.REQUEST_DEADLINE),
+                            _spoonacular_service=spoonacular
+                        )
+                        # only the terminal event is reported for batch messages
+                        async for msg in _run_pipeline(message, deps):
+                            final = msg
+                    except Exception as e:
+                        final = {"type": "error", "message": str(e)}
+                    finally:
+                        ticket.release()
+                return indices, final or {"type": "error", "message": "No result produced"}
+
+            tasks = [
+                asyncio.create_task(run_one(indices, uploads))
+                for indices, uploads in zip(groups.values(), decoded)
+            ]
+            try:
+                for completed in asyncio.as_completed(tasks):
+                    indices, final = await completed
+                    for index in indices:
+                        yield BatchStreamResponse(index=index, **final).model_dump_json() + "\n"
+            finally:
+                for task in tasks:
+                    task.cancel()
+                await spoonacular.aclose()
+
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+
+class ChatSession:
+    """
+    State shared by every request on one chat WebSocket: a single HTTP client,
+    the admission identity, and the requests still running, keyed by the
+    client's request id so a cancel frame can stop the matching pipeline.
+    """
+    def __init__(self, websocket: WebSocket, client: AsyncClient):
+        self.websocket = websocket
+        self.client = client
+        # browsers cannot set headers on a WebSocket, so the id may come in the query string
+        self.client_id = websocket.query_params.get("client_id") or _client_id(websocket)
+        self.requests: Dict[str, Tuple[asyncio.Task, CancelToken]] = {}
+        self.current_steps: Dict[str, Optional[str]] = {}
+        self._send_lock = asyncio.Lock()
+
+    async def send(self, request_id: Optional[str], event: dict):
+        frame = ChatFrameResponse(id=request_id, **event).model_dump_json()
+        # events of concurrent requests share the socket one whole frame at a time
+        async with self._send_lock:
+            await self.websocket.send_text(frame)
+
+    def start(self, frame: ChatFrame, uploads: list):
+        token = CancelToken()
+        task = asyncio.create_task(self._serve(frame, uploads, token))
+        self.requests[frame.id] = (task, token)
+
+    async def cancel(self, request_id: str, reason: str) -> bool:
+        """ Stop a running request and wait for its pipeline to unwind """
+        if request_id not in self.requests:
+            return False
+        task, token = self.requests[request_id]
+        step = self.current_steps.get(request_id)
+        token.cancel(reason)
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        cancellation_metrics.record("pipelines_cancelled")
+        if step:
+            cancellation_metrics.record_step(step)
+        logfire.info(f"Cancelled WebSocket request {request_id} ({reason})")
+        return True
+
+    async def close(self):
+        for request_id in list(self.requests):
+            await self.cancel(request_id, "client disconnected")
+
+    async def _serve(self, frame: ChatFrame, uploads: list, token: CancelToken):
+        request_id = frame.id
+        try:
+            pool = await orchestrator.admission_pool(image_base64=uploads or None, user_query=frame.message)
+            try:
+                ticket = admission.enqueue(pool, self.client_id)
+            except AdmissionRejected as e:
+                await self.send(request_id, {"type": "error", "message": e.message})
+                return
+            try:
+                try:
+                    async for position in ticket.wait(config.ADMISSION_QUEUE_TIMEOUT):
+                        await self.send(request_id, {
+                            "type": "queued",
+                            "message": f"You're number {position} in line...",
+                            "data": {"position": position}
+                        })
+                except AdmissionRejected as e:
+                    await self.send(request_id, {"type": "error", "message": e.message})
+                    return
+
+                # the budget starts once admitted so queueing does not eat into it
+                deps = _build_deps(
+                    self.client,
+                    frame,
+                    image_base64=uploads or None,
+                    cancel_token=token,
+                    deadline=Deadline(config.REQUEST_DEADLINE)
+                )
+                del uploads
+                async for msg in _run_pipeline(frame, deps):
+                    if msg.get("type") == "step":
+                        self.current_steps[request_id] = msg.get("step") if msg.get("status") == "in_progress" else None
+                    await self.send(request_id, msg)
+            finally:
+                ticket.release()
+        except asyncio.CancelledError:
+            raise
+        except WebSocketDisconnect:
+            # the receive loop cancels everything else once it sees the disconnect
+            pass
+        except Exception as e:
+            logfire.error(f"WebSocket request {request_id} failed: {str(e)}")
+            try:
+                await self.send(request_id, {"type": "error", "message": str(e)})
+            except Exception:
+                pass
+        finally:
+            self.requests.pop(request_id, None)
+            self.current_steps.pop(request_id, None)
+
+@router.websocket("/chat/ws")
+async def chat_websocket(websocket: WebSocket):
+    """
+    Chat over one WebSocket. Each client frame is a chat message with a
+    request id (type "chat") or a cancel for one (type "cancel"); several
+    requests can run at once, and every event sent back is a stream event
+    tagged with the id of the request it belongs to.
+    """
+    await websocket.accept()
+    async with AsyncClient() as client:
+        session = ChatSession(websocket, client)
+        try:
+            while True:
+                text = await websocket.receive_text()
+                try:
+                    frame = ChatFrame.model_validate_json(text)
+                except ValidationError as e:
+                    problems = "; ".join(
+                        ".".join(str(part) for part in error["loc"]) + ": " + error["msg"] if error["loc"] else error["msg"]
+                        for error in e.errors(include_url=False, include_input=False)
+                    )
+                    await session.send(None, {"type": "error", "message": f"Invalid frame: {problems}"})
+                    continue
+                del text
+
+                if frame.type == "cancel":
+                    if await session.cancel(frame.id, "cancelled by client"):
+                        await session.send(frame.id, {"type": "cancelled", "message": "Request cancelled"})
+                    continue
+                if frame.id in session.requests:
+                    await session.send(frame.id, {"type": "error", "message": "A request with this id is already running"})
+                    continue
+                if len(session.requests) >= config.WS_MAX_IN_FLIGHT:
+                    await session.send(frame.id, {
+                        "type": "error",
+                        "message": "Too many requests in progress. Please wait for them to finish."
+                    })
+                    continue
+                try:
+                    uploads = await asyncio.to_thread(_decode_and_check, frame.images)
+                except Exception as e:
+                    await session.send(frame.id, {"type": "error", "message": str(e)})
+                    continue
+                frame.image_base64 = frame.images_base64 = None
+                session.start(frame, uploads)
+                del uploads
+        except WebSocketDisconnect:
+            pass
+        finally:
+            await session.close()
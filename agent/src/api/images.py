@@ -0,0 +1,32 @@
+import logfire
+from fastapi import APIRouter, HTTPException, Request, Response
+
+from ..services.image_proxy import CACHE_HEADERS, IMAGE_SIZES, ImageNotFound, image_cache
+
+router = APIRouter()
+
+@router.get("/images/{recipe_id}")
+async def recipe_image_endpoint(recipe_id: int, request: Request, size: str = "card"):
+    """
+    A recipe image resized to one of IMAGE_SIZES and encoded as WebP.
+
+    The first request for a recipe fetches its image from the upstream and
+    caches every size on disk; later ones are served from the cache. Variants
+    never change for a given id and size, so browsers and CDNs may keep them
+    for a year.
+    """
+    if size not in IMAGE_SIZES:
+        raise HTTPException(status_code=422, detail=f"Unknown image size {size!r} (expected one of {', '.join(IMAGE_SIZES)})")
+    try:
+        content = await image_cache.read(recipe_id, size)
+        # the modification time moves on every hit, so the tag comes from what never changes
+        etag = f'"{recipe_id}-{size}-{len(content)}"'
+    except ImageNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        logfire.error(f"Failed to proxy image for recipe {recipe_id}: {str(e) or type(e).__name__}")
+        raise HTTPException(status_code=502, detail="Recipe image is unavailable right now")
+
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={**CACHE_HEADERS, "ETag": etag})
+    return Response(content, media_type="image/webp", headers={**CACHE_HEADERS, "ETag": etag})
@@ -0,0 +1,48 @@
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from .chat import _accept_chat_message, _job_event_lines, _start_fridge_job
+from ..models.chat import ChatMessage
+from ..services.jobs import job_store
+
+router = APIRouter(prefix="/jobs")
+
+@router.post(
+    "",
+    status_code=202,
+    openapi_extra={
+        "requestBody": {
+            "content": {"application/json": {"schema": ChatMessage.model_json_schema()}},
+            "required": True,
+        }
+    }
+)
+async def create_job_endpoint(request: Request):
+    """ Start a fridge analysis without waiting on it; follow it with GET /api/jobs/{id}/stream """
+    body, uploads, ticket = await _accept_chat_message(request)
+    if not uploads:
+        ticket.release()
+        raise HTTPException(status_code=400, detail="A fridge analysis job needs at least one photo")
+    job = _start_fridge_job(body, uploads, ticket)
+    return JSONResponse(status_code=202, content={"id": job.id, "stream": f"/api/jobs/{job.id}/stream"})
+
+@router.get("/{job_id}/stream")
+async def job_stream_endpoint(job_id: str, after: int = 0):
+    """
+    A job's events with seq greater than `after`: everything logged so far,
+    then new events until the job finishes. Reconnecting with the last seq
+    received picks up where the dropped connection left off, without
+    rerunning any of the pipeline.
+    """
+    if not await job_store.exists(job_id):
+        raise HTTPException(status_code=404, detail=f"No job {job_id} (it may have expired)")
+    return StreamingResponse(_job_event_lines(job_id, after), media_type="application/x-ndjson")
+
+@router.delete("/{job_id}")
+async def cancel_job_endpoint(job_id: str):
+    """ Stop a running job; its stream ends with a "cancelled" event """
+    if not await job_store.exists(job_id):
+        raise HTTPException(status_code=404, detail=f"No job {job_id} (it may have expired)")
+    if not job_store.cancel(job_id):
+        raise HTTPException(status_code=409, detail="Job has already finished or runs on another worker")
+    return {"id": job_id, "cancelled": True}
@@ -0,0 +1,30 @@
+from fastapi import APIRouter
+
+from ..services.admission import admission
+from ..services.cancellation import cancellation_metrics
+from ..services.image_precheck import precheck_metrics
+from ..services.image_proxy import image_cache
+from ..services.jobs import job_store
+from ..services.profiling import loop_monitor
+from ..services.resilience import upstream_stats
+from ..services.semantic_cache import query_cache
+from ..services.snapshot import recipe_snapshot
+from ..workflows.engine import workflow_stats
+
+router = APIRouter()
+
+@router.get("/metrics")
+async def metrics_endpoint():
+    """ Per-worker counters for admission, cancelled work, upstream health, caches, rejected photos, cached images, pipeline steps, background jobs and event loop lag """
+    return {
+        "semantic_cache": query_cache.stats(),
+        "recipe_snapshot": recipe_snapshot.stats(),
+        "admission": admission.stats(),
+        "cancellation": cancellation_metrics.snapshot(),
+        "image_precheck": precheck_metrics.snapshot(),
+        "image_cache": image_cache.stats(),
+        "upstreams": upstream_stats(),
+        "workflows": workflow_stats.snapshot(),
+        "jobs": job_store.stats(),
+        "event_loop": loop_monitor.stats(),
+    }
@@ -1,13 +1,126 @@
 import os
+import tempfile
 from dotenv import load_dotenv
 
 load_dotenv()
 
+def _optional_int(name: str):
+    value = os.getenv(name)
+    return int(value) if value else None
+
 class Config:
     SPOONACULAR_API_KEY = os.getenv("SPOONACULAR_API_KEY")
+    SPOONACULAR_BASE_URL = os.getenv("SPOONACULAR_BASE_URL", "https://api.spoonacular.com") # point at a local stand-in for tests and benchmarks
     GEMINI_API_KEY=os.getenv("GEMINI_API_KEY")
     ALLOWED_ORIGINS = [
         "http://localhost:3000",
     ]
 
-config = Config()
\ No newline at end of file
+    # server
+    ENV = os.getenv("ENV", "development") # "development" runs the reloader, "production" runs workers
+    HOST = os.getenv("HOST", "0.0.0.0" if ENV == "production" else "localhost") # production listens on every interface, e.g. inside a container
+    PORT = int(os.getenv("PORT", "8000"))
+    WORKERS = int(os.getenv("WORKERS", str(os.cpu_count() or 1)))
+    LOOP = os.getenv("UVICORN_LOOP", "uvloop") # "uvloop", "asyncio" or "auto"
+    HTTP = os.getenv("UVICORN_HTTP", "httptools") # "httptools", "h11" or "auto"
+    KEEPALIVE_TIMEOUT = int(os.getenv("KEEPALIVE_TIMEOUT", "5")) # seconds an idle keep-alive connection is held
+    BACKLOG = int(os.getenv("BACKLOG", "2048")) # pending connections queued by the kernel
+    LIMIT_CONCURRENCY = _optional_int("LIMIT_CONCURRENCY") # per-worker connection cap before 503s
+    LIMIT_MAX_REQUESTS = _optional_int("LIMIT_MAX_REQUESTS") # recycle a worker after this many requests
+    GRACEFUL_SHUTDOWN_TIMEOUT = int(os.getenv("GRACEFUL_SHUTDOWN_TIMEOUT", "30")) # seconds to drain in-flight streams
+    ACCESS_LOG = os.getenv("ACCESS_LOG", "false").lower() == "true"
+    WARM_UP = os.getenv("WARM_UP", "false").lower() == "true" # build services and agents at startup instead of first use
+
+    # admission control
+    ADMISSION_VISION_CONCURRENCY = int(os.getenv("ADMISSION_VISION_CONCURRENCY", "4")) # fridge pipelines per worker
+    ADMISSION_SEARCH_CONCURRENCY = int(os.getenv("ADMISSION_SEARCH_CONCURRENCY", "16")) # recipe searches per worker
+    ADMISSION_QA_CONCURRENCY = int(os.getenv("ADMISSION_QA_CONCURRENCY", "32")) # Q&A answers per worker
+    ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "64")) # waiting requests per pool before 503
+    ADMISSION_MAX_QUEUE_PER_CLIENT = int(os.getenv("ADMISSION_MAX_QUEUE_PER_CLIENT", "4")) # waiting requests per client before 429
+    ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "30")) # seconds a request may wait for a slot
+
+    # upstream resilience
+    REQUEST_DEADLINE = float(os.getenv("REQUEST_DEADLINE", "60")) # seconds budget for a whole chat request
+    UPSTREAM_TIMEOUT = float(os.getenv("UPSTREAM_TIMEOUT", "10")) # per-attempt cap for Spoonacular calls
+    GEMINI_TIMEOUT = float(os.getenv("GEMINI_TIMEOUT", "30")) # per-call cap for Gemini calls
+    RETRY_ATTEMPTS = int(os.getenv("RETRY_ATTEMPTS", "2")) # retries for idempotent GETs
+    RETRY_BASE_DELAY = float(os.getenv("RETRY_BASE_DELAY", "0.2")) # first backoff ceiling in seconds, doubled per retry
+    RETRY_MAX_DELAY = float(os.getenv("RETRY_MAX_DELAY", "2"))
+    HEDGE_REQUESTS = os.getenv("HEDGE_REQUESTS", "false").lower() == "true" # race a duplicate GET after the p95 latency
+    HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "0.95"))
+    HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20")) # latency samples needed before hedging
+    BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5")) # consecutive failures that open a circuit
+    BREAKER_RESET_TIMEOUT = float(os.getenv("BREAKER_RESET_TIMEOUT", "30")) # seconds before a trial call is let through
+    STALE_CACHE_SIZE = int(os.getenv("STALE_CACHE_SIZE", "128")) # last good responses kept per service for fallback
+
+    # semantic cache for query extraction
+    SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "true").lower() == "true"
+    SEMANTIC_CACHE_SIZE = int(os.getenv("SEMANTIC_CACHE_SIZE", "4096")) # cached queries per worker
+    SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.85")) # cosine similarity needed to reuse params; calibrate with benchmarks/bench_semantic_cache.py
+    SEMANTIC_CACHE_DIM = int(os.getenv("SEMANTIC_CACHE_DIM", "1024")) # hashed embedding width
+
+    # intent routing: "combined" classifies and extracts search params in one LLM call,
+    # "classify" runs the free-text classifier followed by the query extractor
+    INTENT_ROUTER = os.getenv("INTENT_ROUTER", "combined")
+
+    # fridge photos
+    MAX_IMAGES_PER_REQUEST = int(os.getenv("MAX_IMAGES_PER_REQUEST", "6")) # e.g. fridge, freezer and pantry shots
+    VISION_BATCH_IMAGES = int(os.getenv("VISION_BATCH_IMAGES", "4")) # images per vision request; larger sets run as concurrent requests
+    VISION_MAX_SIDE = int(os.getenv("VISION_MAX_SIDE", "1536")) # photos are decoded and sent at most this many pixels on the long edge
+    VISION_JPEG_QUALITY = int(os.getenv("VISION_JPEG_QUALITY", "85"))
+    IMAGE_MEMORY_LIMIT_MB = int(os.getenv("IMAGE_MEMORY_LIMIT_MB", "64")) # per-request ceiling for image buffers and decodes
+    IMAGE_PRECHECK = os.getenv("IMAGE_PRECHECK", "true").lower() == "true" # reject unusable photos locally before the vision call
+    IMAGE_PRECHECK_SIDE = int(os.getenv("IMAGE_PRECHECK_SIDE", "512")) # thumbnail size the checks run on
+    IMAGE_MIN_SIDE = int(os.getenv("IMAGE_MIN_SIDE", "200")) # shortest acceptable edge of the original photo, in pixels
+    IMAGE_BLUR_THRESHOLD = float(os.getenv("IMAGE_BLUR_THRESHOLD", "10")) # Laplacian variance below which a photo is too blurry
+    IMAGE_CLASSIFIER_PATH = os.getenv("IMAGE_CLASSIFIER_PATH") # optional .npz logistic regression for "is this a fridge photo"
+
+    # recipe image proxy: serves resized WebP copies of Spoonacular images from a disk cache
+    IMAGE_PROXY = os.getenv("IMAGE_PROXY", "false").lower() == "true" # rewrite recipe image URLs to /api/images
+    IMAGE_PROXY_BASE_URL = os.getenv("IMAGE_PROXY_BASE_URL", "") # public origin of this API, e.g. http://localhost:8000; required with IMAGE_PROXY
+    IMAGE_UPSTREAM_BASE_URL = os.getenv("IMAGE_UPSTREAM_BASE_URL", "https://img.spoonacular.com")
+    IMAGE_CACHE_DIR = os.getenv("IMAGE_CACHE_DIR", os.path.join(tempfile.gettempdir(), "recipe-images"))
+    IMAGE_CACHE_MAX_MB = int(os.getenv("IMAGE_CACHE_MAX_MB", "256")) # least recently used variants are deleted past this
+    IMAGE_RESIZE_WORKERS = int(os.getenv("IMAGE_RESIZE_WORKERS", "2")) # threads decoding and encoding images
+    IMAGE_PROXY_QUALITY = int(os.getenv("IMAGE_PROXY_QUALITY", "80")) # WebP quality
+    IMAGE_MISS_TTL = float(os.getenv("IMAGE_MISS_TTL", "300")) # seconds a recipe without an upstream image is answered 404 from memory
+
+    # "spoonacular" fetches nutrition with recipe details; "local" skips it and estimates macros from the ingredients
+    NUTRITION_SOURCE = os.getenv("NUTRITION_SOURCE", "spoonacular")
+    NUTRITION_MIN_COVERAGE = float(os.getenv("NUTRITION_MIN_COVERAGE", "0.6")) # share of ingredients matched needed to report an estimate
+
+    # workflow engine
+    WORKFLOW_MEMO_SIZE = int(os.getenv("WORKFLOW_MEMO_SIZE", "1024")) # memoized outputs kept per step
+
+    # recipe snapshot written by warm_cache.py, served before calling Spoonacular
+    RECIPE_SNAPSHOT_PATH = os.getenv("RECIPE_SNAPSHOT_PATH")
+
+    # chat WebSocket
+    WS_MAX_IN_FLIGHT = int(os.getenv("WS_MAX_IN_FLIGHT", "4")) # concurrent requests per connection
+
+    # profiling and event loop monitoring
+    PROFILING_TOKEN = os.getenv("PROFILING_TOKEN") # enables per-request profiles and /api/admin/profile; unset disables both
+    PROFILING_DIR = os.getenv("PROFILING_DIR", os.path.join(tempfile.gettempdir(), "recipe-agent-profiles")) # shared by the workers on a host
+    PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "50")) # per-request profiles kept on disk
+    PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "60")) # longest window /api/admin/profile samples
+    PROFILE_SAMPLE_INTERVAL_MS = float(os.getenv("PROFILE_SAMPLE_INTERVAL_MS", "5"))
+    LOOP_LAG_THRESHOLD_MS = float(os.getenv("LOOP_LAG_THRESHOLD_MS", "0")) # log callbacks blocking the event loop this long, e.g. 100; 0 (default) disables
+    LOOP_LAG_INTERVAL_MS = float(os.getenv("LOOP_LAG_INTERVAL_MS", "50")) # lag monitor heartbeat
+
+    # background jobs: fridge analyses outlive the connection and can be resumed
+    FRIDGE_JOBS = os.getenv("FRIDGE_JOBS", "false").lower() == "true" # run photo requests on /api/chat as jobs; off by default, since a job keeps running after its client hangs up
+    JOB_DB_PATH = os.getenv("JOB_DB_PATH") # SQLite event log shared by the workers on a host; in-memory per worker when unset
+    JOB_TTL = float(os.getenv("JOB_TTL", "600")) # seconds a finished job's events stay replayable
+    JOB_MAX_JOBS = int(os.getenv("JOB_MAX_JOBS", "1000")) # jobs kept in memory per worker
+    JOB_MAX_MB = float(os.getenv("JOB_MAX_MB", "64")) # JSON size of the events kept in memory per worker, across jobs
+    JOB_MAX_EVENTS = int(os.getenv("JOB_MAX_EVENTS", "200")) # events kept per job; older ones are dropped
+    JOB_MAX_RUNTIME = float(os.getenv("JOB_MAX_RUNTIME", "120")) # seconds a job may run, queueing included, before it is stopped
+    JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "0.25")) # seconds between reads when tailing another worker's job
+
+    # batch chat
+    BATCH_MAX_MESSAGES = int(os.getenv("BATCH_MAX_MESSAGES", "500"))
+    BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8")) # pipelines running at once per batch
+    BULK_MAX_IDS = int(os.getenv("BULK_MAX_IDS", "100")) # recipe ids per informationBulk call
+    BULK_COALESCE_WINDOW = float(os.getenv("BULK_COALESCE_WINDOW", "0.05")) # seconds to gather ids before fetching
+
+config = Config()
@@ -1,15 +1,36 @@
-from typing import Optional, List, Any, Dict
+from typing import Optional, List, Any, Dict, Literal
 from pydantic import BaseModel
 
 class ChatMessage(BaseModel):
     message: Optional[str] = None
     image_base64: Optional[str] = None
+    images_base64: Optional[List[str]] = None # several photos (fridge, freezer, pantry) analyzed together
+
+    @property
+    def images(self) -> List[str]:
+        """ All images sent with the message, single and multi-photo fields combined """
+        return ([self.image_base64] if self.image_base64 else []) + (self.images_base64 or [])
 
 class StreamResponse(BaseModel):
-    type: str # "step", "complete", "error"
+    type: str # "queued", "step", "complete", "error", "cancelled"
     step: Optional[str] = None
     status: Optional[str] = None
     message: Optional[str] = None
     recipes: Optional[List[dict]] = None
     data: Optional[Dict[str, Any]] = None
-    summary: Optional[Dict[str, Any]] = None 
\ No newline at end of file
+    summary: Optional[Dict[str, Any]] = None
+
+class BatchStreamResponse(StreamResponse):
+    index: int # position of the message in the batch request
+
+class ChatFrame(ChatMessage):
+    """ A client frame on the chat WebSocket: start a request, or cancel one by id """
+    type: Literal["chat", "cancel"] = "chat"
+    id: str # chosen by the client, unique among its requests in flight
+
+class ChatFrameResponse(StreamResponse):
+    id: Optional[str] = None # request the event belongs to; None for connection-level errors
+
+class JobStreamResponse(StreamResponse):
+    job_id: str
+    seq: int # position in the job's event log; resume with ?after=<seq>
@@ -1,12 +1,17 @@
-from dataclasses import dataclass
-from typing import Optional, List, Dict
+from dataclasses import dataclass, field
+from typing import Optional, List, Dict, Union
 from httpx import AsyncClient
 
 from ..models.ingredients import ExtractedIngredients
-from ..models.recipe import RecipeDetails
+from ..models.recipe import RecipeDetails, RecipeSearchParams
 
 from ..services.spoonacular import SpoonacularService
 from ..services.gemini import GeminiService
+from ..services.registry import services
+from ..services.cancellation import CancelToken
+from ..services.images import ImageUpload
+from ..services.resilience import Deadline
+from ..config import config
 
 @dataclass
 class Deps:
@@ -18,14 +23,24 @@ class Deps:
     has_image: bool = False
     user_query: Optional[str] = None
 
+    # tripped when the client disconnects
+    cancel_token: Optional[CancelToken] = None
+    # time budget every upstream call derives its timeout from
+    deadline: Optional[Deadline] = None
+
     # image workflow state
-    image_base64: Optional[str] = None # fridge image
+    image_base64: Optional[Union[str, List[Union[str, ImageUpload]]]] = None # fridge image, or several kitchen photos
     extracted_ingredients: Optional[ExtractedIngredients] = None # ingredients extracted from image
     formatted_ingredients: Optional[str] = None # string with ingredients selected for recipe search
     ingredient_search_results: Optional[List[Dict]] = None # recipes using formatted_ingredients
 
+    # query workflow state
+    search_params: Optional[RecipeSearchParams] = None # extracted from user_query, or supplied by the router
+    search_results: Optional[List[RecipeDetails]] = None # recipes matching search_params
+
     # shared final state
     recipe_details: Optional[List[RecipeDetails]] = None # recipe full details
+    degraded_steps: List[str] = field(default_factory=list) # steps that fell back to partial results
 
     # service instances
     _spoonacular_service: Optional[SpoonacularService] = None
@@ -34,11 +49,18 @@ class Deps:
     @property
     def spoonacular(self) -> SpoonacularService:
         if not self._spoonacular_service:
-            self._spoonacular_service = SpoonacularService(self.spoonacular_api_key)
+            # share the process-wide instance unless a different key was supplied
+            if self.spoonacular_api_key == config.SPOONACULAR_API_KEY:
+                self._spoonacular_service = services.spoonacular
+            else:
+                self._spoonacular_service = SpoonacularService(self.spoonacular_api_key)
         return self._spoonacular_service
     
     @property
     def gemini(self) -> GeminiService:
         if not self._gemini_service:
-            self._gemini_service = GeminiService(self.gemini_api_key)
+            if self.gemini_api_key == config.GEMINI_API_KEY:
+                self._gemini_service = services.gemini
+            else:
+                self._gemini_service = GeminiService(self.gemini_api_key)
         return self._gemini_service
@@ -25,6 +25,7 @@ class RecipeDetails(BaseModel):
     readyInMinutes: int = 0
     preparationMinutes: Optional[int] = None
     cookingMinutes: Optional[int] = None
+    servings: Optional[int] = None
     nutrition: NutritionInfo = Field(default_factory=NutritionInfo)
     ingredients: List[Ingredient] = Field(default_factory=list)
     summary: str = ""
@@ -82,7 +83,12 @@ class RecipeDetails(BaseModel):
         if isinstance(v, list):
             all_steps = []
             for item in v:
-                if isinstance(item, dict):
+                if isinstance(item, InstructionStep):
+                    all_steps.append(item)
+                elif isinstance(item, dict) and 'step' in item and 'steps' not in item:
+                    # already flattened, e.g. a RecipeDetails read back from a snapshot
+                    all_steps.append(InstructionStep(**item))
+                elif isinstance(item, dict):
                     steps = item.get('steps', [])
                     for step in steps:
                         if isinstance(step, dict):
@@ -0,0 +1,160 @@
+import asyncio
+from collections import OrderedDict, deque
+from typing import AsyncGenerator, Deque, Dict, Optional
+
+import logfire
+
+from ..config import config
+
+class AdmissionRejected(Exception):
+    """ Raised when a pipeline cannot even be queued """
+    def __init__(self, status_code: int, message: str):
+        super().__init__(message)
+        self.status_code = status_code
+        self.message = message
+
+class Ticket:
+    """ A request's place in an admission pool, admitted or still queued """
+    def __init__(self, pool: "AdmissionPool", client_id: str):
+        self.pool = pool
+        self.client_id = client_id
+        self.admitted = False
+        self.released = False
+        self._changed = asyncio.Event()
+
+    async def wait(self, timeout: Optional[float] = None) -> AsyncGenerator[int, None]:
+        """
+        Yield this ticket's queue position (1-based) every time it changes,
+        returning once admitted. Raises AdmissionRejected on timeout.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout if timeout else None
+        last_position = None
+        while not self.admitted:
+            position = self.pool.position(self)
+            if position != last_position:
+                last_position = position
+                yield position
+            self._changed.clear()
+            remaining = deadline - loop.time() if deadline else None
+            try:
+                await asyncio.wait_for(self._changed.wait(), remaining)
+            except asyncio.TimeoutError:
+                if self.admitted:
+                    return
+                self.release()
+                raise AdmissionRejected(503, "The server is busy. Please try again in a moment.")
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self.pool.release(self)
+
+class AdmissionPool:
+    """
+    Bounded concurrency for one kind of pipeline with per-client fair queuing.
+
+    Waiting tickets are kept in one FIFO per client and admitted round-robin
+    across clients, so a client uploading a burst of images cannot push
+    everyone else to the back of the queue.
+    """
+    def __init__(self, name: str, concurrency: int, max_queue: int, max_queue_per_client: int):
+        self.name = name
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.max_queue_per_client = max_queue_per_client
+        self.active = 0
+        self.queued = 0
+        self.rejected = 0
+        self._queues: "OrderedDict[str, Deque[Ticket]]" = OrderedDict()
+
+    def enqueue(self, client_id: str) -> Ticket:
+        ticket = Ticket(self, client_id)
+        if self.active < self.concurrency and not self.queued:
+            self.active += 1
+            ticket.admitted = True
+            return ticket
+
+        client_queue = self._queues.get(client_id)
+        if self.queued >= self.max_queue:
+            self.rejected += 1
+            logfire.warning(f"Admission pool {self.name} full ({self.queued} queued)")
+            raise AdmissionRejected(503, "The server is busy. Please try again in a moment.")
+        if client_queue and len(client_queue) >= self.max_queue_per_client:
+            self.rejected += 1
+            raise AdmissionRejected(429, "Too many requests in progress. Please wait for them to finish.")
+
+        if client_queue is None:
+            client_queue = self._queues[client_id] = deque()
+        client_queue.append(ticket)
+        self.queued += 1
+        return ticket
+
+    def release(self, ticket: Ticket):
+        if ticket.admitted:
+            self.active -= 1
+        else:
+            client_queue = self._queues.get(ticket.client_id)
+            if client_queue and ticket in client_queue:
+                client_queue.remove(ticket)
+                self.queued -= 1
+                if not client_queue:
+                    del self._queues[ticket.client_id]
+        self._dispatch()
+
+    def position(self, ticket: Ticket) -> int:
+        """ Position of a queued ticket in round-robin admission order """
+        position = 0
+        for round_index in range(len(self._queues.get(ticket.client_id, ()))):
+            for client_queue in self._queues.values():
+                if round_index < len(client_queue):
+                    position += 1
+                    if client_queue[round_index] is ticket:
+                        return position
+        return position
+
+    def _dispatch(self):
+        while self.active < self.concurrency and self._queues:
+            client_id, client_queue = next(iter(self._queues.items()))
+            ticket = client_queue.popleft()
+            del self._queues[client_id]
+            if client_queue:
+                # served clients go to the back of the rotation
+                self._queues[client_id] = client_queue
+            self.queued -= 1
+            self.active += 1
+            ticket.admitted = True
+            ticket._changed.set()
+        # positions shift whenever the queue moves
+        for client_queue in self._queues.values():
+            for ticket in client_queue:
+                ticket._changed.set()
+
+class AdmissionController:
+    """ Routes requests to the vision, search or QA pool """
+    def __init__(self):
+        self.pools: Dict[str, AdmissionPool] = {
+            "vision": AdmissionPool(
+                "vision", config.ADMISSION_VISION_CONCURRENCY,
+                config.ADMISSION_MAX_QUEUE, config.ADMISSION_MAX_QUEUE_PER_CLIENT
+            ),
+            "search": AdmissionPool(
+                "search", config.ADMISSION_SEARCH_CONCURRENCY,
+                config.ADMISSION_MAX_QUEUE, config.ADMISSION_MAX_QUEUE_PER_CLIENT
+            ),
+            "qa": AdmissionPool(
+                "qa", config.ADMISSION_QA_CONCURRENCY,
+                config.ADMISSION_MAX_QUEUE, config.ADMISSION_MAX_QUEUE_PER_CLIENT
+            ),
+        }
+
+    def enqueue(self, pool: str, client_id: str) -> Ticket:
+        return self.pools[pool].enqueue(client_id)
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        return {
+            name: {"active": pool.active, "queued": pool.queued, "rejected": pool.rejected}
+            for name, pool in self.pools.items()
+        }
+
+admission = AdmissionController()
@@ -0,0 +1,149 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+import logfire
+
+from .spoonacular import SpoonacularService
+from .resilience import Deadline
+from ..models.recipe import RecipeDetails, RecipeSearchParams
+from ..config import config
+
+class BatchSpoonacularService(SpoonacularService):
+    """
+    Spoonacular client scoped to one batch request.
+
+    Identical searches issued by different pipelines share one upstream call,
+    and detail lookups are coalesced: ids requested within BULK_COALESCE_WINDOW
+    are fetched together in informationBulk calls of up to BULK_MAX_IDS ids.
+    """
+    def __init__(
+        self,
+        api_key: str,
+        max_ids: int = config.BULK_MAX_IDS,
+        window: float = config.BULK_COALESCE_WINDOW
+    ):
+        super().__init__(api_key)
+        self.max_ids = max_ids
+        self.window = window
+        self._searches: Dict[tuple, asyncio.Task] = {}
+        self._details: Dict[int, asyncio.Future] = {}
+        self._queued: List[int] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._flushes: Set[asyncio.Task] = set() # referenced until done, so they are not garbage collected mid-fetch
+        self.upstream_calls = 0
+
+    async def _single_flight(self, key: tuple, call: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._searches.get(key)
+        if task is None:
+            self.upstream_calls += 1
+            task = asyncio.ensure_future(call())
+            self._searches[key] = task
+        try:
+            return await asyncio.shield(task)
+        except Exception:
+            # let a later identical request retry
+            if self._searches.get(key) is task:
+                del self._searches[key]
+            raise
+
+    async def search_by_ingredients(
+        self,
+        ingredients: str,
+        number: int = 20,
+        ranking: int = 2,
+        deadline: Optional[Deadline] = None
+    ) -> List[Dict]:
+        return await self._single_flight(
+            ("findByIngredients", ingredients, number, ranking),
+            lambda: SpoonacularService.search_by_ingredients(self, ingredients, number, ranking, deadline)
+        )
+
+    async def complex_search(self, params: RecipeSearchParams, deadline: Optional[Deadline] = None) -> List[RecipeDetails]:
+        return await self._single_flight(
+            ("complexSearch", params.model_dump_json()),
+            lambda: SpoonacularService.complex_search(self, params, deadline)
+        )
+
+    async def get_recipe_details_bulk(
+        self,
+        recipe_ids: List[int],
+        deadline: Optional[Deadline] = None
+    ) -> List[RecipeDetails]:
+        # coalesced fetches serve many requests, so they run on the service's own timeouts
+        if not recipe_ids:
+            return []
+
+        loop = asyncio.get_running_loop()
+        futures = []
+        for recipe_id in recipe_ids:
+            future = self._details.get(recipe_id)
+            if future is None:
+                future = loop.create_future()
+                self._details[recipe_id] = future
+                self._queued.append(recipe_id)
+            futures.append(future)
+
+        if len(self._queued) >= self.max_ids:
+            self._schedule_flush(0)
+        elif self._queued and self._flush_handle is None:
+            self._schedule_flush(self.window)
+
+        results = await asyncio.gather(*futures, return_exceptions=True)
+        for result in results:
+            # including the CancelledError of a lookup cancelled by aclose
+            if isinstance(result, BaseException):
+                raise result
+        # recipes that failed to parse upstream resolve to None
+        return [recipe for recipe in results if recipe is not None]
+
+    def _schedule_flush(self, delay: float):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+        loop = asyncio.get_running_loop()
+        self._flush_handle = loop.call_later(delay, self._start_flush)
+
+    def _start_flush(self):
+        task = asyncio.ensure_future(self._flush())
+        self._flushes.add(task)
+        task.add_done_callback(self._flush_done)
+
+    def _flush_done(self, task: asyncio.Task):
+        self._flushes.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logfire.error(f"Coalesced informationBulk flush failed: {str(task.exception()) or type(task.exception()).__name__}")
+
+    async def aclose(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        for task in self._flushes:
+            task.cancel()
+        await asyncio.gather(*self._flushes, return_exceptions=True)
+        # lookups still waiting on a queued or cancelled fetch are cancelled with it
+        for future in self._details.values():
+            future.cancel()
+        await super().aclose()
+
+    async def _flush(self):
+        self._flush_handle = None
+        queued, self._queued = self._queued, []
+        chunks = [queued[i:i + self.max_ids] for i in range(0, len(queued), self.max_ids)]
+        await asyncio.gather(*(self._fetch_chunk(chunk) for chunk in chunks))
+
+    async def _fetch_chunk(self, chunk: List[int]):
+        self.upstream_calls += 1
+        try:
+            recipes = await SpoonacularService.get_recipe_details_bulk(self, chunk)
+        except Exception as e:
+            for recipe_id in chunk:
+                future = self._details.pop(recipe_id)
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        by_id = {recipe.id: recipe for recipe in recipes}
+        for recipe_id in chunk:
+            future = self._details[recipe_id]
+            if not future.done():
+                future.set_result(by_id.get(recipe_id))
+        logfire.info(f"Coalesced informationBulk fetched {len(recipes)}/{len(chunk)} recipes")
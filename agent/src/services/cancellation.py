@@ -0,0 +1,113 @@
+import asyncio
+import threading
+from collections import Counter
+from typing import Any, AsyncGenerator, AsyncIterator, Dict, Optional
+
+import logfire
+from starlette.requests import Request
+
+class OperationCancelled(asyncio.CancelledError):
+    """ Raised inside worker threads when the request that started them is gone """
+
+class CancelToken:
+    """
+    Cooperative cancellation for work the event loop cannot interrupt, such as
+    blocking SDK calls running in threads. Thread-side code checks the token
+    before each expensive step.
+    """
+    def __init__(self):
+        self._event = threading.Event()
+        self.reason: Optional[str] = None
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self, reason: str = "cancelled"):
+        if not self._event.is_set():
+            self.reason = reason
+            self._event.set()
+
+    def raise_if_cancelled(self):
+        if self._event.is_set():
+            raise OperationCancelled(self.reason)
+
+class CancellationMetrics:
+    """ Counters for work avoided because the client went away """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters: Counter = Counter()
+        self.steps_cancelled: Counter = Counter()
+
+    def record(self, name: str, count: int = 1):
+        with self._lock:
+            self.counters[name] += count
+
+    def record_step(self, step: str):
+        with self._lock:
+            self.steps_cancelled[step] += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self.counters, "steps_cancelled": dict(self.steps_cancelled)}
+
+cancellation_metrics = CancellationMetrics()
+
+async def _wait_for_disconnect(request: Request):
+    while True:
+        message = await request.receive()
+        if message["type"] == "http.disconnect":
+            return
+
+async def stream_until_disconnect(
+    request: Request,
+    events: AsyncIterator[dict],
+    token: CancelToken
+) -> AsyncGenerator[dict, None]:
+    """
+    Relay pipeline events while watching the connection. If the client
+    disconnects first, the pipeline task is cancelled (aborting pending
+    Gemini/Spoonacular awaits) and the token is tripped so threaded calls that
+    have not started yet are skipped.
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+    done = object()
+    current_step = {"name": None}
+
+    async def pump():
+        try:
+            async for event in events:
+                if event.get("type") == "step":
+                    current_step["name"] = event.get("step") if event.get("status") == "in_progress" else None
+                await queue.put(event)
+        finally:
+            await queue.put(done)
+
+    pipeline = asyncio.create_task(pump())
+    watcher = asyncio.create_task(_wait_for_disconnect(request))
+    getter = None
+    try:
+        while True:
+            getter = asyncio.create_task(queue.get())
+            finished, _ = await asyncio.wait({getter, watcher}, return_when=asyncio.FIRST_COMPLETED)
+            if getter not in finished:
+                return
+            event = getter.result()
+            if event is done:
+                # surface pipeline errors exactly as the direct iteration did
+                await pipeline
+                return
+            yield event
+    finally:
+        # reached early either through our watcher or because the server
+        # closed the stream after noticing the disconnect itself
+        watcher.cancel()
+        if getter:
+            getter.cancel()
+        if not pipeline.done():
+            token.cancel("client disconnected")
+            pipeline.cancel()
+            cancellation_metrics.record("pipelines_cancelled")
+            if current_step["name"]:
+                cancellation_metrics.record_step(current_step["name"])
+            logfire.info(f"Client disconnected, cancelled pipeline at step {current_step['name']}")
@@ -1,26 +1,62 @@
-import base64
-import io
+import asyncio
 import re
-from PIL import Image
-import google.generativeai as genai
+from typing import List, Optional, Union
 import logfire
 from ..models.ingredients import ExtractedIngredients
+from .cancellation import CancelToken, cancellation_metrics
+from .image_precheck import ImageRejected, check_image
+from .images import MB, ImageUpload, MemoryBudget
+from .resilience import Deadline, call_upstream
+from ..config import config
 
 class GeminiService:
     def __init__(self, api_key: str):
         if not api_key:
             raise ValueError("Gemini API key is required")
             
+        # imported here so that importing this module stays cheap
+        import google.generativeai as genai
+
         self.api_key = api_key
         genai.configure(api_key=api_key)
         self.model = genai.GenerativeModel('gemini-2.5-flash')
 
-    async def answer_question(self, question: str) -> str:
+    def _generate(self, contents, cancel_token: Optional[CancelToken], timeout: float):
+        # runs in a worker thread; skip the upstream call if the request is already gone
+        if cancel_token and cancel_token.cancelled:
+            cancellation_metrics.record("gemini_calls_skipped")
+            cancel_token.raise_if_cancelled()
+        return self.model.generate_content(contents, request_options={"timeout": timeout})
+
+    async def _generate_async(
+        self,
+        name: str,
+        contents,
+        cancel_token: Optional[CancelToken] = None,
+        deadline: Optional[Deadline] = None
+    ):
+        # generation is not retried: it is slow and billed, so only timeout and breaker apply.
+        # The SDK gets the same timeout, so a thread abandoned by wait_for ends soon after
+        # instead of holding a slot in the default executor.
+        return await call_upstream(
+            name,
+            lambda timeout: asyncio.to_thread(self._generate, contents, cancel_token, timeout),
+            deadline,
+            idempotent=False,
+            cap=config.GEMINI_TIMEOUT
+        )
+
+    async def answer_question(
+        self,
+        question: str,
+        cancel_token: Optional[CancelToken] = None,
+        deadline: Optional[Deadline] = None
+    ) -> str:
         """
         Use Gemini to answer a general cooking question.
         """
         try:
-            response = self.model.generate_content(question)
+            response = await self._generate_async("gemini.text", question, cancel_token, deadline)
             if not response.text:
                 raise Exception("Gemini returned empty response")
             return response.text.strip()
@@ -28,133 +64,183 @@ class GeminiService:
             logfire.error(f"Gemini Q&A error: {str(e)}")
             raise Exception(f"Failed to answer question: {str(e)}")
 
+    async def _analyze_images(
+        self,
+        images: List[ImageUpload],
+        cancel_token: Optional[CancelToken] = None,
+        deadline: Optional[Deadline] = None
+    ) -> str:
+        """ One vision request covering all given images; returns the raw item list """
+        try:
+            if len(images) == 1:
+                intro = "Analyze this refrigerator image and list EVERY SINGLE visible item."
+            else:
+                intro = (
+                    f"Analyze these {len(images)} images of the same kitchen (fridge, freezer, pantry) "
+                    "and list EVERY SINGLE item visible in any of them. List each item only once."
+                )
+            prompt = intro + """
+
+            IMPORTANT: Just list the items, one per line. No headers, no sections, no explanations.
+            Don't say "Top shelf" or "Middle shelf" - just list the actual food items.
+            
+            Be SPECIFIC with names:
+            - Include brand names when visible (e.g., "Heinz ketchup" not just "ketchup")
+            - Be specific about types (e.g., "whole milk" not just "milk")
+            - Name specific fruits/vegetables (e.g., "red bell pepper" not just "pepper")
+            
+            List EVERYTHING you can see:
+            - Every condiment
+            - Every dairy product
+            - Every fruit (individually)
+            - Every vegetable (individually)
+            - Every beverage
+            - Every jar, container, package
+            - Every other food item
+            
+            Format: Just the item name, one per line. Nothing else."""
+
+            response = await self._generate_async("gemini.vision", [prompt, *(image.blob() for image in images)], cancel_token, deadline)
+
+            if not response.text:
+                raise Exception("Gemini returned empty response")
+            return response.text
+
+        except Exception as e:
+            error_msg = str(e).lower()
+
+            # handle specific Gemini API errors
+            if "quota" in error_msg or "limit" in error_msg:
+                logfire.error("Gemini API quota exceeded")
+                raise Exception("Image analysis quota exceeded. Please try again later.")
+            elif "api_key" in error_msg or "unauthorized" in error_msg:
+                logfire.error("Gemini API key invalid")
+                raise Exception("Invalid API configuration. Please contact support.")
+            elif "safety" in error_msg:
+                logfire.warning("Gemini safety filter triggered")
+                raise Exception("Unable to analyze this image. Please try a different image.")
+            else:
+                logfire.error(f"Gemini API error: {str(e)}")
+                raise Exception(f"Failed to analyze image: {str(e)}")
+
+    @staticmethod
+    def _parse_ingredients(text: str) -> List[str]:
+        ingredients = []
+        lines = text.strip().split('\n')
+
+        for line in lines:
+            # skip empty lines
+            if not line.strip():
+                continue
+
+            # remove common prefixes and formatting
+            cleaned = re.sub(r'^[\d\-\•\*\.\s]+', '', line).strip()
+
+            # skip header-like lines
+            skip_patterns = [
+                'shelf', 'compartment', 'drawer', 'section',
+                'ingredients:', 'items:', 'contents:',
+                'here are', 'i can see', 'visible items'
+            ]
+            if any(pattern in cleaned.lower() for pattern in skip_patterns):
+                continue
+
+            # only add valid ingredient lines
+            if cleaned and len(cleaned) > 2 and any(c.isalpha() for c in cleaned):
+                ingredients.append(cleaned)
+        return ingredients
+
+    @staticmethod
+    def _dedupe_ingredients(ingredients: List[str]) -> List[str]:
+        """ Merge items seen in several photos, keeping the first spelling """
+        seen = set()
+        unique = []
+        for ingredient in ingredients:
+            key = " ".join(ingredient.lower().split())
+            if key not in seen:
+                seen.add(key)
+                unique.append(ingredient)
+        return unique
+
+    @staticmethod
+    def _prepare_image(image: ImageUpload, label: str, budget: MemoryBudget):
+        # runs in a worker thread; a photo that fails the quick local check never reaches Gemini.
+        # Chat uploads were checked on arrival, before taking an admission slot
+        if config.IMAGE_PRECHECK and not image.checked:
+            check_image(image, label)
+        image.prepare(config.VISION_MAX_SIDE, budget)
+
     async def extract_ingredients_from_image(
         self, 
-        image_base64: str
+        image_base64: Union[str, ImageUpload, List[Union[str, ImageUpload]]],
+        cancel_token: Optional[CancelToken] = None,
+        deadline: Optional[Deadline] = None
     ) -> ExtractedIngredients:
         """
-        Extract ingredients from fridge image using Gemini Vision
+        Extract ingredients from one or more kitchen images using Gemini Vision
         
         Args:
             image_base64: Base64 encoded image string (with or without data URL prefix)
+                or already decoded ImageUpload, or a list of them, e.g. fridge, freezer and
+                pantry photos. Uploads are released once the vision call is done.
+            cancel_token: Trips when the client disconnects so a queued vision call is skipped
+            deadline: Request time budget the vision call must fit in
             
         Returns:
-            ExtractedIngredients object containing list of found ingredients
+            ExtractedIngredients object containing the deduplicated ingredients from all images
             
         Raises:
             Exception with user-friendly error messages
         """
+        images_base64 = list(image_base64) if isinstance(image_base64, list) else [image_base64]
         with logfire.span("extract_ingredients_from_image") as span:
             try:
                 # validate input
-                if not image_base64:
+                if not images_base64 or not all(images_base64):
                     raise ValueError("No image data provided")
-                
-                # decode base64 image
-                try:
-                    # handle data URL format
-                    if ',' in image_base64 and image_base64.startswith('data:'):
-                        image_base64 = image_base64.split(',')[1]
-                    
-                    # clean and pad base64 string
-                    image_base64 = image_base64.strip()
-                    missing_padding = len(image_base64) % 4
-                    if missing_padding:
-                        image_base64 += '=' * (4 - missing_padding)
-                    
-                    image_bytes = base64.b64decode(image_base64)
-                    
-                except Exception as e:
-                    logfire.error(f"Base64 decoding failed: {str(e)}")
-                    raise Exception("Invalid image format. Please ensure the image is properly encoded.")
-                
-                # open and validate image
-                try:
-                    image = Image.open(io.BytesIO(image_bytes))
-                    
-                    # log image details
-                    span.set_attribute("image_format", image.format)
-                    span.set_attribute("image_size", f"{image.width}x{image.height}")
-                    logfire.info(f"Processing {image.format} image: {image.width}x{image.height}")
-                    
-                except Exception as e:
-                    logfire.error(f"Image processing failed: {str(e)}")
-                    raise Exception("Unable to process the image. Please ensure it's a valid image file.")
-                
-                # generate content with gemini
-                try:
-                    prompt = """Analyze this refrigerator image and list EVERY SINGLE visible item.
+                if len(images_base64) > config.MAX_IMAGES_PER_REQUEST:
+                    raise Exception(
+                        f"Too many images. Please send at most {config.MAX_IMAGES_PER_REQUEST} photos at a time."
+                    )
+                span.set_attribute("image_count", len(images_base64))
 
-                    IMPORTANT: Just list the items, one per line. No headers, no sections, no explanations.
-                    Don't say "Top shelf" or "Middle shelf" - just list the actual food items.
-                    
-                    Be SPECIFIC with names:
-                    - Include brand names when visible (e.g., "Heinz ketchup" not just "ketchup")
-                    - Be specific about types (e.g., "whole milk" not just "milk")
-                    - Name specific fruits/vegetables (e.g., "red bell pepper" not just "pepper")
-                    
-                    List EVERYTHING you can see:
-                    - Every condiment
-                    - Every dairy product
-                    - Every fruit (individually)
-                    - Every vegetable (individually)
-                    - Every beverage
-                    - Every jar, container, package
-                    - Every other food item
-                    
-                    Format: Just the item name, one per line. Nothing else."""
-                    
-                    response = self.model.generate_content([prompt, image])
-                    
-                    if not response.text:
-                        raise Exception("Gemini returned empty response")
-                    
-                except Exception as e:
-                    error_msg = str(e).lower()
-                    
-                    # handle specific Gemini API errors
-                    if "quota" in error_msg or "limit" in error_msg:
-                        logfire.error("Gemini API quota exceeded")
-                        raise Exception("Image analysis quota exceeded. Please try again later.")
-                    elif "api_key" in error_msg or "unauthorized" in error_msg:
-                        logfire.error("Gemini API key invalid")
-                        raise Exception("Invalid API configuration. Please contact support.")
-                    elif "safety" in error_msg:
-                        logfire.warning("Gemini safety filter triggered")
-                        raise Exception("Unable to analyze this image. Please try a different image.")
-                    else:
-                        logfire.error(f"Gemini API error: {str(e)}")
-                        raise Exception(f"Failed to analyze image: {str(e)}")
+                images = [
+                    image if isinstance(image, ImageUpload) else ImageUpload.from_base64(image)
+                    for image in images_base64
+                ]
+                # keep no references to the base64 text past decoding
+                del images_base64, image_base64
+                # check and decode at reduced resolution in parallel worker threads, within the request's memory ceiling
+                budget = MemoryBudget(config.IMAGE_MEMORY_LIMIT_MB * MB)
+                budget.reserve(sum(image.nbytes for image in images))
+                labels = [f"Photo {i}" if len(images) > 1 else "Photo" for i in range(1, len(images) + 1)]
+                await asyncio.gather(*(
+                    asyncio.to_thread(self._prepare_image, image, label, budget)
+                    for image, label in zip(images, labels)
+                ))
+                span.set_attribute("image_size", ", ".join(f"{image.width}x{image.height}" for image in images))
+
+                # batch images into as few vision requests as allowed, run concurrently
+                size = max(1, config.VISION_BATCH_IMAGES)
+                try:
+                    texts = await asyncio.gather(*(
+                        self._analyze_images(images[i:i + size], cancel_token, deadline)
+                        for i in range(0, len(images), size)
+                    ))
+                finally:
+                    # the compressed buffers are not needed past the vision call
+                    for image in images:
+                        image.release()
                 
                 # parse ingredients from response
                 try:
-                    ingredients = []
-                    lines = response.text.strip().split('\n')
-                    
-                    for line in lines:
-                        # skip empty lines
-                        if not line.strip():
-                            continue
-                        
-                        # remove common prefixes and formatting
-                        cleaned = re.sub(r'^[\d\-\•\*\.\s]+', '', line).strip()
-                        
-                        # skip header-like lines
-                        skip_patterns = [
-                            'shelf', 'compartment', 'drawer', 'section',
-                            'ingredients:', 'items:', 'contents:',
-                            'here are', 'i can see', 'visible items'
-                        ]
-                        if any(pattern in cleaned.lower() for pattern in skip_patterns):
-                            continue
-                        
-                        # only add valid ingredient lines
-                        if cleaned and len(cleaned) > 2 and any(c.isalpha() for c in cleaned):
-                            ingredients.append(cleaned)
+                    ingredients = self._dedupe_ingredients(
+                        [ingredient for text in texts for ingredient in self._parse_ingredients(text)]
+                    )
                     
                     # log results
                     span.set_attribute("ingredients_found", len(ingredients))
-                    logfire.info(f"Extracted {len(ingredients)} ingredients from image")
+                    logfire.info(f"Extracted {len(ingredients)} ingredients from {len(images)} image(s)")
                     
                     # validate we found something
                     if not ingredients:
@@ -179,13 +265,15 @@ class GeminiService:
                 span.set_attribute("status", "error")
                 
                 # re-raise if it's already a user-friend
-                if any(msg in str(e) for msg in [
+                if isinstance(e, ImageRejected) or any(msg in str(e) for msg in [
                     "Invalid image format",
                     "Unable to process",
                     "quota exceeded",
                     "Invalid API configuration",
                     "No ingredients could be identified",
-                    "Failed to extract ingredients"
+                    "Failed to extract ingredients",
+                    "Too many images",
+                    "too large to process"
                 ]):
                     raise
                 
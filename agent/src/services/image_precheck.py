@@ -0,0 +1,161 @@
+import threading
+from collections import Counter
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+
+import logfire
+import numpy as np
+
+from .images import ImageUpload
+from ..config import config
+
+class ImageRejected(Exception):
+    """ Raised when a photo fails the local quality check; the message tells the user what to fix """
+    def __init__(self, reason: str, message: str):
+        super().__init__(message)
+        self.reason = reason
+
+@dataclass
+class ImageQuality:
+    width: int
+    height: int
+    brightness: float # mean of the grayscale thumbnail, 0-255
+    contrast: float # its standard deviation
+    dark_fraction: float # share of near-black pixels
+    bright_fraction: float # share of near-white pixels
+    sharpness: float # variance of the Laplacian
+    fridge_score: Optional[float] = None # classifier probability, when one is configured
+
+class PrecheckMetrics:
+    """ Photos rejected locally, by reason, instead of being sent to Gemini """
+    def __init__(self):
+        self.checked = 0
+        self.rejected: Counter = Counter()
+        self._lock = threading.Lock() # checks run in worker threads
+
+    def record(self, reason: Optional[str] = None):
+        with self._lock:
+            self.checked += 1
+            if reason:
+                self.rejected[reason] += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"checked": self.checked, "rejected": dict(self.rejected)}
+
+precheck_metrics = PrecheckMetrics()
+
+@lru_cache(maxsize=None)
+def _load_classifier(path: str) -> Dict[str, np.ndarray]:
+    """
+    Logistic regression over _features(), stored as an .npz with `weights`,
+    `bias` and `threshold` (and optionally `mean` and `scale` to standardize).
+    """
+    with np.load(path) as model:
+        return {name: model[name] for name in model.files}
+
+def _features(hsv: np.ndarray, quality: ImageQuality) -> np.ndarray:
+    hue_hist = np.bincount((hsv[..., 0] // 32).ravel(), minlength=8)[:8] / hsv[..., 0].size
+    return np.concatenate([
+        [
+            quality.brightness / 255,
+            quality.contrast / 128,
+            np.log1p(quality.sharpness) / 10,
+            hsv[..., 1].mean() / 255,
+        ],
+        hue_hist,
+    ])
+
+def _fridge_score(hsv: np.ndarray, quality: ImageQuality) -> float:
+    model = _load_classifier(config.IMAGE_CLASSIFIER_PATH)
+    x = _features(hsv, quality)
+    if "mean" in model:
+        x = (x - model["mean"]) / model["scale"]
+    return float(1 / (1 + np.exp(-(x @ model["weights"] + model["bias"]))))
+
+def assess(upload: ImageUpload) -> ImageQuality:
+    """ Quality measurements taken on a small thumbnail of the upload """
+    image = upload.open()
+    width, height = image.size
+    # JPEG decodes straight to 1/8 scale, so a phone photo costs a few hundred KB here
+    scale = min(1.0, config.IMAGE_PRECHECK_SIDE / max(image.size))
+    image.draft("RGB", (int(width * scale), int(height * scale)))
+    image.thumbnail((config.IMAGE_PRECHECK_SIDE, config.IMAGE_PRECHECK_SIDE))
+    thumb = image.convert("RGB")
+    image.close()
+    gray = np.asarray(thumb.convert("L"), dtype=np.float32)
+    # 4-neighbour Laplacian; flat (blurred) images have little second-derivative energy
+    laplacian = gray[1:-1, :-2] + gray[1:-1, 2:] + gray[:-2, 1:-1] + gray[2:, 1:-1] - 4 * gray[1:-1, 1:-1]
+    quality = ImageQuality(
+        width=width,
+        height=height,
+        brightness=float(gray.mean()),
+        contrast=float(gray.std()),
+        dark_fraction=float((gray < 16).mean()),
+        bright_fraction=float((gray > 240).mean()),
+        sharpness=float(laplacian.var()) if laplacian.size else 0.0,
+    )
+    if config.IMAGE_CLASSIFIER_PATH:
+        hsv = np.asarray(thumb.convert("HSV"))
+        quality.fridge_score = _fridge_score(hsv, quality)
+    return quality
+
+def check_image(upload: ImageUpload, label: str = "Photo") -> ImageQuality:
+    """
+    Reject photos the vision model cannot use: too small, too dark, washed
+    out, blank, heavily blurred or (with a classifier configured) not of a
+    fridge or pantry. Runs in a worker thread in a few milliseconds.
+    """
+    try:
+        quality = assess(upload)
+    except Exception as e:
+        logfire.error(f"Image processing failed: {str(e)}")
+        raise Exception("Unable to process the image. Please ensure it's a valid image file.")
+
+    rejection = None
+    if min(quality.width, quality.height) < config.IMAGE_MIN_SIDE:
+        rejection = (
+            "resolution",
+            f"{label} is too small ({quality.width}x{quality.height}). "
+            f"Please upload a photo at least {config.IMAGE_MIN_SIDE} pixels on each side."
+        )
+    elif quality.brightness < 30 or quality.dark_fraction > 0.75:
+        rejection = (
+            "dark",
+            f"{label} is too dark to see what's inside. Turn on a light or open the door wider and try again."
+        )
+    elif quality.brightness > 225 or quality.bright_fraction > 0.75:
+        rejection = (
+            "overexposed",
+            f"{label} is washed out. Avoid pointing the camera at a bright light and try again."
+        )
+    elif quality.contrast < 6:
+        rejection = (
+            "blank",
+            f"{label} looks blank. Make sure nothing is covering the camera and try again."
+        )
+    elif quality.sharpness < config.IMAGE_BLUR_THRESHOLD:
+        rejection = (
+            "blurry",
+            f"{label} is too blurry to read. Hold the phone steady, let it focus and try again."
+        )
+    elif quality.fridge_score is not None and quality.fridge_score < _load_classifier(config.IMAGE_CLASSIFIER_PATH)["threshold"]:
+        rejection = (
+            "not_fridge",
+            f"{label} doesn't look like the inside of a fridge or pantry. Please upload a photo of your food."
+        )
+
+    if rejection:
+        reason, message = rejection
+        precheck_metrics.record(reason)
+        logfire.info(f"Image rejected before vision ({reason}): {quality}")
+        raise ImageRejected(reason, message)
+    precheck_metrics.record()
+    upload.checked = True
+    return quality
+
+def check_uploads(uploads: List[ImageUpload]):
+    """ check_image() each photo of a request, labelled the way the vision step labels them; blocks """
+    for i, upload in enumerate(uploads, start=1):
+        check_image(upload, f"Photo {i}" if len(uploads) > 1 else "Photo")
@@ -0,0 +1,259 @@
+import asyncio
+import io
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional
+from urllib.parse import urlparse
+
+import logfire
+from httpx import AsyncClient, HTTPStatusError
+
+from .resilience import StaleCache, call_upstream
+from ..config import config
+
+# variant name -> width in pixels; Spoonacular's largest recipe image is 636 wide
+IMAGE_SIZES = {"card": 312, "detail": 636}
+UPSTREAM_SIZE = "636x393"
+CACHE_HEADERS = {"Cache-Control": "public, max-age=31536000, immutable"}
+
+class ImageNotFound(Exception):
+    """ Raised when the upstream has no image for a recipe """
+
+def check_proxy_base_url():
+    """
+    Fail at startup unless IMAGE_PROXY_BASE_URL is an absolute http(s) URL.
+    The frontend is served from another origin than the API, so a relative
+    image URL would resolve against the frontend and 404.
+    """
+    base = urlparse(config.IMAGE_PROXY_BASE_URL)
+    if base.scheme not in ("http", "https") or not base.netloc:
+        raise RuntimeError(
+            "IMAGE_PROXY=true needs IMAGE_PROXY_BASE_URL set to the API's public origin, "
+            f"e.g. http://localhost:8000 (got {config.IMAGE_PROXY_BASE_URL!r})"
+        )
+
+def proxied_image_url(recipe_id: int, original: Optional[str], size: str = "card") -> str:
+    """ URL of a recipe image variant served by /api/images, remembering the upstream's file type """
+    if original and original.lower().endswith(".png"):
+        image_cache.remember_type(recipe_id, "png")
+    return f"{config.IMAGE_PROXY_BASE_URL.rstrip('/')}/api/images/{recipe_id}?size={size}"
+
+def rewrite_recipe_images(event: Dict[str, Any]) -> Dict[str, Any]:
+    """ Point every recipe image in a stream event at the proxy """
+    for recipe in event.get("recipes") or []:
+        if recipe.get("id") and recipe.get("image"):
+            recipe["image"] = proxied_image_url(recipe["id"], recipe["image"])
+    return event
+
+def _resize_variants(data: bytes) -> Dict[str, bytes]:
+    """ Decode once and encode every size as WebP. Runs in the resize pool. """
+    from PIL import Image
+
+    image = Image.open(io.BytesIO(data))
+    image.draft("RGB", (max(IMAGE_SIZES.values()), max(IMAGE_SIZES.values())))
+    image = image.convert("RGB")
+    variants = {}
+    for name, width in IMAGE_SIZES.items():
+        variant = image
+        if image.width > width:
+            variant = image.resize((width, round(image.height * width / image.width)), Image.LANCZOS)
+        buffer = io.BytesIO()
+        variant.save(buffer, format="WEBP", quality=config.IMAGE_PROXY_QUALITY, method=4)
+        variants[name] = buffer.getvalue()
+    return variants
+
+def _read_and_touch(path: str) -> Optional[bytes]:
+    """
+    Read a cached variant and refresh its place in the LRU order, or None if
+    it is not cached. Runs in a thread; once read, eviction cannot cut the
+    response short.
+    """
+    try:
+        with open(path, "rb") as f:
+            content = f.read()
+        os.utime(path)
+        return content
+    except FileNotFoundError:
+        return None
+
+class ImageCache:
+    """
+    Resized WebP variants of recipe images, kept on disk.
+
+    A missing image is fetched from the upstream once (concurrent requests
+    for the same recipe share the fetch), resized into every size in a small
+    thread pool, and written atomically from that pool. File modification
+    times track use, and the least recently used files are deleted once the
+    directory grows past IMAGE_CACHE_MAX_MB. Recipes the upstream has no
+    image for are remembered for IMAGE_MISS_TTL seconds so repeated requests
+    for them do not reach the upstream.
+    """
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.fetches = 0
+        self.evictions = 0
+        self.not_found = 0
+        self._size: Optional[int] = None
+        self._inflight: Dict[int, asyncio.Future] = {}
+        self._types = StaleCache(4096) # recipe id -> upstream file type, when not jpg
+        self._missing = StaleCache(4096) # recipe id -> monotonic time until which it is known to have no image
+        self._client: Optional[AsyncClient] = None
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self) -> AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = AsyncClient()
+        return self._client
+
+    @property
+    def pool(self) -> ThreadPoolExecutor:
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=config.IMAGE_RESIZE_WORKERS, thread_name_prefix="image-resize")
+        return self._pool
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
+            self._pool = None
+
+    def remember_type(self, recipe_id: int, image_type: str):
+        self._types.put(recipe_id, image_type)
+
+    def path(self, recipe_id: int, size: str) -> str:
+        return os.path.join(self.directory, f"{recipe_id}-{size}.webp")
+
+    async def read(self, recipe_id: int, size: str) -> bytes:
+        """ Content of the variant, fetching and resizing the image first if needed """
+        path = self.path(recipe_id, size)
+        content = await asyncio.to_thread(_read_and_touch, path)
+        if content is not None:
+            self.hits += 1
+            return content
+
+        known_missing = self._missing.get(recipe_id)
+        if known_missing is not None and known_missing > time.monotonic():
+            self.not_found += 1
+            raise ImageNotFound(f"No image for recipe {recipe_id}")
+
+        self.misses += 1
+        future = self._inflight.get(recipe_id)
+        if future is None:
+            future = asyncio.ensure_future(self._fill(recipe_id))
+            self._inflight[recipe_id] = future
+            future.add_done_callback(lambda done: self._fill_done(recipe_id, done))
+        # shielded so one client hanging up does not abort the fetch the others wait on
+        await asyncio.shield(future)
+        content = await asyncio.to_thread(_read_and_touch, path)
+        if content is None:
+            raise FileNotFoundError(f"Image for recipe {recipe_id} was evicted as soon as it was cached")
+        return content
+
+    def _fill_done(self, recipe_id: int, future: asyncio.Future):
+        self._inflight.pop(recipe_id, None)
+        # retrieved here, so a failed fill whose waiters all hung up is not reported as never retrieved;
+        # waiters that are still there log the error themselves
+        if not future.cancelled():
+            future.exception()
+
+    async def _fetch(self, recipe_id: int) -> bytes:
+        preferred = self._types.get(recipe_id) or "jpg"
+        for image_type in dict.fromkeys([preferred, "jpg", "png"]):
+            url = f"{config.IMAGE_UPSTREAM_BASE_URL}/recipes/{recipe_id}-{UPSTREAM_SIZE}.{image_type}"
+
+            async def attempt(timeout: float):
+                response = await self.client.get(url, timeout=timeout)
+                response.raise_for_status()
+                return response.content
+
+            try:
+                return await call_upstream("spoonacular.images", attempt)
+            except HTTPStatusError as e:
+                if e.response.status_code != 404:
+                    raise
+        raise ImageNotFound(f"No image for recipe {recipe_id}")
+
+    async def _fill(self, recipe_id: int):
+        try:
+            data = await self._fetch(recipe_id)
+        except ImageNotFound:
+            self._missing.put(recipe_id, time.monotonic() + config.IMAGE_MISS_TTL)
+            raise
+        self.fetches += 1
+        written = await asyncio.get_running_loop().run_in_executor(self.pool, self._store, recipe_id, data)
+        logfire.info(f"Cached {len(IMAGE_SIZES)} image sizes for recipe {recipe_id} ({len(data)} -> {written} bytes)")
+
+    def _store(self, recipe_id: int, data: bytes) -> int:
+        """ Resize, write every variant and evict if over the limit; runs in the resize pool """
+        variants = _resize_variants(data)
+        os.makedirs(self.directory, exist_ok=True)
+        written = 0
+        for size, content in variants.items():
+            path = self.path(recipe_id, size)
+            temporary = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temporary, "wb") as f:
+                f.write(content)
+            os.replace(temporary, path)
+            written += len(content)
+        self._grow(written)
+        return written
+
+    def _grow(self, nbytes: int):
+        with self._lock:
+            if self._size is None:
+                self._size = self.disk_usage()
+            else:
+                self._size += nbytes
+            if self._size <= self.max_bytes:
+                return
+        self._evict()
+
+    def disk_usage(self) -> int:
+        try:
+            return sum(entry.stat().st_size for entry in os.scandir(self.directory) if entry.name.endswith(".webp"))
+        except FileNotFoundError:
+            return 0
+
+    def _evict(self):
+        """ Delete least recently used files until the cache is back under 90% of its limit """
+        with self._lock:
+            entries = []
+            for entry in os.scandir(self.directory):
+                if entry.name.endswith(".webp"):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+            entries.sort()
+            total = sum(size for _, size, _ in entries)
+            target = self.max_bytes * 0.9
+            for _, size, path in entries:
+                if total <= target:
+                    break
+                try:
+                    os.remove(path)
+                    self.evictions += 1
+                except FileNotFoundError:
+                    pass
+                total -= size
+            self._size = total
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "upstream_fetches": self.fetches,
+            "evictions": self.evictions,
+            "not_found": self.not_found,
+            # measured on the first fill, off the event loop
+            "bytes": self._size,
+            "max_bytes": self.max_bytes,
+        }
+
+image_cache = ImageCache(config.IMAGE_CACHE_DIR, config.IMAGE_CACHE_MAX_MB * 1024 * 1024)
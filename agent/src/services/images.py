@@ -0,0 +1,192 @@
+import binascii
+import io
+import threading
+from typing import Dict, List, Optional, Union
+
+import logfire
+
+from ..config import config
+
+MB = 1024 * 1024
+_DECODE_CHUNK = 4 * MB # base64 characters per slice
+_NON_ALPHABET = bytes(set(range(256)) - set(b"ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/"))
+
+class ImageTooLarge(Exception):
+    """ Raised when an upload would push a request past IMAGE_MEMORY_LIMIT_MB """
+
+class MemoryBudget:
+    """
+    Per-request ceiling on image memory. Compressed buffers and the pixel
+    buffers of in-progress decodes reserve from it; a decode that would go
+    over the limit is refused before it allocates anything.
+    """
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.used = 0
+        self._lock = threading.Lock()
+
+    def reserve(self, nbytes: int):
+        with self._lock:
+            if self.used + nbytes > self.limit:
+                raise ImageTooLarge(
+                    f"Photos are too large to process ({(self.used + nbytes) / MB:.0f} MB). "
+                    "Please upload smaller or fewer images."
+                )
+            self.used += nbytes
+
+    def release(self, nbytes: int):
+        with self._lock:
+            self.used = max(0, self.used - nbytes)
+
+class ImageUpload:
+    """
+    One uploaded image held as a single compressed buffer.
+
+    The base64 text is decoded once and dropped. Pixels are decoded only in
+    prepare(), directly at reduced resolution where the format allows it, and
+    re-encoded into a small JPEG that replaces the original buffer, so no
+    full-size bitmap outlives the decode. release() drops the buffer once the
+    vision call no longer needs it.
+    """
+    __slots__ = ("data", "mime_type", "width", "height", "checked")
+
+    def __init__(self, data: bytes, mime_type: str = "application/octet-stream"):
+        self.data = data
+        self.mime_type = mime_type
+        self.width: Optional[int] = None
+        self.height: Optional[int] = None
+        self.checked = False # passed the local quality check already
+
+    @classmethod
+    def from_base64(cls, image_base64: str) -> "ImageUpload":
+        """ Decode base64 (with or without data URL prefix) without keeping the text around """
+        # handle data URL format
+        start = image_base64.find(",") + 1 if image_base64.startswith("data:") else 0
+        end = len(image_base64)
+        while start < end and image_base64[start].isspace():
+            start += 1
+        while end > start and image_base64[end - 1].isspace():
+            end -= 1
+        if end - start > config.IMAGE_MEMORY_LIMIT_MB * MB * 4 // 3:
+            raise ImageTooLarge("Photo is too large to process. Please upload a smaller image.")
+        try:
+            # decode in slices so no full-size copy of the text is made. Characters outside
+            # the alphabet (MIME line breaks, padding) are dropped, as b64decode does, and the
+            # last len % 4 characters of a slice carry over so no 4-character group is split
+            parts = []
+            carry = b""
+            for offset in range(start, end, _DECODE_CHUNK):
+                chunk = image_base64[offset:min(offset + _DECODE_CHUNK, end)].encode("ascii").translate(None, _NON_ALPHABET)
+                chunk = carry + chunk
+                usable = len(chunk) - len(chunk) % 4
+                carry = chunk[usable:]
+                if usable:
+                    parts.append(binascii.a2b_base64(chunk[:usable]))
+            if carry:
+                # pad base64 string
+                parts.append(binascii.a2b_base64(carry + b"=" * (4 - len(carry))))
+            # bytes rather than bytearray, so BytesIO can wrap it without copying
+            data = parts[0] if len(parts) == 1 else b"".join(parts) if parts else b""
+            del parts
+        except Exception as e:
+            logfire.error(f"Base64 decoding failed: {str(e)}")
+            raise Exception("Invalid image format. Please ensure the image is properly encoded.")
+        if not data:
+            raise Exception("Invalid image format. Please ensure the image is properly encoded.")
+        return cls(data)
+
+    @property
+    def nbytes(self) -> int:
+        return len(self.data)
+
+    def open(self):
+        """ Open the buffer with PIL; only the header is read until pixels are needed """
+        from PIL import Image
+        return Image.open(io.BytesIO(self.data))
+
+    def prepare(self, max_side: int, budget: Optional[MemoryBudget] = None):
+        """
+        Decode at no more than max_side pixels on the long edge and replace the
+        buffer with a JPEG of that size. Runs in a worker thread.
+        """
+        try:
+            image = self.open()
+            # JPEG can decode straight to a 1/2, 1/4 or 1/8 scale no smaller than the target
+            scale = min(1.0, max_side / max(image.size))
+            image.draft("RGB", (int(image.width * scale), int(image.height * scale)))
+            working = image.width * image.height * max(3, len(image.getbands()))
+        except Exception as e:
+            logfire.error(f"Image processing failed: {str(e)}")
+            raise Exception("Unable to process the image. Please ensure it's a valid image file.")
+
+        if budget:
+            budget.reserve(working)
+        try:
+            logfire.info(f"Processing {image.format} image: {image.width}x{image.height}")
+            image.load()
+            if image.mode != "RGB":
+                image = image.convert("RGB")
+            image.thumbnail((max_side, max_side))
+            buffer = io.BytesIO()
+            image.save(buffer, format="JPEG", quality=config.VISION_JPEG_QUALITY)
+            self.width, self.height = image.width, image.height
+            image.close()
+            self.data = buffer.getvalue()
+            self.mime_type = "image/jpeg"
+        except Exception as e:
+            logfire.error(f"Image processing failed: {str(e)}")
+            raise Exception("Unable to process the image. Please ensure it's a valid image file.")
+        finally:
+            if budget:
+                budget.release(working)
+
+    def blob(self) -> Dict[str, Union[str, bytes]]:
+        """ Inline image part for a Gemini request """
+        return {"mime_type": self.mime_type, "data": self.data}
+
+    def release(self):
+        self.data = b""
+
+def decode_uploads(images: List[str], budget: Optional[MemoryBudget] = None) -> List[ImageUpload]:
+    """
+    Decode request images up front, enforcing the per-request ceiling on their
+    combined size; pass one budget to hold several messages to a shared one.
+    """
+    budget = budget or MemoryBudget(config.IMAGE_MEMORY_LIMIT_MB * MB)
+    uploads = []
+    for image_base64 in images:
+        upload = ImageUpload.from_base64(image_base64)
+        budget.reserve(upload.nbytes)
+        uploads.append(upload)
+    return uploads
+
+async def read_limited_body(request, limit: int) -> bytearray:
+    """
+    Read a request body into one buffer, refusing it as soon as it passes the
+    limit. Unlike request.body(), nothing is cached on the request for the
+    lifetime of a streaming response.
+    """
+    too_large = ImageTooLarge("Photos are too large to process. Please upload smaller or fewer images.")
+    length = request.headers.get("content-length")
+    if length and length.isdigit():
+        if int(length) > limit:
+            raise too_large
+        # sized up front so the buffer never has to grow (and be copied) while reading
+        buffer = bytearray(int(length))
+        view = memoryview(buffer)
+        received = 0
+        async for chunk in request.stream():
+            if received + len(chunk) > len(buffer):
+                raise too_large
+            view[received:received + len(chunk)] = chunk
+            received += len(chunk)
+        view.release()
+        del buffer[received:]
+        return buffer
+
+    buffer = bytearray()
+    async for chunk in request.stream():
+        buffer += chunk
+        if len(buffer) > limit:
+            raise too_large
+    return buffer
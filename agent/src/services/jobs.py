@@ -0,0 +1,280 @@
+import asyncio
+import json
+import sqlite3
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncGenerator, Callable, Dict, List, Optional, Tuple
+
+import logfire
+
+from .cancellation import CancelToken, cancellation_metrics
+from ..config import config
+
+class JobNotFound(Exception):
+    """ Raised for unknown or expired job ids """
+
+class Job:
+    """
+    A pipeline run detached from the connection that started it. Its events
+    are numbered from 1 and kept (up to JOB_MAX_EVENTS) so a client can
+    resume from the last one it saw. `size` is the JSON size of the kept
+    events, which the store bounds across jobs.
+    """
+    def __init__(self, job_id: str, kind: str):
+        self.id = job_id
+        self.kind = kind
+        self.created = time.time()
+        self.finished: Optional[float] = None
+        self.events: List[dict] = []
+        self.sizes: List[int] = [] # JSON bytes of each kept event
+        self.size = 0
+        self.first_seq = 1 # seq of events[0]; rises once old events are dropped
+        self.token = CancelToken()
+        self.task: Optional[asyncio.Task] = None
+        self.current_step: Optional[str] = None
+        self._changed = asyncio.Event()
+
+    @property
+    def last_seq(self) -> int:
+        return self.first_seq + len(self.events) - 1
+
+    def append(self, event: dict, size: int) -> int:
+        self.events.append(event)
+        self.sizes.append(size)
+        self.size += size
+        if len(self.events) > config.JOB_MAX_EVENTS:
+            self.events.pop(0)
+            self.size -= self.sizes.pop(0)
+            self.first_seq += 1
+        if event.get("type") == "step":
+            self.current_step = event.get("step") if event.get("status") == "in_progress" else None
+        self._notify()
+        return self.last_seq
+
+    def events_after(self, after: int) -> List[Tuple[int, dict]]:
+        start = max(after + 1, self.first_seq)
+        return [(seq, self.events[seq - self.first_seq]) for seq in range(start, self.last_seq + 1)]
+
+    def finish(self):
+        self.finished = time.time()
+        self._notify()
+
+    def _notify(self):
+        # wakes every tailing stream; they pick up a fresh event to wait on
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def changed(self):
+        await self._changed.wait()
+
+class JobStore:
+    """
+    Background jobs and their event logs.
+
+    Jobs run as tasks on the worker that created them and outlive the request
+    that started them, up to JOB_MAX_RUNTIME. Their events are kept in memory
+    for JOB_TTL seconds after they finish, at most JOB_MAX_JOBS jobs and
+    JOB_MAX_MB of events per worker; past either cap the oldest finished jobs
+    go first. With JOB_DB_PATH set, events are also appended to a SQLite file
+    shared by the workers on the host, so a client that reconnects to a
+    different worker can still replay and tail the job; that worker polls the
+    file every JOB_POLL_INTERVAL. All SQLite work runs in order on one writer
+    thread, so lock contention between workers never stalls the event loop.
+    """
+    def __init__(self, db_path: Optional[str] = None):
+        self.jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self.db_path = db_path
+        self._db: Optional[sqlite3.Connection] = None
+        self._writer: Optional[ThreadPoolExecutor] = None
+        self.started = 0
+        self.resumed = 0
+        self.cancelled = 0
+        self.timed_out = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        """ The writer thread's connection, opened on first use """
+        if self._db is None:
+            self._db = sqlite3.connect(self.db_path, timeout=5.0, isolation_level=None, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute("CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, kind TEXT, created REAL, finished REAL)")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS job_events (job_id TEXT, seq INTEGER, event TEXT, PRIMARY KEY (job_id, seq))"
+            )
+        return self._db
+
+    def _sql(self, statement: str, parameters: tuple = ()) -> List[tuple]:
+        return self._connect().execute(statement, parameters).fetchall()
+
+    def _write(self, statement: str, parameters: tuple = ()):
+        """ Queue a write for the writer thread without waiting for it """
+        if not self.db_path:
+            return
+        if self._writer is None:
+            self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="job-log")
+
+        def write():
+            try:
+                self._sql(statement, parameters)
+            except sqlite3.Error as e:
+                logfire.error(f"Job log write failed: {str(e)}")
+        self._writer.submit(write)
+
+    async def _read(self, statement: str, parameters: tuple = ()) -> List[tuple]:
+        """ Run a query on the writer thread, after every write queued before it """
+        if self._writer is None:
+            self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="job-log")
+        return await asyncio.get_running_loop().run_in_executor(self._writer, self._sql, statement, parameters)
+
+    def create(self, kind: str, run: Callable[[CancelToken], AsyncGenerator[dict, None]]) -> Job:
+        """ Start `run(token)` as a job and return it; its events go to the job's log """
+        job = Job(uuid.uuid4().hex, kind)
+        # the task exists before anything that can fail, so the job always finishes
+        job.task = asyncio.create_task(self._run(job, run))
+        self.jobs[job.id] = job
+        self.started += 1
+        self._write("INSERT INTO jobs (id, kind, created) VALUES (?, ?, ?)", (job.id, kind, job.created))
+        self._expire()
+        logfire.info(f"Started {kind} job {job.id}")
+        return job
+
+    async def _run(self, job: Job, run: Callable[[CancelToken], AsyncGenerator[dict, None]]):
+        limit = asyncio.timeout(config.JOB_MAX_RUNTIME)
+        try:
+            async with limit:
+                async for event in run(job.token):
+                    self._append(job, event)
+        except TimeoutError as e:
+            if not limit.expired():
+                # raised by the pipeline itself, not the runtime cap
+                logfire.error(f"Job {job.id} failed: {str(e) or type(e).__name__}")
+                self._append(job, {"type": "error", "message": "Request took too long. Please try again."})
+                return
+            job.token.cancel("job timed out")
+            self.timed_out += 1
+            logfire.warning(f"Job {job.id} ran past JOB_MAX_RUNTIME at step {job.current_step}")
+            self._append(job, {"type": "error", "message": "Request took too long. Please try again."})
+        except asyncio.CancelledError:
+            self._append(job, {"type": "cancelled", "message": "Request cancelled"})
+        except Exception as e:
+            logfire.error(f"Job {job.id} failed: {str(e)}")
+            self._append(job, {"type": "error", "message": f"Sorry, something went wrong: {str(e)}"})
+        finally:
+            job.finish()
+            self._write("UPDATE jobs SET finished = ? WHERE id = ?", (job.finished, job.id))
+            # a finished job's complete event holds every recipe, so the byte cap is checked here too
+            self._expire()
+
+    def _append(self, job: Job, event: dict):
+        encoded = json.dumps(event)
+        seq = job.append(event, len(encoded))
+        self._write("INSERT INTO job_events (job_id, seq, event) VALUES (?, ?, ?)", (job.id, seq, encoded))
+        if seq > config.JOB_MAX_EVENTS:
+            self._write("DELETE FROM job_events WHERE job_id = ? AND seq <= ?", (job.id, seq - config.JOB_MAX_EVENTS))
+
+    def _expire(self):
+        cutoff = time.time() - config.JOB_TTL
+        for job_id in [job_id for job_id, job in self.jobs.items() if job.finished and job.finished < cutoff]:
+            del self.jobs[job_id]
+        # over a cap, drop the oldest finished jobs; running ones end within JOB_MAX_RUNTIME
+        kept_bytes = sum(job.size for job in self.jobs.values())
+        while len(self.jobs) > config.JOB_MAX_JOBS or kept_bytes > config.JOB_MAX_MB * 1024 * 1024:
+            oldest = next((job_id for job_id, job in self.jobs.items() if job.finished), None)
+            if oldest is None:
+                break
+            kept_bytes -= self.jobs.pop(oldest).size
+        self._write("DELETE FROM job_events WHERE job_id IN (SELECT id FROM jobs WHERE finished < ?)", (cutoff,))
+        self._write("DELETE FROM jobs WHERE finished < ?", (cutoff,))
+
+    async def exists(self, job_id: str) -> bool:
+        if job_id in self.jobs:
+            return True
+        return bool(self.db_path) and bool(await self._read("SELECT 1 FROM jobs WHERE id = ?", (job_id,)))
+
+    async def stream(self, job_id: str, after: int = 0) -> AsyncGenerator[Tuple[int, dict], None]:
+        """
+        Events of a job with seq greater than `after`: those already logged,
+        then new ones as they arrive, until the job finishes. Events that
+        aged out of the log are skipped.
+        """
+        if after > 0:
+            self.resumed += 1
+        job = self.jobs.get(job_id)
+        if job is not None:
+            while True:
+                for seq, event in job.events_after(after):
+                    after = seq
+                    yield seq, event
+                if job.finished:
+                    return
+                await job.changed()
+        elif self.db_path:
+            async for item in self._stream_db(job_id, after):
+                yield item
+        else:
+            raise JobNotFound(f"No job {job_id}")
+
+    async def _stream_db(self, job_id: str, after: int) -> AsyncGenerator[Tuple[int, dict], None]:
+        """ Replay and tail a job owned by another worker by polling the shared log """
+        rows = await self._read("SELECT finished FROM jobs WHERE id = ?", (job_id,))
+        if not rows:
+            raise JobNotFound(f"No job {job_id}")
+        while True:
+            finished = rows[0][0]
+            for seq, event in await self._read(
+                "SELECT seq, event FROM job_events WHERE job_id = ? AND seq > ? ORDER BY seq", (job_id, after)
+            ):
+                after = seq
+                yield seq, json.loads(event)
+            # checked before the read above, so events logged just before finishing are not missed
+            if finished is not None:
+                return
+            await asyncio.sleep(config.JOB_POLL_INTERVAL)
+            rows = await self._read("SELECT finished FROM jobs WHERE id = ?", (job_id,))
+            if not rows:
+                return
+
+    def cancel(self, job_id: str) -> bool:
+        """ Stop a running job on this worker; False if it already finished or runs elsewhere """
+        job = self.jobs.get(job_id)
+        if job is None or job.finished or job.task is None:
+            return False
+        job.token.cancel("cancelled by client")
+        job.task.cancel()
+        self.cancelled += 1
+        cancellation_metrics.record("pipelines_cancelled")
+        if job.current_step:
+            cancellation_metrics.record_step(job.current_step)
+        logfire.info(f"Cancelled job {job_id} at step {job.current_step}")
+        return True
+
+    async def shutdown(self):
+        running = [job.task for job in self.jobs.values() if job.task and not job.task.done()]
+        for task in running:
+            task.cancel()
+        await asyncio.gather(*running, return_exceptions=True)
+        if self._writer is not None:
+            # flushes the queued writes before closing the connection
+            await asyncio.get_running_loop().run_in_executor(self._writer, self._close_db)
+            self._writer.shutdown(wait=False)
+            self._writer = None
+
+    def _close_db(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "started": self.started,
+            "running": sum(1 for job in self.jobs.values() if not job.finished),
+            "kept": len(self.jobs),
+            "kept_bytes": sum(job.size for job in self.jobs.values()),
+            "resumed_streams": self.resumed,
+            "cancelled": self.cancelled,
+            "timed_out": self.timed_out,
+        }
+
+job_store = JobStore(config.JOB_DB_PATH)
@@ -0,0 +1,199 @@
+import csv
+import os
+import re
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+import logfire
+import numpy as np
+
+from ..models.recipe import NutritionInfo, RecipeDetails
+from ..config import config
+
+TABLE_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "nutrients.csv")
+MATCH_CACHE_SIZE = 8192 # ingredient names remembered per table
+MACROS = ("calories", "fat", "carbohydrates", "protein")
+
+# mass units in grams
+_GRAMS = {
+    "g": 1.0, "gram": 1.0, "gr": 1.0, "kg": 1000.0, "kilogram": 1000.0, "mg": 0.001,
+    "oz": 28.35, "ounce": 28.35, "lb": 453.6, "pound": 453.6,
+}
+# volume units in US cups
+_CUPS = {
+    "cup": 1.0, "c": 1.0, "tbsp": 1 / 16, "tablespoon": 1 / 16, "tbs": 1 / 16, "tbl": 1 / 16,
+    "tsp": 1 / 48, "teaspoon": 1 / 48, "ml": 1 / 236.6, "milliliter": 1 / 236.6, "millilitre": 1 / 236.6,
+    "l": 1000 / 236.6, "liter": 1000 / 236.6, "litre": 1000 / 236.6, "dl": 100 / 236.6,
+    "fl oz": 1 / 8, "fluid ounce": 1 / 8, "pint": 2.0, "pt": 2.0, "quart": 4.0, "qt": 4.0, "gallon": 16.0,
+    "pinch": 1 / 768, "dash": 1 / 384, "smidgen": 1 / 1536, "stick": 0.5, "handful": 0.5,
+}
+# count units as a multiple of the ingredient's weight per piece
+_PIECES = {
+    "": 1.0, "piece": 1.0, "whole": 1.0, "medium": 1.0, "serving": 1.0, "clove": 1.0, "slice": 1.0,
+    "stalk": 1.0, "rib": 1.0, "head": 1.0, "ear": 1.0, "fillet": 1.0, "breast": 1.0, "thigh": 1.0,
+    "strip": 1.0, "leaf": 1.0, "sprig": 1.0, "large": 1.2, "small": 0.8, "extra large": 1.4, "jumbo": 1.4,
+}
+# packaged units in grams, whatever the ingredient
+_PACKAGES = {"can": 400.0, "jar": 450.0, "package": 450.0, "pkg": 450.0, "bag": 450.0, "box": 450.0, "bunch": 100.0}
+
+def _singular(word: str) -> str:
+    if word.endswith("ies") and len(word) > 4:
+        return word[:-3] + "y"
+    if word.endswith("oes") and len(word) > 4:
+        return word[:-2]
+    if word.endswith("s") and not word.endswith("ss") and len(word) > 3:
+        return word[:-1]
+    return word
+
+def _normalize(text: str) -> str:
+    words = re.sub(r"[^a-z ]+", " ", text.lower().replace("-", " ")).split()
+    return " ".join(_singular(word) for word in words)
+
+class NutrientTable:
+    """
+    Per-ingredient macronutrients loaded from the bundled CSV.
+
+    `values` holds calories, fat, carbohydrates and protein per 100 g, one row
+    per ingredient, so a whole response can be aggregated with one matrix
+    product. An ingredient name is matched by the longest table name or alias
+    it ends with, plurals folded, so the head noun decides: "unsalted butter"
+    is butter and "chocolate milk" is never chocolate. A name whose leftover
+    modifiers are ingredients themselves ("chocolate milk", "pepper jack
+    cheese") is left unmatched rather than weighed as the wrong thing.
+    """
+    def __init__(self, path: str = TABLE_PATH):
+        names, values, per_cup, each = [], [], [], []
+        self.lookup: Dict[str, int] = {}
+        with open(path, encoding="utf-8") as f:
+            rows = csv.DictReader(line for line in f if not line.startswith("#"))
+            for row in rows:
+                index = len(names)
+                names.append(row["name"])
+                values.append([float(row[macro]) for macro in MACROS])
+                per_cup.append(float(row["grams_per_cup"]) if row["grams_per_cup"] else np.nan)
+                each.append(float(row["grams_each"]) if row["grams_each"] else np.nan)
+                for alias in [row["name"], *filter(None, row["aliases"].split("|"))]:
+                    self.lookup.setdefault(_normalize(alias), index)
+        self.names = names
+        self.values = np.array(values, dtype=np.float64)
+        self.grams_per_cup = np.array(per_cup, dtype=np.float64)
+        self.grams_each = np.array(each, dtype=np.float64)
+        self._matches: Dict[str, Optional[int]] = {}
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def match(self, name: str) -> Optional[int]:
+        """ Row for an ingredient name, or None when nothing in the table fits """
+        if name not in self._matches:
+            if len(self._matches) >= MATCH_CACHE_SIZE:
+                self._matches.clear()
+            self._matches[name] = self._match(name)
+        return self._matches[name]
+
+    def _match(self, name: str) -> Optional[int]:
+        normalized = _normalize(name)
+        if normalized in self.lookup:
+            return self.lookup[normalized]
+        # "tomatoes, diced": the head noun comes before any comma
+        words = _normalize(name.split(",")[0]).split()
+        for length in range(len(words), 0, -1):
+            alias = " ".join(words[-length:])
+            if alias in self.lookup:
+                modifiers = words[:-length]
+                if self._names_ingredient(modifiers):
+                    return None
+                return self.lookup[alias]
+        return None
+
+    def _names_ingredient(self, words: List[str]) -> bool:
+        """ Whether any run of the words is itself a table name or alias """
+        return any(
+            " ".join(words[start:end]) in self.lookup
+            for start in range(len(words))
+            for end in range(start + 1, len(words) + 1)
+        )
+
+    def grams(self, row: int, amount: float, unit: str) -> Optional[float]:
+        """ Weight of `amount` `unit` of the ingredient in row, or None for units it cannot convert """
+        # "T" and "t" are tablespoon and teaspoon, so check case before folding it
+        key = {"T": "tbsp", "t": "tsp"}.get(unit.strip(), unit.strip().lower().rstrip("."))
+        if key not in _GRAMS and key not in _CUPS and key not in _PIECES and key not in _PACKAGES:
+            key = _singular(key)
+        if key in _GRAMS:
+            return amount * _GRAMS[key]
+        if key in _CUPS:
+            per_cup = self.grams_per_cup[row]
+            return amount * _CUPS[key] * (per_cup if not np.isnan(per_cup) else 240.0)
+        if key in _PACKAGES:
+            return amount * _PACKAGES[key]
+        if key in _PIECES and not np.isnan(self.grams_each[row]):
+            return amount * _PIECES[key] * self.grams_each[row]
+        return None
+
+@lru_cache(maxsize=None)
+def nutrient_table() -> NutrientTable:
+    return NutrientTable()
+
+def estimate_nutrition(recipes: List[RecipeDetails]) -> np.ndarray:
+    """
+    Per-serving calories, fat, carbohydrates and protein for each recipe,
+    estimated from its ingredient list. Returns an (n, 5) array whose last
+    column is the share of each recipe's ingredients that could be matched
+    and converted.
+
+    Names and units are resolved per ingredient (cached), then every
+    ingredient of every recipe is weighed against the table in one batched
+    pass and summed per recipe.
+    """
+    table = nutrient_table()
+    rows, grams, owners, counts = [], [], [], np.zeros(len(recipes))
+    for position, recipe in enumerate(recipes):
+        counts[position] = len(recipe.ingredients)
+        for ingredient in recipe.ingredients:
+            row = table.match(ingredient.name)
+            weight = table.grams(row, ingredient.amount, ingredient.unit) if row is not None else None
+            if weight is not None:
+                rows.append(row)
+                grams.append(weight)
+                owners.append(position)
+
+    totals = np.zeros((len(recipes), len(MACROS)))
+    if rows:
+        owners_array = np.array(owners)
+        contributions = table.values[np.array(rows)] * (np.array(grams) / 100)[:, None]
+        np.add.at(totals, owners_array, contributions)
+        matched = np.bincount(owners_array, minlength=len(recipes))
+    else:
+        matched = np.zeros(len(recipes))
+    servings = np.array([max(recipe.servings or 1, 1) for recipe in recipes], dtype=np.float64)
+    coverage = np.divide(matched, counts, out=np.zeros(len(recipes)), where=counts > 0)
+    return np.column_stack([totals / servings[:, None], coverage])
+
+def fill_missing_nutrition(recipes: List[RecipeDetails]):
+    """
+    Estimate nutrition for recipes that came without it (details fetched
+    with NUTRITION_SOURCE=local). Recipes whose ingredients are too poorly
+    covered by the table keep empty nutrition rather than an undercount.
+    """
+    missing = [recipe for recipe in recipes if recipe.nutrition.calories is None and recipe.ingredients]
+    if not missing:
+        return
+    estimates = estimate_nutrition(missing)
+    filled = 0
+    for recipe, estimate in zip(missing, estimates):
+        if estimate[-1] >= config.NUTRITION_MIN_COVERAGE:
+            recipe.nutrition = NutritionInfo(**{macro: round(float(value), 2) for macro, value in zip(MACROS, estimate)})
+            filled += 1
+    logfire.info(f"Estimated nutrition locally for {filled}/{len(missing)} recipes")
+
+def unmatched_ingredients(recipes: List[RecipeDetails]) -> List[Tuple[str, str]]:
+    """ (name, unit) pairs the table could not weigh, for growing the table """
+    table = nutrient_table()
+    unmatched = []
+    for recipe in recipes:
+        for ingredient in recipe.ingredients:
+            row = table.match(ingredient.name)
+            if row is None or table.grams(row, ingredient.amount, ingredient.unit) is None:
+                unmatched.append((ingredient.name, ingredient.unit))
+    return unmatched
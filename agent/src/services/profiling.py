@@ -0,0 +1,289 @@
+import asyncio
+import cProfile
+import hmac
+import io
+import json
+import os
+import pstats
+import shutil
+import sys
+import threading
+import time
+import traceback
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+import logfire
+from starlette.requests import HTTPConnection
+
+from ..config import config
+
+PROFILE_HEADER = "x-profile"
+
+def profiling_authorized(request: HTTPConnection) -> bool:
+    """ Whether the request carries PROFILING_TOKEN, as an X-Profile header or ?profile= """
+    if not config.PROFILING_TOKEN:
+        return False
+    supplied = request.headers.get(PROFILE_HEADER) or request.query_params.get("profile")
+    return bool(supplied) and hmac.compare_digest(supplied.encode(), config.PROFILING_TOKEN.encode())
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+def _stack_summary(frame, depth: int = 8) -> List[str]:
+    return [f"{os.path.basename(entry.filename)}:{entry.lineno} {entry.name}" for entry in traceback.extract_stack(frame)[-depth:]]
+
+# per-request profiles
+
+_profile_lock = threading.Lock()
+
+def profile_path(profile_id: str) -> str:
+    return os.path.join(config.PROFILING_DIR, "requests", f"{profile_id}.prof")
+
+def new_profile_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+@contextmanager
+def request_profile(profile_id: Optional[str]):
+    """
+    cProfile the body of the block and save the stats under profile_id.
+
+    The profiler hooks the worker's event loop thread, so while the block is
+    suspended it also records whatever other requests run on that loop; that
+    is the time this request's events were waiting behind. Work handed to
+    threads (blocking SDK calls) shows up as the await that waited for it.
+    One request per worker is profiled at a time. The stats are written
+    by a background thread once the block ends.
+    """
+    if profile_id is None:
+        yield
+        return
+    if not _profile_lock.acquire(blocking=False):
+        logfire.warning(f"Skipping profile {profile_id}: another request on this worker is being profiled")
+        yield
+        return
+    profiler = cProfile.Profile()
+    started = time.perf_counter()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        _profile_lock.release()
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        # dumping the stats and pruning old files is disk work; keep it off the event loop
+        threading.Thread(
+            target=_save_profile, args=(profiler, profile_id, elapsed_ms), name="profile-save", daemon=True
+        ).start()
+
+def _save_profile(profiler: cProfile.Profile, profile_id: str, elapsed_ms: float):
+    try:
+        directory = os.path.dirname(profile_path(profile_id))
+        os.makedirs(directory, exist_ok=True)
+        profiler.dump_stats(profile_path(profile_id))
+        # keep the newest PROFILE_KEEP profiles
+        entries = sorted(os.scandir(directory), key=lambda entry: entry.stat().st_mtime, reverse=True)
+        for entry in entries[config.PROFILE_KEEP:]:
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+    except OSError as e:
+        logfire.error(f"Failed to save profile {profile_id}: {str(e)}")
+        return
+    logfire.info(f"Saved profile {profile_id} ({elapsed_ms:.0f}ms)")
+
+def profile_report(profile_id: str, limit: int = 60) -> str:
+    """ The saved profile as pstats text, heaviest cumulative time first """
+    output = io.StringIO()
+    stats = pstats.Stats(profile_path(profile_id), stream=output)
+    stats.strip_dirs().sort_stats("cumulative").print_stats(limit)
+    return output.getvalue()
+
+# whole-worker sampling
+
+def sample_stacks(seconds: float, interval: float) -> Counter:
+    """
+    Sample every thread's Python stack for `seconds`, as collapsed stacks
+    ("thread;outer;...;inner") counted by how often they were seen. Blocks,
+    so run it off the event loop.
+    """
+    me = threading.get_ident()
+    stacks: Counter = Counter()
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            labels = []
+            while frame is not None:
+                labels.append(_frame_label(frame))
+                frame = frame.f_back
+            stacks[";".join([names.get(ident, f"thread-{ident}"), *reversed(labels)])] += 1
+        time.sleep(interval)
+    return stacks
+
+class WorkerSampler:
+    """
+    Samples every worker process on this host at once.
+
+    Workers share nothing but the filesystem, so a sampling request is a
+    directory under PROFILING_DIR/samples holding the window to sample. Each
+    worker polls for new requests, samples its own threads and writes
+    `<pid>.collapsed` next to the request, and the worker that took the admin
+    call merges the files as they arrive.
+    """
+    POLL_INTERVAL = 0.5
+
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+        self._seen: set = set()
+
+    @property
+    def directory(self) -> str:
+        return os.path.join(config.PROFILING_DIR, "samples")
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._watch())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(self.POLL_INTERVAL)
+            try:
+                requests = [entry for entry in os.scandir(self.directory) if entry.is_dir() and entry.name not in self._seen]
+            except FileNotFoundError:
+                continue
+            for entry in requests:
+                self._seen.add(entry.name)
+                asyncio.create_task(self._sample(entry.path))
+
+    async def _sample(self, path: str):
+        try:
+            with open(os.path.join(path, "request.json")) as f:
+                request = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return
+        remaining = request["until"] - time.time()
+        if remaining <= 0:
+            return
+        stacks = await asyncio.to_thread(sample_stacks, remaining, request["interval"])
+        output = os.path.join(path, f"{os.getpid()}.collapsed")
+        try:
+            with open(output + ".tmp", "w") as f:
+                f.writelines(f"{stack} {count}\n" for stack, count in stacks.items())
+            os.replace(output + ".tmp", output)
+        except FileNotFoundError:
+            # the caller gave up and removed the request
+            pass
+
+    async def sample(self, seconds: float, interval: float, workers: int) -> Dict[str, Any]:
+        """ Sample all workers for `seconds` and merge their stacks, each under a worker-<pid> root frame """
+        sample_id = new_profile_id()
+        path = os.path.join(self.directory, sample_id)
+        os.makedirs(path)
+        try:
+            with open(os.path.join(path, "request.json"), "w") as f:
+                # every worker finds the request at a slightly different time but stops at the same moment
+                json.dump({"until": time.time() + seconds + self.POLL_INTERVAL, "interval": interval}, f)
+            deadline = time.monotonic() + seconds + self.POLL_INTERVAL * 4 + 1
+            results: List[str] = []
+            while time.monotonic() < deadline:
+                await asyncio.sleep(self.POLL_INTERVAL)
+                results = [name for name in os.listdir(path) if name.endswith(".collapsed")]
+                if len(results) >= workers:
+                    break
+            lines = []
+            for name in sorted(results):
+                with open(os.path.join(path, name)) as f:
+                    lines += [f"worker-{name.split('.')[0]};{line}" for line in f if line.strip()]
+            return {"id": sample_id, "workers": len(results), "collapsed": "".join(lines)}
+        finally:
+            shutil.rmtree(path, ignore_errors=True)
+
+worker_sampler = WorkerSampler()
+
+# event loop lag
+
+class LoopMonitor:
+    """
+    Detects callbacks that block the event loop.
+
+    A task on the loop records a heartbeat every LOOP_LAG_INTERVAL_MS and
+    measures how late each of its wake-ups was. A watchdog thread checks the
+    heartbeat; once it is older than the threshold the loop is stuck in some
+    callback, and the watchdog captures the loop thread's stack while it is
+    still there. The stall is logged with that stack when the loop recovers,
+    so a synchronous SDK call made on the loop shows up by name.
+    """
+    def __init__(self):
+        self.ticks = 0
+        self.stalls = 0
+        self.max_lag_ms = 0.0
+        self.total_lag_ms = 0.0
+        self.last_stall: Optional[Dict[str, Any]] = None
+        self._heartbeat = time.monotonic()
+        self._culprit: Optional[List[str]] = None
+        self._loop_thread: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopped = threading.Event()
+
+    def start(self):
+        if self._task is not None:
+            return
+        self._loop_thread = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._stopped.clear()
+        self._task = asyncio.create_task(self._beat())
+        threading.Thread(target=self._watch, name="loop-watchdog", daemon=True).start()
+
+    async def stop(self):
+        self._stopped.set()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _beat(self):
+        interval = config.LOOP_LAG_INTERVAL_MS / 1000
+        while True:
+            self._heartbeat = time.monotonic()
+            await asyncio.sleep(interval)
+            lag_ms = max(0.0, (time.monotonic() - self._heartbeat - interval) * 1000)
+            self.ticks += 1
+            self.total_lag_ms += lag_ms
+            self.max_lag_ms = max(self.max_lag_ms, lag_ms)
+            if lag_ms >= config.LOOP_LAG_THRESHOLD_MS:
+                self.stalls += 1
+                stack, self._culprit = self._culprit, None
+                self.last_stall = {"lag_ms": round(lag_ms, 1), "stack": stack or []}
+                where = f" in {stack[-1]}" if stack else ""
+                logfire.warning(f"Event loop blocked for {lag_ms:.0f}ms{where}", stack=stack)
+
+    def _watch(self):
+        interval = config.LOOP_LAG_INTERVAL_MS / 1000
+        threshold = config.LOOP_LAG_THRESHOLD_MS / 1000
+        while not self._stopped.wait(min(interval, threshold) / 2):
+            if self._culprit is None and time.monotonic() - self._heartbeat > interval + threshold:
+                frame = sys._current_frames().get(self._loop_thread)
+                if frame is not None:
+                    self._culprit = _stack_summary(frame)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "ticks": self.ticks,
+            "stalls": self.stalls,
+            "avg_lag_ms": round(self.total_lag_ms / self.ticks, 2) if self.ticks else 0.0,
+            "max_lag_ms": round(self.max_lag_ms, 1),
+            "last_stall": self.last_stall,
+        }
+
+loop_monitor = LoopMonitor()
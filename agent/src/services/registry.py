@@ -0,0 +1,35 @@
+from typing import Optional
+
+from .gemini import GeminiService
+from .spoonacular import SpoonacularService
+from ..config import config
+
+class ServiceRegistry:
+    """
+    Process-wide service singletons, built on first use instead of at import.
+    The app lifespan may build them eagerly via the orchestrator's warm_up and
+    drops them on shutdown.
+    """
+    def __init__(self):
+        self._gemini: Optional[GeminiService] = None
+        self._spoonacular: Optional[SpoonacularService] = None
+
+    @property
+    def gemini(self) -> GeminiService:
+        if not self._gemini:
+            self._gemini = GeminiService(config.GEMINI_API_KEY)
+        return self._gemini
+
+    @property
+    def spoonacular(self) -> SpoonacularService:
+        if not self._spoonacular:
+            self._spoonacular = SpoonacularService(config.SPOONACULAR_API_KEY)
+        return self._spoonacular
+
+    async def aclose(self):
+        if self._spoonacular:
+            await self._spoonacular.aclose()
+        self._gemini = None
+        self._spoonacular = None
+
+services = ServiceRegistry()
@@ -0,0 +1,289 @@
+import asyncio
+import random
+import time
+from collections import OrderedDict, deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, TypeVar
+
+import logfire
+from httpx import HTTPStatusError, TransportError
+
+from ..config import config
+
+T = TypeVar("T")
+
+class DeadlineExceeded(Exception):
+    """ Raised when a request's time budget runs out before an upstream call finishes """
+
+class CircuitOpen(Exception):
+    """ Raised instead of calling an upstream that is currently failing """
+
+class Deadline:
+    """
+    End-to-end time budget for one request. Every upstream call derives its
+    timeout from what is left, so a slow early step leaves less time for the
+    later ones instead of pinning the request.
+    """
+    def __init__(self, budget: float):
+        self.budget = budget
+        self.expires_at = time.monotonic() + budget
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def timeout(self, cap: Optional[float] = None) -> float:
+        """ Timeout for the next call: the remaining budget, capped per call """
+        remaining = self.remaining()
+        if remaining <= 0:
+            raise DeadlineExceeded("Request took too long. Please try again.")
+        return min(remaining, cap) if cap else remaining
+
+async def with_deadline(awaitable: Awaitable[T], deadline: Optional[Deadline], cap: float) -> T:
+    """ Await within the remaining budget (or just the cap without a deadline) """
+    try:
+        timeout = deadline.timeout(cap) if deadline else cap
+    except DeadlineExceeded:
+        if asyncio.iscoroutine(awaitable):
+            awaitable.close()
+        raise
+    try:
+        return await asyncio.wait_for(awaitable, timeout)
+    except asyncio.TimeoutError:
+        raise DeadlineExceeded("Request took too long. Please try again.")
+
+class LatencyTracker:
+    """ Rolling window of successful call latencies for one upstream """
+    def __init__(self, window: int = 200):
+        self.samples: Deque[float] = deque(maxlen=window)
+
+    def record(self, seconds: float):
+        self.samples.append(seconds)
+
+    def percentile(self, q: float) -> Optional[float]:
+        if len(self.samples) < config.HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+class CircuitBreaker:
+    """
+    Opens after consecutive failures and rejects calls until the reset timeout
+    has passed, then lets a single trial call through (half-open).
+    """
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def before_call(self):
+        state = self.state
+        if state == "open" or (state == "half_open" and self._trial_in_flight):
+            raise CircuitOpen(f"{self.name} is temporarily unavailable")
+        if state == "half_open":
+            self._trial_in_flight = True
+
+    def end_call(self):
+        # a trial that ended without a verdict (e.g. cancelled) must not block the breaker
+        self._trial_in_flight = False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._trial_in_flight = False
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            if self.opened_at is None:
+                logfire.warning(f"Circuit for {self.name} opened after {self.failures} failures")
+            self.opened_at = time.monotonic()
+
+class StaleCache:
+    """ Last good response per request key, served when an upstream is unhealthy """
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Any, Any]" = OrderedDict()
+
+    def get(self, key) -> Optional[Any]:
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            return self._entries[key]
+        return None
+
+    def put(self, key, value):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_latencies: Dict[str, LatencyTracker] = {}
+
+def breaker_for(name: str) -> CircuitBreaker:
+    if name not in _breakers:
+        _breakers[name] = CircuitBreaker(name, config.BREAKER_FAILURE_THRESHOLD, config.BREAKER_RESET_TIMEOUT)
+    return _breakers[name]
+
+def latency_for(name: str) -> LatencyTracker:
+    if name not in _latencies:
+        _latencies[name] = LatencyTracker()
+    return _latencies[name]
+
+def upstream_stats() -> Dict[str, Dict[str, Any]]:
+    return {
+        name: {
+            "state": breaker.state,
+            "failures": breaker.failures,
+            "p95_ms": (latency_for(name).percentile(0.95) or 0) * 1000,
+        }
+        for name, breaker in _breakers.items()
+    }
+
+def _status_code(error: BaseException) -> Optional[int]:
+    if isinstance(error, HTTPStatusError):
+        return error.response.status_code
+    # google.api_core errors (raised by the Gemini SDK) carry the HTTP status as `code`
+    code = getattr(error, "code", None)
+    return code if isinstance(code, int) else None
+
+def _is_retryable(error: BaseException) -> bool:
+    """ Whether the upstream itself is failing: timeouts, transport errors, 429 and 5xx """
+    if isinstance(error, (asyncio.TimeoutError, TransportError)):
+        return True
+    status = _status_code(error)
+    return status is not None and (status == 429 or status >= 500)
+
+def is_upstream_failure(error: BaseException) -> bool:
+    """ Whether a call_upstream error came from the upstream being down or slow, not from the request """
+    return isinstance(error, (CircuitOpen, DeadlineExceeded)) or _is_retryable(error)
+
+async def _hedged(name: str, attempt: Callable[[float], Awaitable[T]], timeout: float) -> T:
+    """
+    Run one attempt, and if it is still pending after the upstream's p95
+    latency, race a duplicate against it. The loser is cancelled.
+    """
+    hedge_delay = latency_for(name).percentile(config.HEDGE_PERCENTILE) if config.HEDGE_REQUESTS else None
+    primary = asyncio.ensure_future(attempt(timeout))
+    if hedge_delay is None or hedge_delay >= timeout:
+        return await asyncio.wait_for(primary, timeout)
+
+    loop = asyncio.get_running_loop()
+    expires_at = loop.time() + timeout
+    tasks = {primary}
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=hedge_delay)
+        if not done:
+            logfire.info(f"Hedging {name} after {hedge_delay * 1000:.0f}ms")
+            tasks.add(asyncio.ensure_future(attempt(expires_at - loop.time())))
+        error: Optional[BaseException] = None
+        while tasks:
+            done, tasks = await asyncio.wait(
+                tasks,
+                timeout=max(0.0, expires_at - loop.time()),
+                return_when=asyncio.FIRST_COMPLETED
+            )
+            if not done:
+                raise asyncio.TimeoutError()
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in tasks:
+            task.cancel()
+
+async def call_upstream(
+    name: str,
+    attempt: Callable[[float], Awaitable[T]],
+    deadline: Optional[Deadline] = None,
+    idempotent: bool = True,
+    cap: Optional[float] = None
+) -> T:
+    """
+    Call an upstream with a per-attempt timeout derived from the deadline.
+
+    Idempotent calls are retried on timeouts, transport errors, 429 and 5xx
+    with capped exponential backoff and full jitter, and may be hedged. The
+    upstream's circuit breaker is consulted first and raises CircuitOpen when
+    it is failing.
+
+    Args:
+        name: Upstream operation name, used for the breaker and latency stats
+        attempt: Makes one call given its timeout in seconds
+        deadline: Request budget; without one only the cap applies
+        idempotent: Whether the call may be retried and hedged
+        cap: Per-attempt timeout ceiling, UPSTREAM_TIMEOUT by default
+
+    Only upstream failures (timeouts, transport errors, 429 and 5xx) count
+    against the breaker, so one user's bad input cannot open it for everyone,
+    and a call counts once however many attempts it took.
+    A timed-out attempt is abandoned, not stopped: when it runs in a thread
+    (asyncio.to_thread), the thread keeps going until the blocking call
+    returns, so such attempts must apply the timeout they are given to the
+    call itself.
+    """
+    breaker = breaker_for(name)
+    breaker.before_call()
+    try:
+        return await _call_with_retries(name, attempt, breaker, deadline, idempotent, cap or config.UPSTREAM_TIMEOUT)
+    finally:
+        breaker.end_call()
+
+async def _call_with_retries(
+    name: str,
+    attempt: Callable[[float], Awaitable[T]],
+    breaker: CircuitBreaker,
+    deadline: Optional[Deadline],
+    idempotent: bool,
+    cap: float
+) -> T:
+    attempts = 1 + (config.RETRY_ATTEMPTS if idempotent else 0)
+    for attempt_number in range(1, attempts + 1):
+        timeout = deadline.timeout(cap) if deadline else cap
+        started = time.monotonic()
+        try:
+            if idempotent:
+                result = await _hedged(name, attempt, timeout)
+            else:
+                result = await asyncio.wait_for(attempt(timeout), timeout)
+        except Exception as e:
+            retryable = _is_retryable(e)
+            if retryable and attempt_number < attempts:
+                backoff = random.uniform(0, min(config.RETRY_MAX_DELAY, config.RETRY_BASE_DELAY * 2 ** (attempt_number - 1)))
+                if not deadline or backoff < deadline.remaining():
+                    logfire.info(f"Retrying {name} in {backoff * 1000:.0f}ms after: {str(e) or type(e).__name__}")
+                    await asyncio.sleep(backoff)
+                    continue
+                # no time left for another attempt: the budget ran out, whatever the last error was
+                breaker.record_failure()
+                raise DeadlineExceeded(f"{name} failed and the request has no time left to retry: {str(e) or type(e).__name__}") from e
+            # one verdict per call, once its retries are used up
+            if retryable:
+                breaker.record_failure()
+            elif _status_code(e) is not None:
+                # a 4xx means the upstream is healthy and the request is wrong
+                breaker.record_success()
+            # anything else (a rejected photo, a safety block, a cancelled call) says nothing about the upstream
+            if isinstance(e, asyncio.TimeoutError):
+                raise DeadlineExceeded(f"{name} timed out after {timeout:.1f}s")
+            raise
+        else:
+            breaker.record_success()
+            latency_for(name).record(time.monotonic() - started)
+            return result
@@ -0,0 +1,201 @@
+import re
+import zlib
+from typing import Any, Dict, FrozenSet, List, Optional, Tuple
+
+import numpy as np
+
+from ..config import config
+
+_NUMBER = re.compile(r"\d+")
+# a negation covers the words after it up to the end of its clause; "and"/"or" continue a
+# negated list ("without nuts or dairy"), and a postfix "free" ("gluten-free") covers one word
+_CLAUSE = re.compile(r"[,.;:!?()]|\b(?:but|with|plus|then)\b|(?<=free)\b")
+_NEGATIONS = {"no", "not", "without", "free", "avoid", "except", "exclude", "excluding"}
+_STOPWORDS = {
+    "a", "an", "the", "in", "of", "for", "to", "and", "with", "me", "i", "some", "please",
+    "recipe", "recipes", "find", "show", "want", "give", "can", "you", "or", "less", "than",
+}
+# variants that should embed like their usual form
+_SYNONYMS = {
+    "min": "minutes", "mins": "minutes", "minute": "minutes",
+    "hr": "hour", "hrs": "hour", "hours": "hour",
+    "quick": "fast", "quickly": "fast", "easy": "fast",
+    "max": "under", "maximum": "under", "within": "under", "below": "under",
+}
+
+Guard = Tuple[FrozenSet[str], FrozenSet[str]]
+
+def _stem(word: str) -> str:
+    """ Fold plurals so "apple pies" and "apple pie" are the same words """
+    if len(word) <= 3 or word.endswith(("ss", "us", "is")):
+        return word
+    if word.endswith("ries"):
+        # berries, cherries, curries
+        return word[:-3] + "y"
+    if word.endswith("ies"):
+        # pies, cookies, brownies, smoothies
+        return word[:-1]
+    if word.endswith(("ches", "shes", "xes", "oes")):
+        return word[:-2]
+    if word.endswith("s"):
+        return word[:-1]
+    return word
+
+def normalize(text: str) -> str:
+    text = re.sub(r"[^a-z0-9 ]+", " ", text.lower())
+    text = re.sub(r"\b(?:an|a|one) (hour|hr)\b", r"1 \1", text)
+    words = []
+    listed = 0 # where the run of words joined by "and"/"or" that ends the text so far starts
+    joined = False
+    for word in text.split():
+        if word == "free" and words and words[-1] != "no":
+            # "gluten free" negates the word before it, "nut and dairy free" the whole list
+            words.insert(listed, "no")
+        elif word in _NEGATIONS:
+            # all negations mean the same thing to the search
+            words.append("no")
+        elif word in ("and", "or"):
+            joined = True
+            continue
+        elif word not in _STOPWORDS:
+            if not joined:
+                listed = len(words)
+            words.append(_stem(_SYNONYMS.get(word, word)))
+        joined = False
+    return " ".join(words)
+
+def _guard(clauses: List[str]) -> Guard:
+    """
+    Tokens two queries must agree on exactly to share a cache entry. Numbers and
+    negations barely move a bag-of-n-grams vector but flip what is searched for,
+    so each negated word is kept with its negation: the words after a "no" up
+    to the end of its clause. "chicken no garlic" and "garlic no chicken" never
+    match, and in "no nuts, with chicken" only the nuts are negated.
+    """
+    negated = set()
+    for clause in clauses:
+        scoped = False
+        for word in clause.split():
+            if word == "no":
+                scoped = True
+            elif scoped:
+                negated.add(f"no {word}")
+    return frozenset(_NUMBER.findall(" ".join(clauses))), frozenset(negated)
+
+def prepare(query: str) -> Tuple[str, Guard]:
+    """ The normalized text a query is embedded from, and its guard """
+    clauses = [clause for clause in (normalize(part) for part in _CLAUSE.split(query.lower())) if clause]
+    return " ".join(clauses), _guard(clauses)
+
+class HashingEmbedder:
+    """
+    CPU-only text embedding: words, word bigrams and character n-grams hashed
+    into a fixed number of signed buckets, L2-normalized. No model to load.
+    Per-word n-grams keep re-inflected phrasings of a request close in cosine
+    space; the bigrams keep word order, so swapping which words a phrase
+    applies to moves the vector.
+    """
+    def __init__(self, dim: int = 1024, ngram_range: Tuple[int, int] = (3, 5)):
+        self.dim = dim
+        self.ngram_range = ngram_range
+
+    def _features(self, text: str) -> List[str]:
+        features = []
+        low, high = self.ngram_range
+        words = text.split()
+        features.extend(f"b:{first} {second}" for first, second in zip(words, words[1:]))
+        for word in words:
+            features.append(f"w:{word}")
+            padded = f" {word} "
+            for n in range(low, high + 1):
+                features.extend(padded[i:i + n] for i in range(len(padded) - n + 1))
+        return features
+
+    def embed(self, text: str) -> np.ndarray:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for feature in self._features(text):
+            digest = zlib.crc32(feature.encode())
+            vector[digest % self.dim] += 1.0 if digest & 0x80000000 else -1.0
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+class SemanticCache:
+    """
+    Nearest-neighbour cache from query text to a stored value.
+
+    Vectors live in one preallocated float32 matrix so a lookup is a single
+    matrix-vector product. Entries are evicted least-recently-used once the
+    index is full.
+    """
+    def __init__(self, capacity: int, threshold: float, dim: int = 1024):
+        self.capacity = capacity
+        self.threshold = threshold
+        self.embedder = HashingEmbedder(dim)
+        self._vectors = np.zeros((capacity, dim), dtype=np.float32)
+        self._last_used = np.zeros(capacity, dtype=np.int64)
+        self._guards: List[Optional[Guard]] = [None] * capacity
+        self._values: List[Any] = [None] * capacity
+        self._size = 0
+        self._clock = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _tick(self) -> int:
+        self._clock += 1
+        return self._clock
+
+    def get(self, query: str) -> Optional[Any]:
+        if not self._size:
+            self.misses += 1
+            return None
+        text, guard = prepare(query)
+        scores = self._vectors[:self._size] @ self.embedder.embed(text)
+        # best candidate whose numbers and negations match
+        for slot in np.argsort(scores)[::-1][:8]:
+            if scores[slot] < self.threshold:
+                break
+            if self._guards[slot] == guard:
+                self._last_used[slot] = self._tick()
+                self.hits += 1
+                return self._values[slot]
+        self.misses += 1
+        return None
+
+    def put(self, query: str, value: Any):
+        text, guard = prepare(query)
+        if self._size < self.capacity:
+            slot = self._size
+            self._size += 1
+        else:
+            slot = int(np.argmin(self._last_used))
+            self.evictions += 1
+        self._vectors[slot] = self.embedder.embed(text)
+        self._guards[slot] = guard
+        self._values[slot] = value
+        self._last_used[slot] = self._tick()
+
+    def clear(self):
+        self._size = 0
+        self._clock = 0
+        self._last_used[:] = 0
+        self._values = [None] * self.capacity
+        self._guards = [None] * self.capacity
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": self._size,
+            "capacity": self.capacity,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+# RecipeSearchParams keyed by the text query they were extracted from
+query_cache = SemanticCache(
+    capacity=config.SEMANTIC_CACHE_SIZE,
+    threshold=config.SEMANTIC_CACHE_THRESHOLD,
+    dim=config.SEMANTIC_CACHE_DIM
+)
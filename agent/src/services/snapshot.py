@@ -0,0 +1,147 @@
+import gzip
+import json
+import time
+from typing import Any, Dict, List, Optional
+
+import logfire
+
+from .semantic_cache import query_cache
+from ..models.recipe import RecipeDetails, RecipeSearchParams
+from ..config import config
+
+SNAPSHOT_VERSION = 1
+
+def ingredients_key(ingredients: str, number: int, ranking: int) -> str:
+    """ Order- and case-insensitive key for a findByIngredients call """
+    names = sorted({name.strip().lower() for name in ingredients.split(",") if name.strip()})
+    return f"{number}:{ranking}:{','.join(names)}"
+
+def search_key(params: RecipeSearchParams) -> str:
+    return params.model_dump_json(exclude_none=True)
+
+class RecipeSnapshot:
+    """
+    Recipe details and search results captured offline by warm_cache.py.
+
+    The service answers from it before calling Spoonacular: searches whose
+    parameters were warmed return their stored results, and detail lookups
+    only fetch ids the snapshot does not have. The file is plain JSON
+    (gzipped when the path ends in .gz) so it can be built anywhere and
+    shipped with a deploy.
+    """
+    def __init__(self):
+        self.recipes: Dict[int, RecipeDetails] = {}
+        self.ingredient_searches: Dict[str, List[Dict]] = {}
+        self.complex_searches: Dict[str, List[int]] = {}
+        self.queries: Dict[str, RecipeSearchParams] = {} # text query -> extracted params
+        self.created_at: Optional[float] = None
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self.recipes)
+
+    def recipe(self, recipe_id: int) -> Optional[RecipeDetails]:
+        recipe = self.recipes.get(recipe_id)
+        if recipe is None:
+            return None
+        return recipe.model_copy(deep=True)
+
+    def ingredient_search(self, ingredients: str, number: int, ranking: int) -> Optional[List[Dict]]:
+        results = self.ingredient_searches.get(ingredients_key(ingredients, number, ranking))
+        self._count(results)
+        return list(results) if results is not None else None
+
+    def complex_search(self, params: RecipeSearchParams) -> Optional[List[RecipeDetails]]:
+        ids = self.complex_searches.get(search_key(params))
+        if ids is not None and not all(recipe_id in self.recipes for recipe_id in ids):
+            ids = None
+        self._count(ids)
+        return [self.recipe(recipe_id) for recipe_id in ids] if ids is not None else None
+
+    def _count(self, result):
+        if result is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+
+    def add_recipes(self, recipes: List[RecipeDetails]):
+        for recipe in recipes:
+            # match counts belong to one ingredient search, not to the recipe
+            self.recipes[recipe.id] = recipe.model_copy(update={
+                "usedIngredients": None,
+                "missedIngredients": None,
+                "usedIngredientCount": None,
+                "missedIngredientCount": None,
+            })
+
+    def add_ingredient_search(self, ingredients: str, number: int, ranking: int, results: List[Dict]):
+        self.ingredient_searches[ingredients_key(ingredients, number, ranking)] = results
+
+    def add_complex_search(self, params: RecipeSearchParams, recipes: List[RecipeDetails], query: Optional[str] = None):
+        self.complex_searches[search_key(params)] = [recipe.id for recipe in recipes]
+        self.add_recipes(recipes)
+        if query:
+            self.queries[query] = params
+
+    def save(self, path: str):
+        data = {
+            "version": SNAPSHOT_VERSION,
+            "created_at": time.time(),
+            "recipes": [recipe.model_dump(exclude_none=True) for recipe in self.recipes.values()],
+            "ingredient_searches": self.ingredient_searches,
+            "complex_searches": self.complex_searches,
+            "queries": {query: params.model_dump(exclude_none=True) for query, params in self.queries.items()},
+        }
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "wt", encoding="utf-8") as f:
+            json.dump(data, f)
+
+    def load(self, path: str):
+        """ Replace the contents with the snapshot at path """
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "rt", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") != SNAPSHOT_VERSION:
+            raise ValueError(f"Unsupported recipe snapshot version: {data.get('version')}")
+
+        self.recipes = {}
+        for recipe_data in data.get("recipes", []):
+            try:
+                recipe = RecipeDetails(**recipe_data)
+                self.recipes[recipe.id] = recipe
+            except Exception as e:
+                logfire.warning(f"Skipping snapshot recipe {recipe_data.get('id', 'unknown')}: {e}")
+        self.ingredient_searches = data.get("ingredient_searches", {})
+        self.complex_searches = data.get("complex_searches", {})
+        self.queries = {query: RecipeSearchParams(**params) for query, params in data.get("queries", {}).items()}
+        self.created_at = data.get("created_at")
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "recipes": len(self.recipes),
+            "searches": len(self.ingredient_searches) + len(self.complex_searches),
+            "created_at": self.created_at,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+# loaded at startup from RECIPE_SNAPSHOT_PATH; empty otherwise
+recipe_snapshot = RecipeSnapshot()
+
+def load_recipe_snapshot(path: str):
+    """
+    Load the snapshot into the process-wide instance and seed the semantic
+    cache with the warmed text queries, so they skip the extractor too.
+    """
+    started = time.perf_counter()
+    recipe_snapshot.load(path)
+    if config.SEMANTIC_CACHE_ENABLED:
+        for query, params in recipe_snapshot.queries.items():
+            query_cache.put(query, params)
+    logfire.info(
+        f"Loaded recipe snapshot with {len(recipe_snapshot)} recipes "
+        f"in {(time.perf_counter() - started) * 1000:.0f}ms"
+    )
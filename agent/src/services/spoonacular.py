@@ -1,18 +1,71 @@
-from typing import List, Dict
+from typing import Any, List, Dict, Optional
 from httpx import AsyncClient, HTTPStatusError
 import logfire
 from ..models.recipe import RecipeDetails, RecipeSearchParams
+from ..config import config
+from .resilience import Deadline, StaleCache, call_upstream, is_upstream_failure
+from .nutrition import fill_missing_nutrition
+from .snapshot import recipe_snapshot
 
 class SpoonacularService:
     def __init__(self, api_key: str):
         self.api_key = api_key
-        self.base_url = "https://api.spoonacular.com"
+        self.base_url = config.SPOONACULAR_BASE_URL
+        self._stale = StaleCache(config.STALE_CACHE_SIZE)
+        self._client: Optional[AsyncClient] = None
+
+    @property
+    def client(self) -> AsyncClient:
+        # one pooled client per service so retries and hedges reuse connections
+        if self._client is None or self._client.is_closed:
+            self._client = AsyncClient()
+        return self._client
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+
+    async def _get_json(
+        self,
+        name: str,
+        path: str,
+        params: Dict[str, Any],
+        deadline: Optional[Deadline] = None
+    ) -> Any:
+        """
+        GET an endpoint with deadline-derived timeouts, retries, optional hedging
+        and a circuit breaker. When the call ultimately fails, the last good
+        response for the same parameters is served instead if there is one.
+        """
+        key = (path, tuple(sorted((k, str(v)) for k, v in params.items())))
+
+        async def attempt(timeout: float):
+            response = await self.client.get(
+                f"{self.base_url}{path}",
+                params={**params, "apiKey": self.api_key},
+                timeout=timeout
+            )
+            response.raise_for_status()
+            return response.json()
+
+        try:
+            data = await call_upstream(f"spoonacular.{name}", attempt, deadline)
+        except Exception as e:
+            # a 401, 402 or 404 is an answer, not an outage: only cover for an upstream that is down
+            cached = self._stale.get(key) if is_upstream_failure(e) else None
+            if cached is None:
+                raise
+            logfire.warning(f"Serving cached {name} response after error: {str(e)}")
+            return cached
+        self._stale.put(key, data)
+        return data
     
     async def search_by_ingredients(
         self, 
         ingredients: str, 
         number: int = 20,
-        ranking: int = 2
+        ranking: int = 2,
+        deadline: Optional[Deadline] = None
     ) -> List[Dict]:
         """
         For fridge workflow - returns basic recipe info with used/missed ingredients
@@ -21,28 +74,29 @@ class SpoonacularService:
             ingredients: Comma-separated list of ingredients
             number: Number of recipes to return
             ranking: 1 = maximize used ingredients, 2 = minimize missing ingredients
+            deadline: Request time budget the call must fit in
             
         Returns:
             List of recipe dictionaries with basic info and ingredient matches
         """
+        warmed = recipe_snapshot.ingredient_search(ingredients, number, ranking)
+        if warmed is not None:
+            return warmed
         try:
-            async with AsyncClient() as client:
-                response = await client.get(
-                    f"{self.base_url}/recipes/findByIngredients",
-                    params={
-                        "ingredients": ingredients,
-                        "number": number,
-                        "ranking": ranking,
-                        "ignorePantry": True,
-                        "apiKey": self.api_key
-                    }
-                )
-                response.raise_for_status()
-                
-                recipes = response.json()
-                logfire.info(f"Found {len(recipes)} recipes with ingredients: {ingredients[:50]}...")
-                return recipes
-                
+            recipes = await self._get_json(
+                "findByIngredients",
+                "/recipes/findByIngredients",
+                {
+                    "ingredients": ingredients,
+                    "number": number,
+                    "ranking": ranking,
+                    "ignorePantry": True,
+                },
+                deadline
+            )
+            logfire.info(f"Found {len(recipes)} recipes with ingredients: {ingredients}")
+            return recipes
+            
         except HTTPStatusError as e:
             if e.response.status_code == 402:
                 logfire.error("Spoonacular API quota exceeded")
@@ -58,60 +112,78 @@ class SpoonacularService:
             logfire.error(f"Spoonacular search_by_ingredients error: {str(e)}")
             raise Exception(f"Failed to search recipes: {str(e)}")
     
+    @staticmethod
+    def _with_nutrition(recipes: List[RecipeDetails]) -> List[RecipeDetails]:
+        # with NUTRITION_SOURCE=local details come without nutrition; estimate it in one batched pass
+        if config.NUTRITION_SOURCE == "local":
+            fill_missing_nutrition(recipes)
+        return recipes
+
     async def get_recipe_details_bulk(
         self, 
-        recipe_ids: List[int]
+        recipe_ids: List[int],
+        deadline: Optional[Deadline] = None
     ) -> List[RecipeDetails]:
         """
         For fridge workflow - gets full details for multiple recipes
         
         Args:
             recipe_ids: List of recipe IDs to fetch
+            deadline: Request time budget the call must fit in
             
         Returns:
             List of RecipeDetails objects with full information
         """
         if not recipe_ids:
             return []
+
+        # serve what the snapshot has and only fetch the rest
+        warmed = {}
+        for recipe_id in recipe_ids:
+            recipe = recipe_snapshot.recipe(recipe_id)
+            if recipe is not None:
+                warmed[recipe_id] = recipe
+        missing = [recipe_id for recipe_id in recipe_ids if recipe_id not in warmed]
+        if not missing:
+            return self._with_nutrition(list(warmed.values()))
             
         try:
-            async with AsyncClient() as client:
-                ids_str = ",".join(str(id) for id in recipe_ids)
-                response = await client.get(
-                    f"{self.base_url}/recipes/informationBulk",
-                    params={
-                        "ids": ids_str,
-                        "includeNutrition": True,
-                        "apiKey": self.api_key
-                    }
-                )
-                response.raise_for_status()
-                
-                recipes_data = response.json()
-                
-                # parse to RecipeDetails objects with error handling
-                parsed_recipes = []
-                for recipe_data in recipes_data:
-                    try:
-                        # handle missing extendedIngredients
-                        if 'extendedIngredients' in recipe_data and 'ingredients' not in recipe_data:
-                            recipe_data['ingredients'] = recipe_data['extendedIngredients']
-                        
-                        recipe = RecipeDetails(**recipe_data)
-                        parsed_recipes.append(recipe)
-                        
-                    except Exception as parse_error:
-                        recipe_id = recipe_data.get('id', 'unknown')
-                        recipe_title = recipe_data.get('title', 'Unknown')
-                        logfire.warning(
-                            f"Failed to parse recipe {recipe_id} ({recipe_title}): {parse_error}"
-                        )
-                        # skip this recipe but continue with others
-                        continue
-                
-                logfire.info(f"Successfully parsed {len(parsed_recipes)}/{len(recipes_data)} recipes")
-                return parsed_recipes
-                
+            ids_str = ",".join(str(id) for id in missing)
+            recipes_data = await self._get_json(
+                "informationBulk",
+                "/recipes/informationBulk",
+                {
+                    "ids": ids_str,
+                    "includeNutrition": config.NUTRITION_SOURCE != "local",
+                },
+                deadline
+            )
+            # parse to RecipeDetails objects with error handling
+            parsed_recipes = []
+            for recipe_data in recipes_data:
+                try:
+                    # handle missing extendedIngredients
+                    if 'extendedIngredients' in recipe_data and 'ingredients' not in recipe_data:
+                        recipe_data['ingredients'] = recipe_data['extendedIngredients']
+                    
+                    recipe = RecipeDetails(**recipe_data)
+                    parsed_recipes.append(recipe)
+                    
+                except Exception as parse_error:
+                    recipe_id = recipe_data.get('id', 'unknown')
+                    recipe_title = recipe_data.get('title', 'Unknown')
+                    logfire.warning(
+                        f"Failed to parse recipe {recipe_id} ({recipe_title}): {parse_error}"
+                    )
+                    # skip this recipe but continue with others
+                    continue
+            
+            logfire.info(f"Successfully parsed {len(parsed_recipes)}/{len(recipes_data)} recipes")
+            if not warmed:
+                return self._with_nutrition(parsed_recipes)
+            by_id = {**warmed, **{recipe.id: recipe for recipe in parsed_recipes}}
+            return self._with_nutrition([by_id[recipe_id] for recipe_id in recipe_ids if recipe_id in by_id])
+            
         except HTTPStatusError as e:
             if e.response.status_code == 402:
                 logfire.error("Spoonacular API quota exceeded")
@@ -126,77 +198,79 @@ class SpoonacularService:
     
     async def complex_search(
         self,
-        params: RecipeSearchParams
+        params: RecipeSearchParams,
+        deadline: Optional[Deadline] = None
     ) -> List[RecipeDetails]:
         """
         For text queries - returns full recipe details directly
         
         Args:
             params: Recipe search parameters from natural language extraction
+            deadline: Request time budget the call must fit in
             
         Returns:
             List of RecipeDetails objects with full information
         """
+        warmed = recipe_snapshot.complex_search(params)
+        if warmed is not None:
+            return self._with_nutrition(warmed)
         try:
-            async with AsyncClient() as client:
-                request_params = {
-                    "query": params.query,
-                    "number": params.number,
-                    "apiKey": self.api_key,
-                    "addRecipeInformation": True,
-                    "addRecipeNutrition": True,
-                    "fillIngredients": True,
-                }
-                
-                # add optional parameters only if they have values
-                if params.cuisine:
-                    request_params["cuisine"] = params.cuisine
-                if params.intolerances:
-                    request_params["intolerances"] = params.intolerances
-                if params.includeIngredients:
-                    request_params["includeIngredients"] = params.includeIngredients
-                if params.excludeIngredients:
-                    request_params["excludeIngredients"] = params.excludeIngredients
-                if params.maxReadyTime:
-                    request_params["maxReadyTime"] = params.maxReadyTime
-                
-                response = await client.get(
-                    f"{self.base_url}/recipes/complexSearch",
-                    params=request_params
-                )
-                response.raise_for_status()
-                
-                data = response.json()
-                recipes_data = data.get('results', [])
-                total_results = data.get('totalResults', 0)
-                
-                logfire.info(
-                    f"Complex search for '{params.query}' found {len(recipes_data)} recipes "
-                    f"(total available: {total_results})"
-                )
-                
-                # parse to RecipeDetails objects with error handling
-                parsed_recipes = []
-                for recipe_data in recipes_data:
-                    try:
-                        # handle missing extendedIngredients
-                        if 'extendedIngredients' in recipe_data and 'ingredients' not in recipe_data:
-                            recipe_data['ingredients'] = recipe_data['extendedIngredients']
-                        
-                        recipe = RecipeDetails(**recipe_data)
-                        parsed_recipes.append(recipe)
-                        
-                    except Exception as parse_error:
-                        recipe_id = recipe_data.get('id', 'unknown')
-                        recipe_title = recipe_data.get('title', 'Unknown')
-                        logfire.warning(
-                            f"Failed to parse recipe {recipe_id} ({recipe_title}) "
-                            f"in complex search: {parse_error}"
-                        )
-                        continue
-                
-                return parsed_recipes
-                
+            request_params = {
+                "query": params.query,
+                "number": params.number,
+                "addRecipeInformation": True,
+                "addRecipeNutrition": config.NUTRITION_SOURCE != "local",
+                "fillIngredients": True,
+            }
+            
+            # add optional parameters only if they have values
+            if params.cuisine:
+                request_params["cuisine"] = params.cuisine
+            if params.intolerances:
+                request_params["intolerances"] = params.intolerances
+            if params.includeIngredients:
+                request_params["includeIngredients"] = params.includeIngredients
+            if params.excludeIngredients:
+                request_params["excludeIngredients"] = params.excludeIngredients
+            if params.maxReadyTime:
+                request_params["maxReadyTime"] = params.maxReadyTime
+            
+            data = await self._get_json(
+                "complexSearch",
+                "/recipes/complexSearch",
+                request_params,
+                deadline
+            )
+            recipes_data = data.get('results', [])
+            total_results = data.get('totalResults', 0)
+            
+            logfire.info(
+                f"Complex search for '{params.query}' found {len(recipes_data)} recipes "
+                f"(total available: {total_results})"
+            )
+            
+            # parse to RecipeDetails objects with error handling
+            parsed_recipes = []
+            for recipe_data in recipes_data:
+                try:
+                    # handle missing extendedIngredients
+                    if 'extendedIngredients' in recipe_data and 'ingredients' not in recipe_data:
+                        recipe_data['ingredients'] = recipe_data['extendedIngredients']
+                    
+                    recipe = RecipeDetails(**recipe_data)
+                    parsed_recipes.append(recipe)
+                    
+                except Exception as parse_error:
+                    recipe_id = recipe_data.get('id', 'unknown')
+                    recipe_title = recipe_data.get('title', 'Unknown')
+                    logfire.warning(
+                        f"Failed to parse recipe {recipe_id} ({recipe_title}) "
+                        f"in complex search: {parse_error}"
+                    )
+                    continue
+            
+            return self._with_nutrition(parsed_recipes)
+            
         except HTTPStatusError as e:
             if e.response.status_code == 402:
                 logfire.error("Spoonacular API quota exceeded")
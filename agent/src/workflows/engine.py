@@ -0,0 +1,253 @@
+import asyncio
+import threading
+import time
+from dataclasses import dataclass, fields
+from typing import Any, AsyncGenerator, Awaitable, Callable, Dict, Hashable, List, Optional, Sequence, Set, Tuple, Union
+
+import logfire
+
+from ..models.deps import Deps
+from ..services.resilience import DeadlineExceeded, StaleCache
+from ..config import config
+
+_DEPS_FIELDS = {f.name for f in fields(Deps)}
+
+class StopPipeline(Exception):
+    """ Raised by a step to end the run early with a final event, e.g. when a search finds nothing """
+    def __init__(self, event: Dict[str, Any]):
+        super().__init__(event.get("message", ""))
+        self.event = event
+
+@dataclass
+class Step:
+    """
+    One node of a pipeline. The step starts as soon as every Deps field in
+    `inputs` has been produced by another step (or was set on Deps up front),
+    and whatever `run` returns is stored on the Deps field named by `output`.
+    A step whose output is already set when the pipeline starts does not run.
+    """
+    name: str
+    run: Callable[[Deps], Awaitable[Any]]
+    inputs: Sequence[str] = ()
+    output: Optional[str] = None
+    message: Union[str, Callable[[Deps], str], None] = None # in_progress text; steps without one emit no events
+    report: Optional[Callable[[Deps, Any], Dict[str, Any]]] = None # message/data/summary of the complete event
+    on_error: str = "fail" # "fail" ends the run, "skip" drops this step and its dependents, "fallback" uses fallback()
+    fallback: Optional[Callable[[Deps, Exception], Any]] = None
+    error_message: str = "{error}" # text of the error event
+    retries: int = 0 # extra attempts before the error policy applies
+    memo_key: Optional[Callable[[Deps], Hashable]] = None # reuse the output across requests with the same key
+
+class WorkflowStats:
+    """ Per-step run counts and timings for every pipeline in the worker """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.steps: Dict[str, Dict[str, float]] = {}
+
+    def record(self, step: str, seconds: float, outcome: str):
+        with self._lock:
+            stats = self.steps.setdefault(step, {"runs": 0, "total_ms": 0.0, "max_ms": 0.0})
+            stats["runs"] += 1
+            stats[outcome] = stats.get(outcome, 0) + 1
+            stats["total_ms"] += seconds * 1000
+            stats["max_ms"] = max(stats["max_ms"], seconds * 1000)
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            return {
+                step: {**stats, "avg_ms": stats["total_ms"] / stats["runs"]}
+                for step, stats in self.steps.items()
+            }
+
+workflow_stats = WorkflowStats()
+
+class Pipeline:
+    """
+    A DAG of steps over a Deps instance.
+
+    Dependencies come from the declared inputs and outputs, so independent
+    branches run concurrently. run() streams a `step` event when each step
+    with a message starts and completes (the latter with its duration), then
+    the event built by `finish`. A failing step ends the run with an `error`
+    event unless its error policy says otherwise.
+    """
+    def __init__(self, name: str, steps: List[Step], finish: Callable[[Deps], Dict[str, Any]]):
+        self.name = name
+        self.steps = {step.name: step for step in steps}
+        self.finish = finish
+        if len(self.steps) != len(steps):
+            raise ValueError(f"Duplicate step names in pipeline {name}")
+
+        producers: Dict[str, str] = {}
+        for step in steps:
+            for field in [*step.inputs, *([step.output] if step.output else [])]:
+                if field not in _DEPS_FIELDS:
+                    raise ValueError(f"Step {step.name} refers to unknown Deps field {field}")
+            if step.output:
+                if step.output in producers:
+                    raise ValueError(f"Steps {producers[step.output]} and {step.name} both produce {step.output}")
+                producers[step.output] = step.name
+            if step.on_error == "fallback" and not step.fallback:
+                raise ValueError(f"Step {step.name} has a fallback policy but no fallback")
+        self.dependencies: Dict[str, Set[str]] = {
+            step.name: {producers[field] for field in step.inputs if field in producers}
+            for step in steps
+        }
+        self._check_acyclic()
+        self._memos = {step.name: StaleCache(config.WORKFLOW_MEMO_SIZE) for step in steps if step.memo_key}
+
+    def _check_acyclic(self):
+        resolved: Set[str] = set()
+        remaining = dict(self.dependencies)
+        while remaining:
+            ready = [name for name, needs in remaining.items() if needs <= resolved]
+            if not ready:
+                raise ValueError(f"Pipeline {self.name} has a dependency cycle among {sorted(remaining)}")
+            for name in ready:
+                resolved.add(name)
+                del remaining[name]
+
+    async def _execute(self, step: Step, deps: Deps) -> Tuple[Any, bool]:
+        """ Run a step with its memo and retries; returns (output, from_memo) """
+        memo = self._memos.get(step.name)
+        key = step.memo_key(deps) if memo else None
+        if memo and key is not None:
+            cached = memo.get(key)
+            if cached is not None:
+                return cached, True
+
+        for attempt in range(step.retries + 1):
+            try:
+                output = await step.run(deps)
+                break
+            except (StopPipeline, DeadlineExceeded):
+                raise
+            except Exception as e:
+                if attempt == step.retries:
+                    raise
+                logfire.warning(f"Step {self.name}.{step.name} failed, retrying: {str(e)}")
+        if memo and key is not None and output is not None:
+            memo.put(key, output)
+        return output, False
+
+    async def _run_step(self, step: Step, deps: Deps, queue: asyncio.Queue):
+        """ Task body: emits the step's events, then reports (name, outcome, value) on the queue """
+        qualified = f"{self.name}.{step.name}"
+        started = time.perf_counter()
+        try:
+            outcome, value = await self._step_events(step, deps, queue)
+        except asyncio.CancelledError as e:
+            # cancelled (client gone or a sibling failed); hand the error to the runner as is
+            queue.put_nowait((step.name, "cancelled", e))
+            raise
+        except Exception as e:
+            # a message, report or fallback callback failed; end the run rather than leave it waiting
+            logfire.error(f"Step {qualified} failed outside its error policy: {str(e)}")
+            outcome, value = "errors", e
+        workflow_stats.record(qualified, time.perf_counter() - started, outcome)
+        await queue.put((step.name, outcome, value))
+
+    async def _step_events(self, step: Step, deps: Deps, queue: asyncio.Queue) -> Tuple[str, Any]:
+        """ Run the step under its error policy, emitting its progress events; returns (outcome, value) """
+        qualified = f"{self.name}.{step.name}"
+        if step.message:
+            message = step.message(deps) if callable(step.message) else step.message
+            await queue.put({"type": "step", "step": step.name, "status": "in_progress", "message": message})
+
+        started = time.perf_counter()
+        outcome, value = "ok", None
+        with logfire.span(qualified) as span:
+            try:
+                value, memo_hit = await self._execute(step, deps)
+                if memo_hit:
+                    outcome = "memo_hits"
+                    span.set_attribute("memo_hit", True)
+            except StopPipeline as e:
+                outcome, value = "stopped", e
+            except Exception as e:
+                span.set_attribute("error", str(e))
+                if step.on_error == "fallback":
+                    logfire.warning(f"Step {qualified} failed, using fallback: {str(e)}")
+                    try:
+                        outcome, value = "fallbacks", step.fallback(deps, e)
+                    except Exception as fallback_error:
+                        outcome, value = "errors", fallback_error
+                else:
+                    outcome, value = ("skipped" if step.on_error == "skip" else "errors"), e
+        seconds = time.perf_counter() - started
+
+        if outcome in ("ok", "memo_hits", "fallbacks"):
+            if step.output:
+                setattr(deps, step.output, value)
+            if outcome == "fallbacks":
+                deps.degraded_steps.append(step.name)
+            if step.message:
+                event = {"type": "step", "step": step.name, "status": "complete"}
+                event.update(step.report(deps, value) if step.report else {"message": f"{step.name} complete"})
+                event["data"] = {**(event.get("data") or {}), "duration_ms": round(seconds * 1000, 1)}
+                await queue.put(event)
+        elif outcome == "skipped" and step.message:
+            await queue.put({"type": "step", "step": step.name, "status": "skipped", "message": str(value)})
+        return outcome, value
+
+    async def run(self, deps: Deps) -> AsyncGenerator[dict, None]:
+        queue: asyncio.Queue = asyncio.Queue()
+        done: Set[str] = set()
+        skipped: Set[str] = set()
+        pending = {
+            name: needs for name, needs in self.dependencies.items()
+            # outputs supplied up front (e.g. params from the router) need not be computed
+            if not (self.steps[name].output and getattr(deps, self.steps[name].output) is not None)
+        }
+        done.update(set(self.steps) - set(pending))
+        tasks: Dict[str, asyncio.Task] = {}
+
+        def schedule():
+            settled = True
+            while settled:
+                settled = False
+                for name, needs in list(pending.items()):
+                    if needs & skipped:
+                        # dependents of a skipped step are skipped too
+                        del pending[name]
+                        skipped.add(name)
+                        settled = True
+                        logfire.info(f"Skipping {self.name}.{name}: an input was skipped")
+                    elif needs <= done:
+                        del pending[name]
+                        tasks[name] = asyncio.create_task(self._run_step(self.steps[name], deps, queue))
+
+        try:
+            schedule()
+            while tasks:
+                item = await queue.get()
+                if isinstance(item, dict):
+                    yield item
+                    continue
+                name, outcome, value = item
+                tasks.pop(name, None)
+                if outcome == "cancelled":
+                    raise value
+                if outcome == "stopped":
+                    yield value.event
+                    return
+                if outcome == "errors":
+                    yield {"type": "error", "step": name, "message": self.steps[name].error_message.format(error=value)}
+                    return
+                if outcome == "skipped":
+                    logfire.warning(f"Step {self.name}.{name} failed, skipping: {str(value)}")
+                    skipped.add(name)
+                else:
+                    done.add(name)
+                schedule()
+
+            try:
+                final = self.finish(deps)
+            except Exception as e:
+                logfire.error(f"Pipeline {self.name} failed to build its result: {str(e)}")
+                final = {"type": "error", "message": str(e)}
+            yield final
+        finally:
+            # stop branches still running when the run ends early or is cancelled
+            for task in tasks.values():
+                task.cancel()
@@ -1,102 +1,154 @@
 import logfire
-from typing import Dict
-from pydantic_ai import RunContext
+from typing import Any, Dict, List
 
 from ..models.deps import Deps
-from ..agents.formatter import formatter_agent
+from ..agents.formatter import get_formatter_agent
+from ..models.ingredients import ExtractedIngredients
 from ..models.recipe import RecipeDetails
+from ..services.resilience import with_deadline
+from ..config import config
+from .engine import Pipeline, Step, StopPipeline
 
-# 1) analyze ingredients within fridge
-async def analyze_fridge_image(ctx: RunContext[Deps]) -> str:
+def _image_count(deps: Deps) -> int:
+    if not deps.image_base64:
+        return 0
+    return 1 if isinstance(deps.image_base64, str) else len(deps.image_base64)
+
+# 1) analyze ingredients within fridge image(s); several photos share one search and detail fetch
+async def analyze_fridge_image(deps: Deps) -> ExtractedIngredients:
     """Extract ingredients from fridge image"""
-    if not ctx.deps.image_base64:
-        return "No image provided"
-    
-    extracted = await ctx.deps.gemini.extract_ingredients_from_image(
-        ctx.deps.image_base64
+    if not deps.image_base64:
+        # e.g. a text message the router sent down the fridge path
+        raise Exception("Please attach a photo of your fridge so I can see what's inside")
+    return await deps.gemini.extract_ingredients_from_image(
+        deps.image_base64,
+        cancel_token=deps.cancel_token,
+        deadline=deps.deadline
     )
-    
-    ctx.deps.extracted_ingredients = extracted
-    logfire.info(f"Extracted {len(extracted.ingredients)} ingredients")
-    return f"Found {len(extracted.ingredients)} ingredients"
 
 # 2) format ingredients
-async def format_ingredients_for_search(ctx: RunContext[Deps]) -> str:
+async def format_ingredients_for_search(deps: Deps) -> str:
     """Format extracted ingredients for recipe search"""
-    if not ctx.deps.extracted_ingredients:
-        return "No ingredients to format"
-    
-    result = await formatter_agent.run(
-        f"Format these ingredients: {', '.join(ctx.deps.extracted_ingredients.ingredients)}"
+    result = await with_deadline(
+        get_formatter_agent().run(f"Format these ingredients: {', '.join(deps.extracted_ingredients.ingredients)}"),
+        deps.deadline,
+        config.GEMINI_TIMEOUT
     )
-    
-    ctx.deps.formatted_ingredients = result.data.ingredients
-    return f"Formatted ingredients: {ctx.deps.formatted_ingredients}"
+    return result.data.ingredients
 
 # 3) find recipes using the formatted ingredients
-async def search_recipes_by_ingredients(ctx: RunContext[Deps]) -> str:
+async def search_recipes_by_ingredients(deps: Deps) -> List[Dict]:
     """Search recipes using available ingredients"""
-    if not ctx.deps.formatted_ingredients:
-        return "No formatted ingredients"
-    
-    results = await ctx.deps.spoonacular.search_by_ingredients(
-        ctx.deps.formatted_ingredients
-    )
-    
-    ctx.deps.ingredient_search_results = results
-    return f"Found {len(results)} recipes"
+    results = await deps.spoonacular.search_by_ingredients(deps.formatted_ingredients, deadline=deps.deadline)
+    if len(results) == 0:
+        raise StopPipeline({
+            "type": "complete",
+            "message": "No recipes found with those ingredients. Try adding more ingredients or using different ones.",
+            "recipes": []
+        })
+    return results
 
 # 4) get details of the recipes using extracted ingredients
-async def get_recipe_details_for_ingredient_search(ctx: RunContext[Deps]) -> str:
+async def get_recipe_details_for_ingredient_search(deps: Deps) -> List[RecipeDetails]:
     """Get full details for recipes found by ingredients"""
-    if not ctx.deps.ingredient_search_results:
-        return "No recipes to get details for"
-    
-    recipe_ids = [r['id'] for r in ctx.deps.ingredient_search_results]
-    details = await ctx.deps.spoonacular.get_recipe_details_bulk(recipe_ids)
-    
-    # create a mapping of search results by ID for quick lookup
-    search_results_map = {r['id']: r for r in ctx.deps.ingredient_search_results}
-    
-    # enhance each recipe with ingredient match information
+    recipe_ids = [r['id'] for r in deps.ingredient_search_results]
+    return await deps.spoonacular.get_recipe_details_bulk(recipe_ids, deadline=deps.deadline)
+
+def basic_search_results(deps: Deps, error: Exception) -> List[RecipeDetails]:
+    # fall back to the basic search results rather than failing after the expensive steps
+    return [RecipeDetails(**r) for r in deps.ingredient_search_results]
+
+def recipes_found(deps: Deps) -> Dict[str, Any]:
+    """Merge ingredient match info into the details and rank by ingredients used"""
+    search_results_map = {r['id']: r for r in deps.ingredient_search_results}
     enhanced_recipes = []
-    for recipe in details:
-        # convert to dict to modify
+    for recipe in deps.recipe_details:
         recipe_dict = recipe.model_dump()
-        
-        # add ingredient match info from search results
         if recipe.id in search_results_map:
             search_result = search_results_map[recipe.id]
             recipe_dict['usedIngredients'] = search_result.get('usedIngredients', [])
             recipe_dict['missedIngredients'] = search_result.get('missedIngredients', [])
             recipe_dict['usedIngredientCount'] = search_result.get('usedIngredientCount', 0)
             recipe_dict['missedIngredientCount'] = search_result.get('missedIngredientCount', 0)
-        
-        # create RecipeDetails with the added fields
-        enhanced_recipe = RecipeDetails(**recipe_dict)
-        enhanced_recipes.append(enhanced_recipe)
-    
-    ctx.deps.recipe_details = enhanced_recipes
-    return f"Retrieved details for {len(enhanced_recipes)} recipes"
+        enhanced_recipes.append(recipe_dict)
+    enhanced_recipes.sort(
+        key=lambda r: (
+            r.get('usedIngredientCount', 0),
+            -r.get('missedIngredientCount', 0)
+        ),
+        reverse=True
+    )
+    degraded = "get_details" in deps.degraded_steps
+    message = f"Found {len(enhanced_recipes)} delicious recipes you can make with your ingredients!"
+    if degraded:
+        message += " Full recipe details are temporarily unavailable."
+    logfire.info(f"Image workflow found {len(enhanced_recipes)} recipes")
+    return {
+        "type": "complete",
+        "message": message,
+        "recipes": enhanced_recipes,
+        "summary": {
+            "total_ingredients_found": len(deps.extracted_ingredients.ingredients),
+            "ingredients_used_for_search": deps.formatted_ingredients,
+            "total_recipes": len(enhanced_recipes),
+            "degraded": degraded
+        }
+    }
 
-# main workflow function
-async def run_image_workflow(ctx: RunContext[Deps]) -> Dict:
-    """Execute complete image workflow"""
-    steps = [
-        ("Analyzing image", analyze_fridge_image),
-        ("Formatting ingredients", format_ingredients_for_search),
-        ("Searching recipes", search_recipes_by_ingredients),
-        ("Getting details", get_recipe_details_for_ingredient_search)
-    ]
-    
-    results = {}
-    for step_name, step_func in steps:
-        logfire.info(f"Running: {step_name}")
-        result = await step_func(ctx)
-        results[step_name] = result
-        
-        # stop if step failed
-        if "No" in result or "error" in result.lower():
-            break
-    
-    return results
\ No newline at end of file
+image_pipeline = Pipeline(
+    "fridge",
+    [
+        Step(
+            "analyze_image",
+            analyze_fridge_image,
+            inputs=["image_base64"],
+            output="extracted_ingredients",
+            message=lambda deps: "Analyzing your fridge contents..." if _image_count(deps) <= 1
+                else f"Analyzing your kitchen from {_image_count(deps)} photos...",
+            report=lambda deps, extracted: {
+                "message": f"Found {len(extracted.ingredients)} ingredients",
+                "data": {
+                    "ingredients_count": len(extracted.ingredients),
+                    "ingredients": extracted.ingredients,
+                    "image_count": _image_count(deps)
+                }
+            }
+        ),
+        Step(
+            "format_ingredients",
+            format_ingredients_for_search,
+            inputs=["extracted_ingredients"],
+            output="formatted_ingredients",
+            message="Selecting the best ingredients for recipe search...",
+            report=lambda deps, formatted: {
+                "message": "Ingredients formatted successfully",
+                "summary": {"ingredients_used_for_search": formatted}
+            },
+            error_message="Failed to format ingredients: {error}",
+            # the same fridge contents always format the same way
+            memo_key=lambda deps: tuple(sorted(i.strip().lower() for i in deps.extracted_ingredients.ingredients))
+        ),
+        Step(
+            "search_recipes",
+            search_recipes_by_ingredients,
+            inputs=["formatted_ingredients"],
+            output="ingredient_search_results",
+            message="Searching for recipes you can make...",
+            report=lambda deps, results: {
+                "message": f"Found {len(results)} recipes",
+                "data": {"recipe_count": len(results)}
+            }
+        ),
+        Step(
+            "get_details",
+            get_recipe_details_for_ingredient_search,
+            inputs=["ingredient_search_results"],
+            output="recipe_details",
+            message="Getting detailed recipe information...",
+            report=lambda deps, details: {"message": f"Retrieved details for {len(details)} recipes"},
+            on_error="fallback",
+            fallback=basic_search_results
+        ),
+    ],
+    finish=recipes_found
+)
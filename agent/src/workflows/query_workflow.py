@@ -1,36 +1,83 @@
 import logfire
-from pydantic_ai import RunContext
+from typing import Any, Dict, List
 
 from ..models.deps import Deps
-from ..agents.query_extractor import query_extractor
+from ..agents.query_extractor import extract_search_params
+from ..models.recipe import RecipeDetails, RecipeSearchParams
+from .engine import Pipeline, Step
 
-async def search_recipes_by_query(ctx: RunContext[Deps]) -> str:
-    """Search recipes using complex search for text queries"""
-    if not ctx.deps.user_query:
-        return "No search query provided"
-    
-    # extract parameters from natural language
-    extraction_result = await query_extractor.run(ctx.deps.user_query)
-    search_params = extraction_result.data
-    
+# 1) extract parameters from natural language, unless the router already did
+async def extract_params(deps: Deps) -> RecipeSearchParams:
+    """Extract search parameters from the user's query"""
+    search_params = await extract_search_params(deps.user_query, deps.deadline)
     logfire.info(f"Extracted params: {search_params}")
-    
-    # search recipes
-    recipes = await ctx.deps.spoonacular.complex_search(search_params)
-    ctx.deps.recipe_details = recipes
-    
-    # build response message
-    msg_parts = [f"Found {len(recipes)} recipes matching '{search_params.query}'"]
-    if search_params.cuisine:
-        msg_parts.append(f"cuisine: {search_params.cuisine}")
-    if search_params.intolerances:
-        msg_parts.append(f"avoiding: {search_params.intolerances}")
-    if search_params.maxReadyTime:
-        msg_parts.append(f"ready in {search_params.maxReadyTime} min or less")
-        
+    return search_params
+
+# 2) search recipes
+async def search_recipes_by_query(deps: Deps) -> List[RecipeDetails]:
+    """Search recipes using complex search for text queries"""
+    return await deps.spoonacular.complex_search(deps.search_params, deadline=deps.deadline)
+
+# 3) fetch full details for all recipe IDs to ensure instructions are included
+async def get_recipe_details_for_query_search(deps: Deps) -> List[RecipeDetails]:
+    """Get full details for recipes found by the query"""
+    recipe_ids = [recipe.id for recipe in deps.search_results]
+    if not recipe_ids:
+        return []
+    return await deps.spoonacular.get_recipe_details_bulk(recipe_ids, deadline=deps.deadline)
+
+def recipes_found(deps: Deps) -> Dict[str, Any]:
+    recipe_dicts = [recipe.model_dump() for recipe in deps.recipe_details]
+    return {
+        "type": "complete",
+        "message": f"Found {len(recipe_dicts)} recipes matching '{deps.search_params.query}'",
+        "recipes": recipe_dicts,
+        "summary": {
+            "query": deps.user_query,
+            "total_recipes": len(recipe_dicts)
+        }
+    }
+
+def _describe(params: RecipeSearchParams) -> str:
+    msg_parts = [f"Searching for '{params.query}'"]
+    if params.cuisine:
+        msg_parts.append(f"cuisine: {params.cuisine}")
+    if params.intolerances:
+        msg_parts.append(f"avoiding: {params.intolerances}")
+    if params.maxReadyTime:
+        msg_parts.append(f"ready in {params.maxReadyTime} min or less")
     return " | ".join(msg_parts)
 
-# main workflow function
-async def run_query_workflow(ctx: RunContext[Deps]) -> str:
-    """Execute query workflow"""
-    return await search_recipes_by_query(ctx)
\ No newline at end of file
+query_pipeline = Pipeline(
+    "recipe_search",
+    [
+        Step(
+            "extract_params",
+            extract_params,
+            inputs=["user_query"],
+            output="search_params",
+            message="Understanding your request...",
+            report=lambda deps, params: {"message": _describe(params)}
+        ),
+        Step(
+            "search_recipes",
+            search_recipes_by_query,
+            inputs=["search_params"],
+            output="search_results",
+            message=lambda deps: f"Searching for recipes matching '{deps.search_params.query}'...",
+            report=lambda deps, recipes: {
+                "message": f"Found {len(recipes)} recipes",
+                "data": {"recipe_count": len(recipes)}
+            }
+        ),
+        Step(
+            "get_details",
+            get_recipe_details_for_query_search,
+            inputs=["search_results"],
+            output="recipe_details",
+            message="Getting detailed recipe information...",
+            report=lambda deps, details: {"message": f"Retrieved details for {len(details)} recipes"}
+        ),
+    ],
+    finish=recipes_found
+)
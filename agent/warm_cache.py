@@ -0,0 +1,184 @@
+"""
+Build a recipe snapshot offline so a fresh deploy starts with warm caches.
+
+Runs findByIngredients for each ingredient combination and complexSearch for
+each text query, then fetches details for every recipe found through
+informationBulk in batches of BULK_MAX_IDS ids, all under a request rate
+limit. The result is written to a snapshot file the service loads at startup
+when RECIPE_SNAPSHOT_PATH points at it.
+
+    python warm_cache.py --ingredients combos.txt --queries queries.txt --rate 1
+    python warm_cache.py --logs app.log --top 200 --output recipe_snapshot.json.gz
+
+Combination and query files hold one entry per line. With --logs, the most
+frequent ingredient searches and text queries are mined from the service's
+own log lines. Set SPOONACULAR_BASE_URL (or --base-url) to build against a
+local stand-in such as benchmarks/stub_server.py.
+"""
+import argparse
+import asyncio
+import os
+import re
+import time
+from collections import Counter
+from typing import Iterable, List, Optional, Tuple
+
+import logfire
+
+from src.config import config
+from src.models.recipe import RecipeSearchParams
+from src.services.snapshot import RecipeSnapshot
+from src.services.spoonacular import SpoonacularService
+
+_INGREDIENT_LOG = re.compile(r"recipes with ingredients: (?P<ingredients>.+?)\s*$")
+_QUERY_LOG = re.compile(r"Complex search for '(?P<query>.+?)' found")
+
+class RateLimiter:
+    """ Spaces calls at least 1/rate seconds apart across all tasks """
+    def __init__(self, rate: float):
+        self.interval = 1 / rate if rate > 0 else 0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+def read_lines(path: Optional[str]) -> List[str]:
+    if not path:
+        return []
+    with open(path, encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith("#")]
+
+def mine_logs(paths: Iterable[str], top: int) -> Tuple[List[str], List[str]]:
+    """ Most frequent ingredient combinations and text queries in service logs """
+    ingredients, queries = Counter(), Counter()
+    for path in paths:
+        with open(path, encoding="utf-8", errors="replace") as f:
+            for line in f:
+                if match := _INGREDIENT_LOG.search(line):
+                    ingredients[match["ingredients"]] += 1
+                elif match := _QUERY_LOG.search(line):
+                    queries[match["query"]] += 1
+    return [combo for combo, _ in ingredients.most_common(top)], [query for query, _ in queries.most_common(top)]
+
+async def search_params_for(query: str, extract: bool) -> RecipeSearchParams:
+    # the live service keys complexSearch by extracted params, so warm with the same ones
+    if extract:
+        from src.agents.query_extractor import extract_search_params
+        return await extract_search_params(query)
+    return RecipeSearchParams(query=query)
+
+async def warm(
+    snapshot: RecipeSnapshot,
+    combos: List[str],
+    queries: List[str],
+    rate: float,
+    concurrency: int,
+    number: int,
+    extract: bool
+):
+    service = SpoonacularService(config.SPOONACULAR_API_KEY or "warm-cache")
+    limiter = RateLimiter(rate)
+    semaphore = asyncio.Semaphore(concurrency)
+    failures = 0
+
+    async def limited(call):
+        nonlocal failures
+        async with semaphore:
+            await limiter.wait()
+            try:
+                return await call()
+            except Exception as e:
+                failures += 1
+                logfire.warning(f"Warm-up call failed: {e}")
+                return None
+
+    async def ingredient_search(combo: str):
+        results = await limited(lambda: service.search_by_ingredients(combo, number=number))
+        if results is not None:
+            snapshot.add_ingredient_search(combo, number, 2, results)
+            return [recipe["id"] for recipe in results]
+        return []
+
+    async def complex_search(query: str):
+        nonlocal failures
+        try:
+            # Gemini, not Spoonacular, so outside the rate limit; a failure skips only this query
+            params = await search_params_for(query, extract)
+        except Exception as e:
+            failures += 1
+            logfire.warning(f"Warm-up extraction failed for {query!r}: {e}")
+            return
+        recipes = await limited(lambda: service.complex_search(params))
+        if recipes is not None:
+            # complexSearch already returns full information, so these need no detail fetch
+            snapshot.add_complex_search(params, recipes, query=query)
+
+    try:
+        found = await asyncio.gather(*(ingredient_search(combo) for combo in combos))
+        await asyncio.gather(*(complex_search(query) for query in queries))
+
+        ids = sorted({recipe_id for ids in found for recipe_id in ids} - snapshot.recipes.keys())
+        chunks = [ids[i:i + config.BULK_MAX_IDS] for i in range(0, len(ids), config.BULK_MAX_IDS)]
+        details = await asyncio.gather(*(
+            limited(lambda chunk=chunk: service.get_recipe_details_bulk(chunk)) for chunk in chunks
+        ))
+        for recipes in details:
+            if recipes:
+                snapshot.add_recipes(recipes)
+        return len(chunks), failures
+    finally:
+        await service.aclose()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--ingredients", help="File with one comma-separated ingredient combination per line")
+    parser.add_argument("--queries", help="File with one text recipe query per line")
+    parser.add_argument("--logs", nargs="*", default=[], help="Service log files to mine searches from")
+    parser.add_argument("--top", type=int, default=100, help="Searches of each kind to take from the logs")
+    parser.add_argument("--output", default="recipe_snapshot.json.gz")
+    parser.add_argument("--merge", action="store_true", help="Add to an existing snapshot at --output")
+    parser.add_argument("--rate", type=float, default=1.0, help="Spoonacular requests per second")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--number", type=int, default=20, help="Recipes per ingredient search")
+    parser.add_argument("--no-extract", action="store_true", help="Search text queries as-is instead of extracting params with Gemini")
+    parser.add_argument("--base-url", help="Spoonacular base URL, e.g. a local stand-in")
+    args = parser.parse_args()
+
+    logfire.configure(send_to_logfire=False, console=False)
+    if args.base_url:
+        config.SPOONACULAR_BASE_URL = args.base_url
+
+    combos = read_lines(args.ingredients)
+    queries = read_lines(args.queries)
+    if args.logs:
+        mined_combos, mined_queries = mine_logs(args.logs, args.top)
+        combos += mined_combos
+        queries += mined_queries
+    combos, queries = list(dict.fromkeys(combos)), list(dict.fromkeys(queries))
+    if not combos and not queries:
+        parser.error("nothing to warm: pass --ingredients, --queries or --logs")
+
+    snapshot = RecipeSnapshot()
+    if args.merge and os.path.exists(args.output):
+        snapshot.load(args.output)
+
+    started = time.perf_counter()
+    extract = not args.no_extract and bool(config.GEMINI_API_KEY)
+    bulk_calls, failures = asyncio.run(
+        warm(snapshot, combos, queries, args.rate, args.concurrency, args.number, extract)
+    )
+    snapshot.save(args.output)
+    print(
+        f"Warmed {len(combos)} ingredient searches and {len(queries)} queries: "
+        f"{len(snapshot)} recipes via {bulk_calls} informationBulk calls, {failures} failed calls, "
+        f"{time.perf_counter() - started:.1f}s -> {args.output}"
+    )
+
+if __name__ == "__main__":
+    main()
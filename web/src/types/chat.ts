@@ -1,7 +1,7 @@
 import { Recipe } from "@/types/recipe";
 
 export interface StreamData {
-  type: "step" | "complete" | "error";
+  type: "queued" | "step" | "complete" | "error";
   step?: string;
   status?: string;
   message?: string;